@@ -0,0 +1,103 @@
+"""
+Benchmark API throughput end to end, offline and reproducibly.
+
+Market data comes from the fixture provider (recorded responses plus
+deterministic synthetic data), the database is a throwaway test database,
+and requests go through the full Django/DRF stack via the test client:
+
+    python benchmarks/bench_api.py --positions 50 --requests 200
+    python benchmarks/bench_api.py --cold   # clear the cache before every request
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio_api.settings')
+os.environ.setdefault('MARKET_DATA_PROVIDER', 'fixture')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from portfolios.models import Portfolio, Position, Stock  # noqa: E402
+
+
+def create_portfolio(num_positions):
+    user = User.objects.create_user('bench', password='bench-pass-123')
+    portfolio = Portfolio.objects.create(name='Benchmark', user=user)
+    stocks = Stock.objects.bulk_create([
+        Stock(symbol=f'SYM{i:03d}', name=f'SYM{i:03d}', current_price=Decimal('100'))
+        for i in range(num_positions)
+    ])
+    Position.objects.bulk_create([
+        Position(portfolio=portfolio, stock=stock, quantity=Decimal(10 + i),
+                 purchase_price=Decimal('90'), purchase_date=date(2024, 1, 2))
+        for i, stock in enumerate(stocks)
+    ])
+    return user, portfolio
+
+
+def measure(client, method, url, requests, cold):
+    latencies = []
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        started = time.perf_counter()
+        response = getattr(client, method)(url)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise SystemExit(f'{method.upper()} {url} returned {response.status_code}')
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--positions', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--cold', action='store_true', help='clear the cache before every request')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user, portfolio = create_portfolio(args.positions)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        endpoints = [
+            ('get', '/api/portfolios/'),
+            ('get', f'/api/portfolios/{portfolio.id}/'),
+            ('get', f'/api/portfolios/{portfolio.id}/performance/?period=1y'),
+            ('get', f'/api/portfolios/{portfolio.id}/news/'),
+            ('get', '/api/market-movers/'),
+            ('get', f'/api/portfolios/{portfolio.id}/refresh_prices/'),
+        ]
+
+        print(f'provider={settings.MARKET_DATA_PROVIDER} positions={args.positions} '
+              f'requests={args.requests} cold={args.cold}')
+        print(f'{"endpoint":58} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8}')
+        for method, url in endpoints:
+            # The first request warms the price store and the cache
+            measure(client, method, url, 1, cold=False)
+            latencies = sorted(measure(client, method, url, args.requests, args.cold))
+            p50 = statistics.median(latencies) * 1000
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+            print(f'{method.upper() + " " + url:58} {len(latencies) / sum(latencies):8.1f} {p50:8.2f} {p95:8.2f}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
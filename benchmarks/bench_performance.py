@@ -0,0 +1,119 @@
+"""
+Benchmark the portfolio_performance engine against the original per-date loop.
+
+Runs entirely on synthetic price data, no network or database required:
+
+    python benchmarks/bench_performance.py --positions 30 --days 1260
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from portfolios.performance import PerformanceEngine  # noqa: E402
+
+
+def make_histories(num_symbols, num_days, seed=42):
+    """Random-walk close prices, with a few symbols missing some trading days"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2025-01-31', periods=num_days, tz='America/New_York')
+    histories = {}
+    for i in range(num_symbols):
+        returns = rng.normal(0.0005, 0.02, num_days)
+        closes = 100 * np.exp(np.cumsum(returns))
+        hist = pd.DataFrame({'Close': closes}, index=dates)
+        if i % 5 == 4:
+            hist = hist.drop(hist.index[rng.choice(num_days, num_days // 20, replace=False)])
+        histories[f'SYM{i:03d}'] = hist
+    return histories
+
+
+class CountingFetcher:
+    """Stand-in for yf.Ticker(symbol).history(period=period) that counts calls"""
+
+    def __init__(self, histories):
+        self.histories = histories
+        self.calls = 0
+
+    def __call__(self, symbol, period):
+        self.calls += 1
+        return self.histories[symbol]
+
+
+def legacy_portfolio_values(holdings, period, fetch_history, fallback_value=0):
+    """The original loop: one history fetch per position per date"""
+    sample_hist = fetch_history(holdings[0][0], period)
+    dates = sample_hist.index.tolist()
+    portfolio_values = []
+
+    for date in dates:
+        total_value = 0
+        valid_data = True
+
+        for symbol, quantity in holdings:
+            quantity = float(quantity)
+            try:
+                hist = fetch_history(symbol, period)
+                if date in hist.index:
+                    total_value += float(hist.loc[date]['Close']) * quantity
+                else:
+                    available_dates = hist.index[hist.index <= date]
+                    if len(available_dates) > 0:
+                        total_value += float(hist.loc[available_dates[-1]]['Close']) * quantity
+                    else:
+                        valid_data = False
+                        break
+            except Exception:
+                valid_data = False
+                break
+
+        if valid_data:
+            portfolio_values.append(total_value)
+        elif portfolio_values:
+            portfolio_values.append(portfolio_values[-1])
+        else:
+            portfolio_values.append(float(fallback_value))
+
+    return portfolio_values
+
+
+def timed(func):
+    started = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--positions', type=int, default=30)
+    parser.add_argument('--days', type=int, default=252, help='trading days of history')
+    args = parser.parse_args()
+
+    histories = make_histories(args.positions, args.days)
+    holdings = [(symbol, 10 + i) for i, symbol in enumerate(histories)]
+
+    legacy_fetch = CountingFetcher(histories)
+    legacy_values, legacy_seconds = timed(
+        lambda: legacy_portfolio_values(holdings, 'bench', legacy_fetch)
+    )
+
+    engine_fetch = CountingFetcher(histories)
+    engine = PerformanceEngine(engine_fetch)
+    result, engine_seconds = timed(lambda: engine.compute(holdings, 'bench'))
+
+    max_diff = float(np.max(np.abs(np.array(legacy_values) - np.array(result['values']))))
+
+    print(f'positions={args.positions} dates={len(result["dates"])}')
+    print(f'legacy loop : {legacy_seconds * 1000:10.1f} ms  {legacy_fetch.calls:7d} history fetches')
+    print(f'engine      : {engine_seconds * 1000:10.1f} ms  {engine_fetch.calls:7d} history fetches')
+    print(f'speedup     : {legacy_seconds / engine_seconds:10.1f}x')
+    print(f'max |diff|  : {max_diff:.6f}')
+
+
+if __name__ == '__main__':
+    main()
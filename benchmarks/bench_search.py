@@ -0,0 +1,67 @@
+"""
+Benchmark the in-memory stock search index used on SQLite.
+
+Builds the index from synthetic symbols and names, no database required:
+
+    python benchmarks/bench_search.py --symbols 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio_api.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from portfolios.stock_search import PrefixIndex  # noqa: E402
+
+NAME_WORDS = [
+    'Apple', 'Global', 'Holdings', 'Energy', 'Capital', 'Systems', 'Pharma', 'Bancorp',
+    'Digital', 'Resources', 'Therapeutics', 'Industries', 'Software', 'Mining', 'Realty',
+]
+SUFFIXES = ['Inc.', 'Corp', 'Ltd', 'Group', 'Trust', 'PLC']
+
+
+def make_rows(num_symbols, seed=42):
+    rng = random.Random(seed)
+    symbols = set()
+    while len(symbols) < num_symbols:
+        symbols.add(''.join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5))))
+    return [
+        (i, symbol, f'{" ".join(rng.sample(NAME_WORDS, 2))} {rng.choice(SUFFIXES)}')
+        for i, symbol in enumerate(sorted(symbols))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.symbols)
+    started = time.perf_counter()
+    index = PrefixIndex(rows)
+    build_seconds = time.perf_counter() - started
+
+    queries = ['A', 'AB', 'XYZ', 'QQQQ', 'apple', 'global hold', 'therap', 'zzzz']
+    print(f'symbols={args.symbols} build={build_seconds * 1000:.0f} ms')
+    print(f'{"query":14} {"results":>8} {"p50 ms":>8} {"max ms":>8}')
+    for query in queries:
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            results = index.search(query, args.limit)
+            timings.append(time.perf_counter() - started)
+        print(f'{query:14} {len(results):8d} {statistics.median(timings) * 1000:8.3f} {max(timings) * 1000:8.3f}')
+
+
+if __name__ == '__main__':
+    main()
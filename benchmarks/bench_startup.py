@@ -0,0 +1,114 @@
+"""
+Benchmark the cold start of an API worker: import time and resident memory.
+
+Each run starts a fresh interpreter with `python -X importtime`, sets up
+Django and loads the ASGI application and URLconf the way a uvicorn worker
+does, then reports wall time, resident memory and the packages that cost the most:
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --with-market-data   # what a market data request adds
+    python benchmarks/bench_startup.py --max-ms 1500 --max-mb 120   # fail on regressions
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['yfinance', 'pandas', 'numpy']
+
+PROBE = '''
+import json, os, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfolio_api.settings')
+from portfolio_api.asgi import application
+import portfolio_api.urls
+if {with_market_data}:
+    from portfolios.market_data import pd, yf
+    yf.Ticker, pd.DataFrame
+
+rss_kb = 0
+try:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss_kb //= 1024
+
+print(json.dumps({{
+    'rss_kb': rss_kb,
+    'loaded': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """Import self time per top-level package as (microseconds, package), slowest first"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    return sorted(((us, package) for package, us in totals.items()), reverse=True)
+
+
+def run_once(with_market_data):
+    probe = PROBE.format(with_market_data=with_market_data, heavy=HEAVY_MODULES)
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', probe],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    seconds = time.perf_counter() - started
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['seconds'] = seconds
+    result['imports'] = parse_importtime(completed.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest packages to list')
+    parser.add_argument('--with-market-data', action='store_true',
+                        help='also load yfinance and pandas, as the first market data request does')
+    parser.add_argument('--max-ms', type=float, help='fail if the median cold start exceeds this')
+    parser.add_argument('--max-mb', type=float, help='fail if the median resident memory exceeds this')
+    args = parser.parse_args()
+
+    # The first run warms the OS file cache and the bytecode cache
+    run_once(args.with_market_data)
+    runs = [run_once(args.with_market_data) for _ in range(args.runs)]
+
+    start_ms = statistics.median(run['seconds'] for run in runs) * 1000
+    rss_mb = statistics.median(run['rss_kb'] for run in runs) / 1024
+
+    print(f'runs={args.runs} with_market_data={args.with_market_data}')
+    print(f'cold start  : {start_ms:10.1f} ms (median)')
+    print(f'resident    : {rss_mb:10.1f} MB (median)')
+    print(f'heavy loaded: {", ".join(runs[0]["loaded"]) or "none"}')
+    print('slowest packages (import self time):')
+    for us, package in runs[0]['imports'][:args.top]:
+        print(f'  {us / 1000:10.1f} ms  {package}')
+
+    failures = []
+    if args.max_ms is not None and start_ms > args.max_ms:
+        failures.append(f'cold start {start_ms:.1f} ms exceeds {args.max_ms} ms')
+    if args.max_mb is not None and rss_mb > args.max_mb:
+        failures.append(f'resident memory {rss_mb:.1f} MB exceeds {args.max_mb} MB')
+    if failures:
+        print('FAIL: ' + '; '.join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -161,9 +161,32 @@ class ApiService {
   // Stock analysis endpoints
   async refreshStockAnalysis() {
     const response = await this.api.post('/api/refresh-stock-analysis/');
+    const job = await this.waitForJob(response.data.job_id);
+    return job.result;
+  }
+
+  // Background job endpoints
+  async getJobStatus(jobId) {
+    const response = await this.api.get(`/api/jobs/${jobId}/`);
     return response.data;
   }
 
+  // Jobs stuck without progress are failed by the server; maxAttempts is the
+  // client's own upper bound in case it never hears back
+  async waitForJob(jobId, intervalMs = 1000, maxAttempts = 900) {
+    for (let attempt = 1; attempt <= maxAttempts; attempt++) {
+      const job = await this.getJobStatus(jobId);
+      if (job.status === 'completed') {
+        return job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Background job failed');
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+    throw new Error('Timed out waiting for the background job to finish');
+  }
+
   // CSV Import endpoints
   async importPortfolioCSV(portfolioId, csvFile) {
     const formData = new FormData();
@@ -174,7 +197,29 @@ class ApiService {
         'Content-Type': 'multipart/form-data',
       },
     });
-    return response.data;
+    // Parsing runs in the background, poll until the preview is ready
+    const importStatus = await this.waitForImportPreview(response.data.import_id);
+    return { import_id: importStatus.id, preview: importStatus.preview };
+  }
+
+  async waitForImportPreview(importId, intervalMs = 1000, maxAttempts = 900) {
+    for (let attempt = 1; attempt <= maxAttempts; attempt++) {
+      const importStatus = await this.getImportStatus(importId);
+      if (importStatus.status === 'preview') {
+        return importStatus;
+      }
+      if (importStatus.status === 'failed') {
+        const message = importStatus.errors?.[0]?.message || 'Failed to parse CSV file';
+        const error = new Error(message);
+        error.response = { data: { error: message } };
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+    const message = 'Timed out waiting for the CSV file to be parsed';
+    const error = new Error(message);
+    error.response = { data: { error: message } };
+    throw error;
   }
 
   async confirmCSVImport(importId) {
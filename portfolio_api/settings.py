@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,12 +78,101 @@ WSGI_APPLICATION = 'portfolio_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres selects the production profile, configured by the POSTGRES_*
+# variables. With POSTGRES_POOL=true connections come from psycopg's pool;
+# otherwise each worker keeps its connection open for POSTGRES_CONN_MAX_AGE
+# seconds instead of reconnecting on every request.
+# The default SQLite profile is for development: WAL lets reads proceed
+# during a write, and writers wait for the lock instead of failing.
+
+if os.environ.get('DB_ENGINE') == 'postgres':
+    POSTGRES_POOL = os.environ.get('POSTGRES_POOL', 'false').lower() == 'true'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'portfolio_api'),
+            'USER': os.environ.get('POSTGRES_USER', 'portfolio_api'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Persistent connections and the pool are mutually exclusive
+            'CONN_MAX_AGE': 0 if POSTGRES_POOL else int(os.environ.get('POSTGRES_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', '10')),
+                    'timeout': 10,
+                } if POSTGRES_POOL else False,
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                # Take the write lock up front so concurrent writers queue on the busy timeout
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+
+# Cache
+# REDIS_URL shares the cache (quotes, snapshots, locks, stats) between every
+# worker and node. On a single node CACHE_DIR gives the workers a shared
+# file-based cache instead. Without either, each process keeps its own
+# in-memory cache (development and tests).
+#
+# The 'coordination' cache holds locks (movers refresh, single-flight),
+# rate limit tokens and circuit breaker state, which rely on cache.add and
+# cache.incr being atomic across workers. Redis is; the file-based cache is
+# not, so with CACHE_DIR they are kept per process instead: each worker then
+# refreshes, coalesces fetches, rate-limits and trips its breaker on its own.
+# Run with REDIS_URL to coordinate them across workers.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'portfolio_api',
+        }
+    }
+    CACHES['coordination'] = CACHES['default']
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+        'coordination': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'portfolio-api-coordination',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'portfolio-api',
+        }
+    }
+    # Same LOCATION, so the same per-process store
+    CACHES['coordination'] = CACHES['default']
+
+# Lifetime of cached portfolio responses; both are also invalidated whenever
+# the portfolio or its positions change, so these only bound upstream staleness
+PORTFOLIO_NEWS_CACHE_SECONDS = 1800
+PORTFOLIO_PERFORMANCE_CACHE_SECONDS = 86400
+
+# How often each process adds its cache hit/miss counters to the shared totals
+CACHE_STATS_FLUSH_SECONDS = 10
 
 
 # Password validation
@@ -170,3 +260,87 @@ CORS_ALLOW_METHODS = [
     'POST',
     'PUT',
 ]
+
+# Market data settings
+# Maximum number of concurrent upstream quote fetches per refresh
+QUOTE_ENGINE_MAX_WORKERS = 8
+
+# Days of daily bars downloaded the first time a symbol enters the price store
+PRICE_HISTORY_BACKFILL_DAYS = 1825
+# How long a symbol's stored history is trusted before asking upstream for new bars
+PRICE_HISTORY_REFRESH_SECONDS = 900
+
+# Ticker universe scanned for the market movers widget
+MARKET_MOVERS_TICKERS = [
+    'AAPL', 'GOOGL', 'MSFT', 'TSLA', 'AMZN', 'NVDA', 'META', 'JPM', 'JNJ', 'V',
+    'WMT', 'PG', 'UNH', 'DIS', 'HD', 'PYPL', 'ADBE', 'NFLX', 'CRM', 'INTC',
+    'AMD', 'CSCO', 'PFE', 'KO', 'PEP', 'TMO', 'ABBV', 'ACN', 'NKE', 'MRK',
+    'LLY', 'AVGO', 'TXN', 'QCOM', 'COST', 'HON', 'UPS', 'IBM', 'GS', 'BA',
+    'PLTR'
+]
+# Snapshot age after which a background refresh is started
+MARKET_MOVERS_FRESH_SECONDS = 900
+# How long a stale snapshot may still be served while it is being refreshed
+MARKET_MOVERS_STALE_SECONDS = 86400
+# Upper bound on a single refresh; the lock expires after this in case a worker dies
+MARKET_MOVERS_LOCK_SECONDS = 120
+
+# Background jobs (CSV parsing, analysis refreshes) run on an in-process thread pool
+BACKGROUND_JOB_WORKERS = 2
+# Run background jobs inline instead, e.g. for tests
+BACKGROUND_JOBS_EAGER = False
+# A queued or running job not updated for this long is reported failed; it
+# was lost with its worker, as the pool doesn't survive a restart
+BACKGROUND_JOB_STALE_SECONDS = 600
+
+# Where quotes, history, news and options come from: 'yfinance' (Yahoo Finance),
+# 'fixture' (offline replay of MARKET_DATA_FIXTURE_PATH, deterministic synthetic
+# data for anything not recorded), 'record' (Yahoo, saving every response to
+# the fixture) or the dotted path of a MarketDataProvider subclass
+MARKET_DATA_PROVIDER = os.environ.get('MARKET_DATA_PROVIDER', 'yfinance')
+MARKET_DATA_FIXTURE_PATH = os.environ.get(
+    'MARKET_DATA_FIXTURE_PATH', BASE_DIR / 'benchmarks' / 'fixtures' / 'market_data.json'
+)
+# Upstream fetches one async view may have in flight at a time
+MARKET_DATA_CONCURRENCY = 16
+# Threads per process running those blocking fetches for all async views;
+# this, not the number of requests, bounds a worker's in-flight fetches
+MARKET_DATA_THREADS = 64
+
+# Yahoo Finance calls across all workers: at most this many per second (a
+# call waits up to MAX_WAIT for a token, 0 disables the limit), and after
+# BREAKER_FAILURES consecutive failures calls fail fast for the cooldown,
+# after which a single probe call decides whether to resume
+MARKET_DATA_RATE_LIMIT_PER_SECOND = 10
+MARKET_DATA_RATE_LIMIT_MAX_WAIT_SECONDS = 2
+MARKET_DATA_BREAKER_FAILURES = 5
+MARKET_DATA_BREAKER_COOLDOWN_SECONDS = 30
+
+# Symbol lookups (search_yahoo) are served from the Stock table and an
+# in-process LRU while the stored quote is younger than the freshness window;
+# symbols the provider doesn't know are remembered so typos don't go upstream
+SYMBOL_FRESHNESS_SECONDS = 300
+SYMBOL_NEGATIVE_CACHE_SECONDS = 3600
+SYMBOL_LRU_SIZE = 2048
+
+# CSV import previews resolve symbols from the Stock table first and look the
+# rest up upstream on this many threads; symbols not answered within the
+# budget (seconds per import) are marked unverified instead of blocking
+CSV_VALIDATION_MAX_WORKERS = 8
+CSV_VALIDATION_TIME_BUDGET_SECONDS = 30
+
+# Largest list of buy/sell orders accepted by /api/portfolios/{id}/orders/
+ORDER_BATCH_MAX_SIZE = 1000
+
+# Concurrent fetches of the same ticker resource share one upstream call; a
+# worker waits at most this long for another worker's call before making its own
+SINGLE_FLIGHT_LOCK_SECONDS = 10
+
+# Cache lifetime in seconds of each upstream resource fetched per ticker
+TICKER_SNAPSHOT_TTLS = {
+    'info': 30,
+    'recommendations': 6 * 3600,
+    'target_price': 6 * 3600,
+    'options': 15 * 60,
+    'option_chain': 15 * 60,
+}
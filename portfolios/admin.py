@@ -9,6 +9,9 @@ class PortfolioAdmin(admin.ModelAdmin):
     search_fields = ['name', 'user__username']
     readonly_fields = ['created_at', 'updated_at', 'total_value', 'total_cost', 'total_gain_loss']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
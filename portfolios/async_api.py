@@ -0,0 +1,133 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.views import APIView
+from .upstream import UpstreamUnavailable
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, so under an ASGI server a request
+    waiting on upstream market data holds no worker thread.
+
+    Authentication, permission and throttle checks may hit the database and
+    still run synchronously, on the request's thread.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def async_api_view(http_method_names):
+    """
+    api_view for coroutine functions. Works with the permission_classes
+    decorator the same way api_view does.
+    """
+
+    def decorator(func):
+        methods = [method.lower() for method in http_method_names]
+        attrs = {
+            'http_method_names': methods + ['options'],
+            '__doc__': func.__doc__,
+            '__module__': func.__module__,
+        }
+
+        async def handler(self, *args, **kwargs):
+            return await func(*args, **kwargs)
+
+        for method in methods:
+            attrs[method] = handler
+
+        for name in ('permission_classes', 'authentication_classes', 'throttle_classes'):
+            if hasattr(func, name):
+                attrs[name] = getattr(func, name)
+
+        view = type(func.__name__, (AsyncAPIView,), attrs)
+        return view.as_view()
+
+    return decorator
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # The loop's default executor has only min(32, cpus + 4) threads, shared
+    # with sync_to_async and everything else, which would cap the fan-out
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MARKET_DATA_THREADS', 64),
+                thread_name_prefix='market-data'
+            )
+        return _executor
+
+
+async def gather_limited(func, items, limit=None):
+    """
+    Call blocking func(item) for every item with asyncio.gather, at most
+    limit (MARKET_DATA_CONCURRENCY) at a time, on the process's market data
+    thread pool (MARKET_DATA_THREADS, shared by all requests).
+    Results come back in item order, exceptions in place of their results.
+    """
+    semaphore = asyncio.Semaphore(limit or getattr(settings, 'MARKET_DATA_CONCURRENCY', 16))
+    loop = asyncio.get_running_loop()
+
+    async def run(item):
+        async with semaphore:
+            # Context is carried over as asyncio.to_thread does
+            call = functools.partial(contextvars.copy_context().run, func, item)
+            return await loop.run_in_executor(_get_executor(), call)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+
+async def fetch_each(method, symbols, limit=None):
+    """
+    Call a batched MarketDataProvider method for one symbol at a time,
+    concurrently, and merge the results into {symbol: value}. Symbols whose
+    fetch failed are left out, as the batched methods do.
+    """
+    symbols = list(symbols)
+    results = await gather_limited(lambda symbol: method([symbol]), symbols, limit)
+
+    merged = {}
+    unavailable = 0
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, UpstreamUnavailable):
+            unavailable += 1
+        elif isinstance(result, Exception):
+            print(f"Failed to fetch market data for {symbol}: {result}")
+        else:
+            merged.update(result)
+    if unavailable:
+        print(f"Market data unavailable for {unavailable} of {len(symbols)} symbols")
+    return merged
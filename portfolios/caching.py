@@ -0,0 +1,201 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+
+
+# Locks and counters that need atomic add/incr across workers; per process
+# when the shared cache can't provide that (see CACHES in settings)
+coordination = ConnectionProxy(caches, 'coordination')
+
+STATS_FAMILIES_KEY = 'cache_stats:families'
+STATS_COUNTERS = ['hits', 'misses', 'sets', 'latency_us']
+
+
+class CacheNamespace:
+    """
+    A family of related cache keys, e.g. 'portfolio_news'.
+
+    Keys are prefixed with the family name and a version number, so the
+    whole family (or one scope inside it, e.g. one portfolio) can be
+    invalidated by bumping the version instead of deleting keys one by one.
+    Every lookup is counted in the family's hit/miss/latency stats.
+    The default timeout may be given as a setting name, read on first use
+    so that importing this module doesn't need configured settings.
+    """
+
+    def __init__(self, name, timeout=None, timeout_setting=None):
+        self.name = name
+        self._timeout = timeout
+        self._timeout_setting = timeout_setting
+
+    @property
+    def timeout(self):
+        if self._timeout_setting is None:
+            return self._timeout
+        return getattr(settings, self._timeout_setting, self._timeout)
+
+    def get(self, key, scope=None, default=None):
+        started = time.perf_counter()
+        value = cache.get(self._versioned_key(key, scope))
+        stats.record(self.name, hit=value is not None, seconds=time.perf_counter() - started)
+        return default if value is None else value
+
+    def get_many(self, keys, scope=None):
+        """Look up several keys in one round trip, returns {key: value} for hits"""
+        started = time.perf_counter()
+        versioned = {self._versioned_key(key, scope, versions): key
+                     for versions in [self._versions(scope)] for key in keys}
+        found = cache.get_many(list(versioned))
+        elapsed = (time.perf_counter() - started) / max(len(keys), 1)
+        for versioned_key in versioned:
+            stats.record(self.name, hit=versioned_key in found, seconds=elapsed)
+        return {versioned[versioned_key]: value for versioned_key, value in found.items()}
+
+    def set(self, key, value, scope=None, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        cache.set(self._versioned_key(key, scope), value, timeout)
+        stats.record_set(self.name)
+
+    def delete(self, key, scope=None):
+        cache.delete(self._versioned_key(key, scope))
+
+    def invalidate(self, scope=None):
+        """Make every key of the family (or of one scope) unreachable"""
+        # Versions stay in the shared cache: on a backend without atomic incr
+        # two racing bumps may only count once, but either still moves the
+        # version past the one readers had
+        version_key = self._version_key(scope)
+        if not cache.add(version_key, 2, None):
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                cache.set(version_key, 2, None)
+
+    def _version_key(self, scope=None):
+        if scope is None:
+            return f'{self.name}:version'
+        return f'{self.name}:{scope}:version'
+
+    def _versions(self, scope=None):
+        version_keys = [self._version_key()]
+        if scope is not None:
+            version_keys.append(self._version_key(scope))
+        found = cache.get_many(version_keys)
+        return [found.get(version_key, 1) for version_key in version_keys]
+
+    def _versioned_key(self, key, scope=None, versions=None):
+        versions = versions or self._versions(scope)
+        parts = [self.name, f'v{versions[0]}']
+        if scope is not None:
+            parts += [str(scope), f'v{versions[1]}']
+        return ':'.join(parts + [str(key)])
+
+
+class CacheStats:
+    """
+    Per-family hit/miss/latency counters.
+
+    Counters are kept in process memory and periodically added to shared
+    counters in the cache, so the totals cover every worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, family, hit, seconds):
+        with self._lock:
+            counters = self._counters(family)
+            counters['hits' if hit else 'misses'] += 1
+            counters['latency_us'] += int(seconds * 1_000_000)
+        self._maybe_flush()
+
+    def record_set(self, family):
+        with self._lock:
+            self._counters(family)['sets'] += 1
+        self._maybe_flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return
+
+        families = set(cache.get(STATS_FAMILIES_KEY) or [])
+        if not families.issuperset(pending):
+            cache.set(STATS_FAMILIES_KEY, sorted(families | set(pending)), None)
+
+        for family, counters in pending.items():
+            for counter, value in counters.items():
+                if not value:
+                    continue
+                key = f'cache_stats:{family}:{counter}'
+                if not cache.add(key, value, None):
+                    try:
+                        cache.incr(key, value)
+                    except ValueError:
+                        cache.set(key, value, None)
+
+    def snapshot(self):
+        """Totals per family across all workers"""
+        self.flush()
+        families = cache.get(STATS_FAMILIES_KEY) or []
+        keys = [f'cache_stats:{family}:{counter}' for family in families for counter in STATS_COUNTERS]
+        values = cache.get_many(keys)
+
+        result = {}
+        for family in families:
+            counters = {
+                counter: values.get(f'cache_stats:{family}:{counter}', 0)
+                for counter in STATS_COUNTERS
+            }
+            lookups = counters['hits'] + counters['misses']
+            result[family] = {
+                'hits': counters['hits'],
+                'misses': counters['misses'],
+                'sets': counters['sets'],
+                'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None,
+                'avg_latency_ms': round(counters['latency_us'] / lookups / 1000, 3) if lookups else None,
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+        families = cache.get(STATS_FAMILIES_KEY) or []
+        cache.delete_many([
+            f'cache_stats:{family}:{counter}' for family in families for counter in STATS_COUNTERS
+        ] + [STATS_FAMILIES_KEY])
+
+    def _counters(self, family):
+        if family not in self._pending:
+            self._pending[family] = dict.fromkeys(STATS_COUNTERS, 0)
+        return self._pending[family]
+
+    def _maybe_flush(self):
+        interval = getattr(settings, 'CACHE_STATS_FLUSH_SECONDS', 10)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+
+stats = CacheStats()
+
+
+# Responses derived from a portfolio's positions, scoped by portfolio id
+news_cache = CacheNamespace(
+    'portfolio_news', timeout=1800, timeout_setting='PORTFOLIO_NEWS_CACHE_SECONDS'
+)
+performance_cache = CacheNamespace(
+    'portfolio_performance', timeout=86400, timeout_setting='PORTFOLIO_PERFORMANCE_CACHE_SECONDS'
+)
+
+
+def invalidate_portfolio(portfolio_id):
+    """Drop every cached response derived from one portfolio's holdings"""
+    news_cache.invalidate(scope=portfolio_id)
+    performance_cache.invalidate(scope=portfolio_id)
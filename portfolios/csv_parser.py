@@ -1,11 +1,23 @@
 import csv
 import io
 import re
-import yfinance as yf
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .models import Stock, PortfolioImport
+from . import stock_search, symbols
+from .market_data import get_provider
+from .ticker_snapshot import TickerSnapshot
+from .trades import MAX_AMOUNT, TradeError, _lock_cash, after_bulk_write, merge_lot, record_holdings
+from .upstream import UpstreamUnavailable
+from .models import Stock, PortfolioImport, PortfolioImportRow
+
+
+class ImportNotInPreview(ValueError):
+    """The import was already confirmed, or is no longer waiting for confirmation"""
 
 
 class CSVPortfolioParser:
@@ -29,35 +41,53 @@ class CSVPortfolioParser:
         'notes': ['Notes', 'NOTES', 'notes', 'Comments', 'Description']
     }
     
-    def __init__(self, csv_content, filename, portfolio_import):
-        self.csv_content = csv_content
+    # Rows processed and written to the database per batch
+    CHUNK_SIZE = 500
+    
+    # Rows kept in memory for the preview response
+    PREVIEW_SAMPLE_SIZE = 10
+    
+    def __init__(self, csv_file, filename, portfolio_import):
+        # csv_file may be an uploaded (binary) file, a text stream or a string
+        self.csv_file = csv_file
         self.filename = filename
         self.portfolio_import = portfolio_import
         self.errors = []
-        self.valid_rows = []
+        self.sample_rows = []
         self.column_mapping = {}
         self.total_rows = 0
+        self.valid_count = 0
+        self.error_count = 0
+        # Validation result per symbol, so each symbol is only checked once
+        self.symbol_results = {}
+        self.unverified_count = 0
+        # Symbols not checked upstream by then are left unverified
+        self.deadline = None
         
     def parse_and_validate(self):
         """
-        Main method to parse and validate CSV content
-        Returns: dict with parsed data, errors, and statistics
+        Main method to parse and validate CSV content.
+        Rows are streamed from the file and processed in chunks of CHUNK_SIZE,
+        each chunk is stored as PortfolioImportRow records.
+        Returns: dict with sample data, errors, and statistics
         """
+        self.deadline = time.monotonic() + getattr(settings, 'CSV_VALIDATION_TIME_BUDGET_SECONDS', 30)
         try:
             # Detect CSV format and parse
-            csv_data = self._parse_csv()
-            if not csv_data:
+            csv_reader = self._parse_csv()
+            if csv_reader is None:
+                return self._create_result(success=False, error="Failed to parse CSV file")
+            
+            header_row = next(csv_reader, None)
+            if not header_row:
                 return self._create_result(success=False, error="Failed to parse CSV file")
             
             # Detect and map columns
-            if not self._detect_column_mapping(csv_data[0]):
+            if not self._detect_column_mapping(header_row):
                 return self._create_result(success=False, error="Required columns not found")
             
-            # Process each row
-            self._process_rows(csv_data[1:])  # Skip header row
-            
-            # Validate stock symbols in batch
-            self._validate_stock_symbols()
+            # Process rows chunk by chunk
+            self._process_rows(csv_reader)
             
             # Update import record
             self._update_import_record()
@@ -73,10 +103,13 @@ class CSVPortfolioParser:
             return self._create_result(success=False, error=str(e))
     
     def _parse_csv(self):
-        """Parse CSV content with different delimiter detection"""
+        """Open a streaming CSV reader with delimiter detection"""
         try:
+            stream = self._open_text_stream()
+            
             # Try to detect delimiter
-            sample = self.csv_content[:1024]
+            sample = stream.read(1024)
+            stream.seek(0)
             sniffer = csv.Sniffer()
             
             try:
@@ -84,9 +117,7 @@ class CSVPortfolioParser:
             except:
                 delimiter = ','  # Default to comma
             
-            # Parse CSV
-            csv_reader = csv.reader(io.StringIO(self.csv_content), delimiter=delimiter)
-            return list(csv_reader)
+            return csv.reader(stream, delimiter=delimiter)
             
         except Exception as e:
             self.errors.append({
@@ -96,6 +127,19 @@ class CSVPortfolioParser:
             })
             return None
     
+    def _open_text_stream(self):
+        """Wrap the source so it can be read incrementally as text"""
+        if isinstance(self.csv_file, str):
+            return io.StringIO(self.csv_file)
+        
+        self.csv_file.seek(0)
+        if isinstance(self.csv_file, io.TextIOBase):
+            return self.csv_file
+        
+        # Uploaded files are binary, decode them on the fly
+        raw = getattr(self.csv_file, 'file', self.csv_file)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    
     def _detect_column_mapping(self, header_row):
         """Detect and map CSV columns to our data model"""
         header_lower = [col.strip().lower() for col in header_row]
@@ -120,16 +164,54 @@ class CSVPortfolioParser:
         return True
     
     def _process_rows(self, data_rows):
-        """Process each data row and validate"""
-        self.total_rows = len(data_rows)
+        """Process each data row in chunks, validating and storing each chunk"""
+        chunk = []
         
         for i, row in enumerate(data_rows, start=2):  # Start at 2 to account for header
+            self.total_rows += 1
             if len(row) == 0 or all(cell.strip() == '' for cell in row):
                 continue  # Skip empty rows
                 
             processed_row = self._process_single_row(row, i)
             if processed_row:
-                self.valid_rows.append(processed_row)
+                chunk.append(processed_row)
+            
+            if len(chunk) >= self.CHUNK_SIZE:
+                self._flush_chunk(chunk)
+                chunk = []
+        
+        if chunk:
+            self._flush_chunk(chunk)
+    
+    def _flush_chunk(self, rows):
+        """Validate a chunk of rows and write them to the import row table"""
+        self._validate_stock_symbols(rows)
+        
+        import_rows = []
+        for row in rows:
+            has_errors = bool(row.get('errors'))
+            if has_errors:
+                self.error_count += 1
+            else:
+                self.valid_count += 1
+            
+            if len(self.sample_rows) < self.PREVIEW_SAMPLE_SIZE:
+                self.sample_rows.append(row)
+            
+            import_rows.append(PortfolioImportRow(
+                portfolio_import=self.portfolio_import,
+                row_number=row['row_number'],
+                data=row,
+                has_errors=has_errors
+            ))
+        
+        PortfolioImportRow.objects.bulk_create(import_rows)
+        
+        # Progress counter for get_import_status polls
+        self.portfolio_import.processed_rows = self.total_rows
+        PortfolioImport.objects.filter(pk=self.portfolio_import.pk).update(
+            processed_rows=self.total_rows, updated_at=timezone.now()
+        )
     
     def _process_single_row(self, row, row_number):
         """Process and validate a single CSV row"""
@@ -253,52 +335,123 @@ class CSVPortfolioParser:
             row_data['errors'].append(f"Row processing error: {str(e)}")
             return row_data
     
-    def _validate_stock_symbols(self):
-        """Validate stock symbols against Yahoo Finance in batch"""
+    def _validate_stock_symbols(self, rows):
+        """
+        Validate the stock symbols of a chunk. Symbols already in the Stock
+        table or known to be unknown are resolved locally; the rest are looked
+        up concurrently, and those not answered within the import's time
+        budget are marked unverified rather than holding up the preview.
+        """
         symbols_to_validate = []
         symbol_to_rows = {}
         
         # Collect unique symbols
-        for row in self.valid_rows:
+        for row in rows:
             if 'symbol' in row and not row['errors']:
                 symbol = row['symbol']
                 if symbol not in symbol_to_rows:
                     symbol_to_rows[symbol] = []
-                    symbols_to_validate.append(symbol)
+                    if symbol not in self.symbol_results:
+                        symbols_to_validate.append(symbol)
                 symbol_to_rows[symbol].append(row)
         
-        # Validate symbols
+        if symbols_to_validate:
+            for symbol, name in Stock.objects.filter(symbol__in=symbols_to_validate).values_list('symbol', 'name'):
+                self.symbol_results[symbol] = ('valid', name or symbol)
+            for symbol in symbols.unknown_symbols.get_many(symbols_to_validate):
+                self.symbol_results.setdefault(symbol, ('error', f"Stock symbol '{symbol}' not found"))
+            self._validate_upstream([
+                symbol for symbol in symbols_to_validate if symbol not in self.symbol_results
+            ])
+        
+        for symbol, symbol_rows in symbol_to_rows.items():
+            outcome, value = self.symbol_results[symbol]
+            for row in symbol_rows:
+                if outcome == 'valid':
+                    row['stock_name'] = value
+                elif outcome == 'error':
+                    row['errors'].append(value)
+                else:
+                    if outcome == 'unverified':
+                        row['unverified'] = True
+                        self.unverified_count += 1
+                    row['warnings'].append(value)
+    
+    def _validate_upstream(self, symbols_to_validate):
+        """
+        Look symbols up on a bounded thread pool through TickerSnapshot, as
+        symbols.lookup does, so quotes cached or being fetched for other
+        requests are shared instead of asked for again
+        """
+        if not symbols_to_validate:
+            return
+        
+        provider = get_provider()
+        remaining = max(0, self.deadline - time.monotonic())
+        futures = {}
+        if remaining:
+            executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CSV_VALIDATION_MAX_WORKERS', 8),
+                thread_name_prefix='csv-validate'
+            )
+            futures = {
+                executor.submit(TickerSnapshot(symbol, provider).info): symbol
+                for symbol in symbols_to_validate
+            }
+            wait(futures, timeout=remaining)
+            # Lookups still running are abandoned, not waited for
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        negative_timeout = getattr(settings, 'SYMBOL_NEGATIVE_CACHE_SECONDS', 3600)
+        checked = {}
+        for future, symbol in futures.items():
+            if future.done() and not future.cancelled():
+                checked[symbol] = future
+        
         for symbol in symbols_to_validate:
+            future = checked.get(symbol)
+            if future is None:
+                self.symbol_results[symbol] = (
+                    'unverified', f"Symbol '{symbol}' could not be verified in time"
+                )
+                continue
+            
             try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                
-                if not info.get('symbol') and not info.get('longName'):
-                    # Symbol not found
-                    for row in symbol_to_rows[symbol]:
-                        row['errors'].append(f"Stock symbol '{symbol}' not found")
-                else:
-                    # Symbol is valid, store additional info
-                    for row in symbol_to_rows[symbol]:
-                        row['stock_name'] = info.get('longName', symbol)
-                        
+                info = future.result()
+            except UpstreamUnavailable:
+                # Rate limited or circuit open: don't wait for the upstream to recover
+                self.symbol_results[symbol] = (
+                    'unverified', f"Symbol '{symbol}' could not be verified, market data is unavailable"
+                )
+                continue
+            except LookupError:
+                info = None  # The provider returned nothing for it
             except Exception as e:
-                for row in symbol_to_rows[symbol]:
-                    row['warnings'].append(f"Could not validate symbol '{symbol}': {str(e)}")
+                print(f"Failed to validate symbol {symbol}: {e}")
+                info = None
+            
+            if info is None:
+                self.symbol_results[symbol] = ('warning', f"Could not validate symbol '{symbol}'")
+            elif not info.get('symbol') and not info.get('longName'):
+                # Symbol not found
+                self.symbol_results[symbol] = ('error', f"Stock symbol '{symbol}' not found")
+                symbols.unknown_symbols.set(symbol, True, timeout=negative_timeout)
+            else:
+                # Symbol is valid, store additional info
+                self.symbol_results[symbol] = ('valid', info.get('longName', symbol))
     
     def _update_import_record(self):
         """Update the PortfolioImport record with parsing results"""
-        valid_count = sum(1 for row in self.valid_rows if not row.get('errors'))
-        error_count = sum(1 for row in self.valid_rows if row.get('errors'))
-        
         self.portfolio_import.total_rows = self.total_rows
-        self.portfolio_import.successful_imports = valid_count
-        self.portfolio_import.failed_imports = error_count
+        self.portfolio_import.processed_rows = self.total_rows
+        self.portfolio_import.successful_imports = self.valid_count
+        self.portfolio_import.failed_imports = self.error_count
         self.portfolio_import.status = 'preview'
+        # Rows themselves live in PortfolioImportRow
         self.portfolio_import.preview_data = {
-            'valid_rows': self.valid_rows,
             'column_mapping': self.column_mapping,
-            'total_errors': len(self.errors)
+            'total_errors': len(self.errors),
+            'unverified_rows': self.unverified_count
         }
         self.portfolio_import.error_log = self.errors
         self.portfolio_import.save()
@@ -309,112 +462,175 @@ class CSVPortfolioParser:
             'success': success,
             'error': error,
             'total_rows': self.total_rows,
-            'valid_rows': len([r for r in self.valid_rows if not r.get('errors')]),
-            'error_rows': len([r for r in self.valid_rows if r.get('errors')]),
-            'data': self.valid_rows,
+            'valid_rows': self.valid_count,
+            'error_rows': self.error_count,
+            'unverified_rows': self.unverified_count,
+            'data': self.sample_rows,
             'errors': self.errors,
             'column_mapping': self.column_mapping
         }
 
 
+def iter_import_rows(portfolio_import):
+    """
+    Yield the parsed row dicts of an import without loading them all at once.
+    Imports parsed before rows had their own table keep them in preview_data.
+    """
+    legacy_rows = (portfolio_import.preview_data or {}).get('valid_rows')
+    if legacy_rows is not None:
+        yield from legacy_rows
+        return
+    
+    rows = portfolio_import.rows.order_by('row_number').values_list('data', flat=True)
+    yield from rows.iterator(chunk_size=CSVPortfolioParser.CHUNK_SIZE)
+
+
 def create_positions_from_import(portfolio_import):
     """
-    Create portfolio positions from validated import data
+    Create portfolio positions from validated import data.
+    
+    Rows are merged per symbol in memory, then stocks and positions are
+    resolved and written with bulk queries inside a single transaction,
+    so an import is either fully applied or not at all. The portfolio and
+    its positions are locked first, like any other trade, and a merged
+    position too large for Position.quantity fails the import. Each
+    applied row is recorded as a buy in the trade ledger.
+    
+    The import moves out of preview with a conditional update in the same
+    transaction, so a second concurrent confirm raises ImportNotInPreview
+    instead of applying it again.
     """
     from .models import Position
     
     if not portfolio_import.preview_data:
         raise ValueError("No preview data available")
     
-    valid_rows = portfolio_import.preview_data.get('valid_rows', [])
-    created_positions = []
+    portfolio = portfolio_import.portfolio
+    applied_rows = 0
     errors = []
     
     try:
-        portfolio_import.status = 'processing'
-        portfolio_import.save()
-        
-        for row_data in valid_rows:
+        # Merge duplicate rows per symbol using the weighted average cost
+        lots = {}
+        buys = []
+        for row_data in iter_import_rows(portfolio_import):
             if row_data.get('errors'):
                 continue  # Skip rows with errors
-                
+            
             try:
-                # Get or create stock
-                stock, created = Stock.objects.get_or_create(
-                    symbol=row_data['symbol'],
-                    defaults={
-                        'name': row_data.get('stock_name', row_data['symbol'])
-                    }
-                )
-                
-                # Check for existing positions and merge them
-                existing_position = Position.objects.filter(
-                    portfolio=portfolio_import.portfolio,
-                    stock=stock
-                ).first()
-                
-                new_quantity = Decimal(row_data['quantity'])
-                new_price = Decimal(row_data['purchase_price'])
-                
-                if existing_position:
-                    # Calculate weighted average cost and sum quantities
-                    existing_quantity = existing_position.quantity
-                    existing_price = existing_position.purchase_price
-                    
-                    # Total quantities
-                    total_quantity = existing_quantity + new_quantity
-                    
-                    # Calculate weighted average price
-                    if total_quantity > 0:
-                        total_cost = (existing_quantity * existing_price) + (new_quantity * new_price)
-                        average_price = total_cost / total_quantity
-                    else:
-                        average_price = Decimal('0')
-                    
-                    # Update existing position
-                    existing_position.quantity = total_quantity
-                    existing_position.purchase_price = average_price
-                    # Keep the earlier purchase date
-                    new_date = datetime.fromisoformat(row_data['purchase_date']).date()
-                    if new_date < existing_position.purchase_date:
-                        existing_position.purchase_date = new_date
-                    existing_position.save()
-                    
-                    created_positions.append(existing_position)
-                    continue
-                
-                # Create new position - convert string values back to proper types
+                quantity = Decimal(row_data['quantity'])
+                price = Decimal(row_data['purchase_price'])
                 purchase_date = datetime.fromisoformat(row_data['purchase_date']).date()
-                
-                position = Position.objects.create(
-                    portfolio=portfolio_import.portfolio,
-                    stock=stock,
-                    quantity=new_quantity,
-                    purchase_price=new_price,
-                    purchase_date=purchase_date
-                )
-                
-                created_positions.append(position)
-                
             except Exception as e:
                 errors.append({
                     'row': row_data['row_number'],
                     'message': f"Failed to create position: {str(e)}"
                 })
+                continue
+            
+            symbol = row_data['symbol']
+            if symbol in lots:
+                merge_lot(lots[symbol], quantity, price, purchase_date)
+            else:
+                lots[symbol] = {
+                    'quantity': quantity,
+                    'purchase_price': price,
+                    'purchase_date': purchase_date,
+                    'name': row_data.get('stock_name', symbol),
+                }
+            buys.append((symbol, quantity, price))
+            applied_rows += 1
         
-        # Update import status
-        portfolio_import.successful_imports = len(created_positions)
-        portfolio_import.failed_imports = len(errors)
-        portfolio_import.status = 'completed'
-        portfolio_import.error_log = errors
-        portfolio_import.save()
+        with transaction.atomic():
+            # Taken before positions are read, as execute_orders and sell do,
+            # so a concurrent trade can't be overwritten by a stale quantity
+            _lock_cash(portfolio.pk)
+            claimed = PortfolioImport.objects.filter(pk=portfolio_import.pk, status='preview').update(
+                status='processing'
+            )
+            if not claimed:
+                raise ImportNotInPreview('Import is not in preview status')
+            
+            # Resolve all symbols at once, creating the missing stocks
+            stocks = Stock.objects.in_bulk(list(lots), field_name='symbol')
+            missing_stocks = [
+                Stock(symbol=symbol, name=lot['name'])
+                for symbol, lot in lots.items() if symbol not in stocks
+            ]
+            if missing_stocks:
+                Stock.objects.bulk_create(missing_stocks, ignore_conflicts=True)
+                stocks = Stock.objects.in_bulk(list(lots), field_name='symbol')
+            created_stocks = [stocks[stock.symbol] for stock in missing_stocks]
+            
+            # Existing positions of this portfolio, loaded once
+            existing_positions = {
+                position.stock_id: position
+                for position in Position.objects.select_for_update().filter(portfolio=portfolio)
+            }
+            
+            now = timezone.now()
+            new_positions = []
+            changed_positions = []
+            for symbol, lot in lots.items():
+                stock = stocks[symbol]
+                position = existing_positions.get(stock.id)
+                
+                if position:
+                    merged = {
+                        'quantity': position.quantity,
+                        'purchase_price': position.purchase_price,
+                        'purchase_date': position.purchase_date,
+                    }
+                    merge_lot(merged, lot['quantity'], lot['purchase_price'], lot['purchase_date'])
+                    _check_quantity(symbol, merged['quantity'])
+                    position.quantity = merged['quantity']
+                    position.purchase_price = merged['purchase_price']
+                    # Keep the earlier purchase date
+                    position.purchase_date = merged['purchase_date']
+                    position.updated_at = now
+                    changed_positions.append(position)
+                else:
+                    _check_quantity(symbol, lot['quantity'])
+                    new_positions.append(Position(
+                        portfolio=portfolio,
+                        stock=stock,
+                        quantity=lot['quantity'],
+                        purchase_price=lot['purchase_price'],
+                        purchase_date=lot['purchase_date']
+                    ))
+            
+            Position.objects.bulk_create(new_positions)
+            Position.objects.bulk_update(
+                changed_positions, ['quantity', 'purchase_price', 'purchase_date', 'updated_at']
+            )
+            record_holdings(portfolio.id, [
+                (stocks[symbol], 'buy', quantity, price) for symbol, quantity, price in buys
+            ])
+            
+            after_bulk_write([portfolio.id])
+            if created_stocks:
+                def refresh_symbols():
+                    # Drops negatively cached lookups of the new symbols
+                    for stock in created_stocks:
+                        symbols.stock_changed(stock, created=True)
+                    stock_search.invalidate()
+                transaction.on_commit(refresh_symbols)
+            
+            # Update import status
+            portfolio_import.successful_imports = applied_rows
+            portfolio_import.failed_imports = len(errors)
+            portfolio_import.status = 'completed'
+            portfolio_import.error_log = errors
+            portfolio_import.save()
         
         return {
             'success': True,
-            'created_positions': len(created_positions),
+            'created_positions': applied_rows,
             'errors': errors
         }
         
+    except ImportNotInPreview:
+        raise
     except Exception as e:
         portfolio_import.status = 'failed'
         portfolio_import.error_log = [{'message': str(e)}]
@@ -423,6 +639,12 @@ def create_positions_from_import(portfolio_import):
         return {
             'success': False,
             'error': str(e),
-            'created_positions': len(created_positions),
+            'created_positions': 0,
             'errors': errors
-        }
\ No newline at end of file
+        }
+
+
+def _check_quantity(symbol, quantity):
+    """Fail the import if a merged position won't fit Position.quantity"""
+    if quantity > MAX_AMOUNT:
+        raise TradeError(f'{symbol}: position quantity must be at most {MAX_AMOUNT}')
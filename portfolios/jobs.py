@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import BackgroundJob, PortfolioImport, Stock
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Statuses in which a job is still owned by a worker, per model
+ACTIVE_STATUSES = {
+    BackgroundJob: ['queued', 'running'],
+    PortfolioImport: ['parsing'],
+}
+STALE_MESSAGE = 'The job stopped making progress, most likely because its worker restarted; please try again'
+
+
+def submit(func, *args):
+    """
+    Run func(*args) on the in-process background pool once the current
+    transaction commits. Job state lives in the database, so any worker can
+    answer progress polls. With BACKGROUND_JOBS_EAGER the job runs inline.
+    """
+    if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        transaction.on_commit(lambda: _run(func, *args))
+        return
+
+    transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, func, *args))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_JOB_WORKERS', 2),
+                thread_name_prefix='portfolio-job'
+            )
+        return _executor
+
+
+def fail_if_stale(job):
+    """
+    Mark a queued or running BackgroundJob or PortfolioImport failed when
+    nothing has updated it for BACKGROUND_JOB_STALE_SECONDS: jobs run in the
+    process that queued them, so they are lost if that worker restarts or
+    crashes, and clients polling them would otherwise wait forever.
+    Returns True when the job was marked failed (and refreshed)
+    """
+    model = type(job)
+    active = ACTIVE_STATUSES[model]
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'BACKGROUND_JOB_STALE_SECONDS', 600))
+    if job.status not in active or job.updated_at >= cutoff:
+        return False
+
+    if model is BackgroundJob:
+        error = {'error': STALE_MESSAGE}
+    else:
+        error = {'error_log': [{'message': STALE_MESSAGE}]}
+    # Conditional, so a worker that just made progress isn't overruled
+    failed = model.objects.filter(pk=job.pk, status__in=active, updated_at__lt=cutoff).update(
+        status='failed', updated_at=timezone.now(), **error
+    )
+    job.refresh_from_db()
+    return bool(failed)
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        logger.warning('Background job %s failed: %s', func.__name__, e)
+
+
+def _run_in_thread(func, *args):
+    close_old_connections()
+    try:
+        _run(func, *args)
+    finally:
+        connection.close()
+
+
+def run_csv_import(import_id, path, filename):
+    """Parse and validate an uploaded CSV saved at path, then remove the file"""
+    from .csv_parser import CSVPortfolioParser
+
+    portfolio_import = PortfolioImport.objects.get(id=import_id)
+    try:
+        if portfolio_import.status != 'parsing':
+            return  # Given up on as stale while it waited in the queue
+        
+        with open(path, 'rb') as csv_file:
+            parser = CSVPortfolioParser(csv_file, filename, portfolio_import)
+            result = parser.parse_and_validate()
+
+        if not result['success']:
+            portfolio_import.status = 'failed'
+            portfolio_import.error_log = result['errors'] or [{'message': result['error']}]
+            portfolio_import.save()
+    except Exception as e:
+        portfolio_import.status = 'failed'
+        portfolio_import.error_log = [{'message': str(e)}]
+        portfolio_import.save()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def start_stock_analysis_refresh(user):
+    """Queue an analyst/options refresh for every stock the user holds"""
+    job = BackgroundJob.objects.create(user=user, kind='stock_analysis')
+    submit(run_stock_analysis_refresh, job.id)
+    return job
+
+
+def run_stock_analysis_refresh(job_id):
+    from .views import ANALYSIS_UPDATE_FIELDS, fetch_analyst_and_options_data
+
+    job = BackgroundJob.objects.get(id=job_id)
+    if job.status != 'queued':
+        return  # Given up on as stale while it waited in the queue
+    stocks = list(Stock.objects.filter(position__portfolio__user_id=job.user_id).distinct())
+
+    # Each transition is conditional, so a job fail_if_stale has given up on stays failed
+    started = BackgroundJob.objects.filter(id=job_id, status='queued').update(
+        status='running', progress_total=len(stocks), updated_at=timezone.now()
+    )
+    if not started:
+        return
+
+    updated_stocks = []
+    failed_stocks = []
+    error = ''
+    try:
+        for stock in stocks:
+            if fetch_analyst_and_options_data(stock):
+                stock.save(update_fields=ANALYSIS_UPDATE_FIELDS)
+                updated_stocks.append(stock.symbol)
+            else:
+                failed_stocks.append(stock.symbol)
+            BackgroundJob.objects.filter(id=job_id).update(
+                progress_current=F('progress_current') + 1, updated_at=timezone.now()
+            )
+
+        status = 'completed'
+    except Exception as e:
+        status = 'failed'
+        error = str(e)
+
+    BackgroundJob.objects.filter(id=job_id, status='running').update(
+        status=status,
+        result={
+            'message': f'Updated analysis data for {len(updated_stocks)} stocks',
+            'updated_stocks': updated_stocks,
+            'failed_stocks': failed_stocks
+        },
+        error=error,
+        updated_at=timezone.now()
+    )
@@ -0,0 +1,67 @@
+from .models import LeaderboardEntry, Portfolio, Position
+
+
+SNAPSHOT_FIELDS = [
+    'name', 'username', 'total_value', 'total_cost', 'total_gain_loss',
+    'percentage_gain', 'updated_at',
+]
+
+# Portfolios recomputed per query when a widely held stock changes price
+REFRESH_BATCH_SIZE = 500
+
+
+def refresh_portfolios(portfolio_ids):
+    """
+    Recompute the leaderboard snapshot for the given portfolios.
+    Portfolios that no longer exist are skipped (their entries cascade away).
+    """
+    portfolio_ids = list(set(portfolio_ids))
+
+    for start in range(0, len(portfolio_ids), REFRESH_BATCH_SIZE):
+        batch = portfolio_ids[start:start + REFRESH_BATCH_SIZE]
+        portfolios = Portfolio.objects.filter(id__in=batch).select_related('user').with_totals()
+
+        entries = [_build_entry(portfolio) for portfolio in portfolios]
+        if entries:
+            LeaderboardEntry.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['portfolio'],
+                update_fields=SNAPSHOT_FIELDS,
+            )
+
+
+def refresh_for_stocks(stock_ids):
+    """Recompute every portfolio that holds one of the given stocks"""
+    portfolio_ids = Position.objects.filter(stock_id__in=stock_ids).values_list('portfolio_id', flat=True)
+    refresh_portfolios(portfolio_ids)
+
+
+def rebuild():
+    """Recompute the snapshot for every portfolio"""
+    refresh_portfolios(Portfolio.objects.values_list('id', flat=True))
+
+
+def top_entries(limit=10):
+    """Top portfolios by percentage gain, read straight off the index"""
+    return LeaderboardEntry.objects.filter(percentage_gain__isnull=False).order_by('-percentage_gain')[:limit]
+
+
+def _build_entry(portfolio):
+    total_value = portfolio.total_value
+    total_cost = portfolio.total_cost
+    total_gain_loss = total_value - total_cost
+
+    percentage_gain = None
+    if total_cost and total_cost > 0:
+        percentage_gain = (float(total_gain_loss) / float(total_cost)) * 100
+
+    return LeaderboardEntry(
+        portfolio=portfolio,
+        name=portfolio.name,
+        username=portfolio.user.username,
+        total_value=total_value,
+        total_cost=total_cost,
+        total_gain_loss=total_gain_loss,
+        percentage_gain=percentage_gain,
+    )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from portfolios import trades
+
+
+class Command(BaseCommand):
+    help = 'Recompute every portfolio cash balance from the trade ledger'
+
+    def handle(self, *args, **options):
+        updated = trades.rebuild_cash()
+        self.stdout.write(self.style.SUCCESS(
+            f'Cash balances rebuilt: {updated} portfolios corrected'
+        ))
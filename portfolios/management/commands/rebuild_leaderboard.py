@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from portfolios import leaderboard
+from portfolios.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized leaderboard for every portfolio'
+
+    def handle(self, *args, **options):
+        leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Leaderboard rebuilt: {LeaderboardEntry.objects.count()} portfolios'
+        ))
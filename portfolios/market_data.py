@@ -0,0 +1,397 @@
+import functools
+import importlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import zlib
+from datetime import date
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import upstream
+from .upstream import UpstreamUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module that is only imported on first attribute access.
+
+    yfinance and pandas (with numpy) take most of a worker's boot time and
+    memory, yet CRUD, auth and import status endpoints never touch them. The
+    app's modules import the shared stand-ins below instead of the real
+    modules, so a worker or management command only pays for them when it
+    actually handles market data.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+
+yf = LazyModule('yfinance')
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+
+
+class MarketDataProvider:
+    """
+    Source of upstream market data. Every method is batched over symbols and
+    returns {symbol: value}; symbols that could not be fetched are left out.
+
+    Quote info dicts, news articles and DataFrames use yfinance's shapes, so
+    callers don't depend on which provider is configured. A method raises
+    UpstreamUnavailable when the upstream can't be called at all right now
+    (rate limited, circuit open), so callers can fall back to stored data.
+    """
+
+    def get_quotes(self, symbols):
+        """Quote/profile info dict per symbol"""
+        raise NotImplementedError
+
+    def get_histories(self, symbols, start_date):
+        """Daily Open/High/Low/Close/Volume DataFrame per symbol, from start_date"""
+        raise NotImplementedError
+
+    def get_news(self, symbols):
+        """Recent news articles per symbol"""
+        raise NotImplementedError
+
+    def get_recommendations(self, symbols):
+        """Analyst recommendation DataFrame (or None) per symbol"""
+        raise NotImplementedError
+
+    def get_option_expirations(self, symbols):
+        """Tuple of option expiration dates per symbol"""
+        raise NotImplementedError
+
+    def get_option_chains(self, expirations):
+        """{'calls': DataFrame, 'puts': DataFrame} per symbol, for {symbol: expiration}"""
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Yahoo Finance through yfinance; histories are downloaded in one batch"""
+
+    def get_quotes(self, symbols):
+        return self._each(symbols, 'quote', lambda symbol: yf.Ticker(symbol).info)
+
+    def get_histories(self, symbols, start_date):
+        symbols = list(symbols)
+        data = self._call(lambda: yf.download(
+            symbols, start=start_date.isoformat(), interval='1d', group_by='ticker',
+            auto_adjust=True, threads=True, progress=False
+        ))
+        if data is None or data.empty:
+            return {}
+
+        if not isinstance(data.columns, pd.MultiIndex):
+            return {symbols[0]: data}
+
+        available = set(data.columns.get_level_values(0))
+        return {
+            symbol: data[symbol].dropna(how='all')
+            for symbol in symbols if symbol in available
+        }
+
+    def get_news(self, symbols):
+        return self._each(symbols, 'news', lambda symbol: yf.Ticker(symbol).news or [])
+
+    def get_recommendations(self, symbols):
+        return self._each(symbols, 'recommendations', lambda symbol: yf.Ticker(symbol).recommendations)
+
+    def get_option_expirations(self, symbols):
+        return self._each(symbols, 'options', lambda symbol: tuple(yf.Ticker(symbol).options))
+
+    def get_option_chains(self, expirations):
+        def fetch(symbol):
+            chain = yf.Ticker(symbol).option_chain(expirations[symbol])
+            return {'calls': chain.calls, 'puts': chain.puts}
+
+        return self._each(expirations, 'option chain', fetch)
+
+    def _call(self, fetch):
+        # yfinance reports Yahoo's 429s as YFRateLimitError; its other errors
+        # (unknown or delisted tickers, missing data) don't trip the breaker
+        return upstream.yahoo.call(
+            fetch, is_failure=lambda e: isinstance(e, yf.exceptions.YFRateLimitError) or upstream.is_outage(e)
+        )
+
+    def _each(self, symbols, resource, fetch):
+        results = {}
+        for symbol in symbols:
+            try:
+                results[symbol] = self._call(lambda: fetch(symbol))
+            except UpstreamUnavailable as e:
+                if not results:
+                    raise
+                # Keep what was fetched, the rest is left out like any failure
+                logger.warning('Stopped fetching %s: %s', resource, e)
+                break
+            except Exception as e:
+                logger.warning('Failed to fetch %s for %s: %s', resource, symbol, e)
+        return results
+
+
+class FixtureProvider(MarketDataProvider):
+    """
+    Offline, deterministic market data for benchmarks and load tests.
+
+    Responses recorded in the JSON fixture at MARKET_DATA_FIXTURE_PATH (see
+    RecordingProvider) are replayed as is. Symbols the fixture doesn't know
+    get synthetic data derived from the symbol alone, so any portfolio can
+    be exercised offline and every run sees the same numbers. Symbols listed
+    under "missing" in the fixture behave as if Yahoo doesn't know them.
+    """
+
+    # Synthetic price walks start here so a given date always has the same price
+    EPOCH = date(2015, 1, 2)
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'MARKET_DATA_FIXTURE_PATH', None)
+        self.fixture = load_fixture(self.path)
+        self.missing = set(self.fixture.get('missing', []))
+        self._histories = {}
+
+    def get_quotes(self, symbols):
+        quotes = self._each(symbols, 'quotes', self._synthetic_quote)
+        # Like Yahoo, an unknown symbol still answers, just without a name
+        quotes.update({symbol: {} for symbol in symbols if symbol in self.missing})
+        return quotes
+
+    def get_histories(self, symbols, start_date):
+        recorded = self.fixture.get('histories', {})
+        histories = {}
+        for symbol in symbols:
+            if symbol in self.missing:
+                continue
+            if symbol in recorded:
+                hist = frame_from_json(recorded[symbol], dated=True)
+            else:
+                hist = self._synthetic_history(symbol)
+            histories[symbol] = hist[hist.index >= pd.Timestamp(start_date)]
+        return histories
+
+    def get_news(self, symbols):
+        return self._each(symbols, 'news', self._synthetic_news)
+
+    def get_recommendations(self, symbols):
+        recommendations = self._each(symbols, 'recommendations', self._synthetic_recommendations)
+        return {
+            symbol: frame_from_json(value) if isinstance(value, dict) else value
+            for symbol, value in recommendations.items()
+        }
+
+    def get_option_expirations(self, symbols):
+        expirations = self._each(symbols, 'options', lambda symbol: ['2030-01-18'])
+        return {symbol: tuple(value) for symbol, value in expirations.items()}
+
+    def get_option_chains(self, expirations):
+        recorded = self.fixture.get('option_chains', {})
+        chains = {}
+        for symbol, expiration in expirations.items():
+            if symbol in self.missing:
+                continue
+            chain = recorded.get(symbol, {}).get(expiration)
+            if chain:
+                chains[symbol] = {side: frame_from_json(chain[side]) for side in ('calls', 'puts')}
+            else:
+                chains[symbol] = self._synthetic_option_chain(symbol)
+        return chains
+
+    def _each(self, symbols, section, synthesize):
+        recorded = self.fixture.get(section, {})
+        return {
+            symbol: recorded[symbol] if symbol in recorded else synthesize(symbol)
+            for symbol in symbols if symbol not in self.missing
+        }
+
+    def _random(self, symbol, salt=''):
+        return random.Random(zlib.crc32(f'{symbol}:{salt}'.encode('utf-8')))
+
+    def _synthetic_history(self, symbol):
+        today = timezone.now().date()
+        if (symbol, today) not in self._histories:
+            rng = self._random(symbol, 'history')
+            dates = pd.bdate_range(self.EPOCH, today)
+            price = rng.uniform(20, 500)
+            rows = []
+            for _ in dates:
+                price *= 1 + rng.gauss(0.0003, 0.018)
+                spread = price * rng.uniform(0.002, 0.02)
+                rows.append((price - spread / 2, price + spread, price - spread, price, rng.randint(10**5, 10**7)))
+            self._histories[(symbol, today)] = pd.DataFrame(
+                rows, index=dates, columns=['Open', 'High', 'Low', 'Close', 'Volume']
+            )
+        return self._histories[(symbol, today)]
+
+    def _synthetic_quote(self, symbol):
+        rng = self._random(symbol, 'quote')
+        closes = self._synthetic_history(symbol)['Close']
+        price = round(float(closes.iloc[-1]), 2)
+        return {
+            'symbol': symbol,
+            'longName': f'{symbol} Holdings Inc.',
+            'exchange': 'NMS',
+            'currentPrice': price,
+            'regularMarketPrice': price,
+            'previousClose': round(float(closes.iloc[-2]), 2),
+            'marketCap': rng.randint(10**9, 10**12),
+            'targetMeanPrice': round(price * rng.uniform(0.9, 1.3), 2),
+        }
+
+    def _synthetic_news(self, symbol):
+        return [
+            {'content': {
+                'title': f'{symbol} headline {i + 1}',
+                'summary': f'Synthetic news article {i + 1} about {symbol}.',
+                'canonicalUrl': {'url': f'https://example.com/{symbol.lower()}/{i + 1}'},
+                'pubDate': f'2025-01-{10 - i:02d}T12:00:00Z',
+                'provider': {'displayName': 'Fixture Wire'},
+            }}
+            for i in range(3)
+        ]
+
+    def _synthetic_recommendations(self, symbol):
+        rng = self._random(symbol, 'recommendations')
+        return pd.DataFrame([{
+            'period': '0m', 'strongBuy': rng.randint(0, 10), 'buy': rng.randint(0, 15),
+            'hold': rng.randint(0, 10), 'sell': rng.randint(0, 4), 'strongSell': rng.randint(0, 2),
+        }])
+
+    def _synthetic_option_chain(self, symbol):
+        rng = self._random(symbol, 'options')
+        strikes = [50 + 5 * i for i in range(10)]
+
+        def side():
+            return pd.DataFrame({
+                'strike': strikes,
+                'volume': [rng.randint(0, 5000) for _ in strikes],
+                'openInterest': [rng.randint(0, 20000) for _ in strikes],
+            })
+
+        return {'calls': side(), 'puts': side()}
+
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Pass calls through to another provider (Yahoo by default) and save every
+    response into the fixture at MARKET_DATA_FIXTURE_PATH for FixtureProvider
+    to replay later.
+    """
+
+    def __init__(self, provider=None, path=None):
+        self.provider = provider or YFinanceProvider()
+        self.path = path or settings.MARKET_DATA_FIXTURE_PATH
+        self.fixture = load_fixture(self.path)
+        self._lock = threading.Lock()
+
+    def get_quotes(self, symbols):
+        return self._record('quotes', self.provider.get_quotes(symbols))
+
+    def get_histories(self, symbols, start_date):
+        histories = self.provider.get_histories(symbols, start_date)
+        self._record('histories', {symbol: frame_to_json(hist) for symbol, hist in histories.items()})
+        return histories
+
+    def get_news(self, symbols):
+        return self._record('news', self.provider.get_news(symbols))
+
+    def get_recommendations(self, symbols):
+        recommendations = self.provider.get_recommendations(symbols)
+        self._record('recommendations', {
+            symbol: frame_to_json(value) if value is not None else None
+            for symbol, value in recommendations.items()
+        })
+        return recommendations
+
+    def get_option_expirations(self, symbols):
+        expirations = self.provider.get_option_expirations(symbols)
+        self._record('options', {symbol: list(value) for symbol, value in expirations.items()})
+        return expirations
+
+    def get_option_chains(self, expirations):
+        chains = self.provider.get_option_chains(expirations)
+        with self._lock:
+            recorded = self.fixture.setdefault('option_chains', {})
+            for symbol, chain in chains.items():
+                recorded.setdefault(symbol, {})[expirations[symbol]] = {
+                    side: frame_to_json(chain[side]) for side in ('calls', 'puts')
+                }
+            self._save()
+        return chains
+
+    def _record(self, section, values):
+        with self._lock:
+            self.fixture.setdefault(section, {}).update(values)
+            self._save()
+        return values
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.json', delete=False) as tmp:
+            json.dump(self.fixture, tmp, indent=1, sort_keys=True, default=str)
+        os.replace(tmp.name, self.path)
+
+
+PROVIDERS = {
+    'yfinance': YFinanceProvider,
+    'fixture': FixtureProvider,
+    'record': RecordingProvider,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_provider():
+    """The MarketDataProvider selected by MARKET_DATA_PROVIDER (a name above or a dotted path)"""
+    name = getattr(settings, 'MARKET_DATA_PROVIDER', 'yfinance')
+    provider_class = PROVIDERS.get(name) or import_string(name)
+    return provider_class()
+
+
+@receiver(setting_changed)
+def reset_provider(setting, **kwargs):
+    if setting in ('MARKET_DATA_PROVIDER', 'MARKET_DATA_FIXTURE_PATH'):
+        get_provider.cache_clear()
+
+
+def load_fixture(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as fixture_file:
+        return json.load(fixture_file)
+
+
+def frame_to_json(frame):
+    return json.loads(frame.to_json(orient='split', date_format='iso'))
+
+
+def frame_from_json(data, dated=False):
+    """Rebuild a DataFrame saved by frame_to_json; dated frames get a naive DatetimeIndex"""
+    frame = pd.DataFrame(data['data'], index=data['index'], columns=data['columns'])
+    if dated:
+        frame.index = pd.to_datetime(frame.index, utc=True).tz_localize(None)
+    return frame
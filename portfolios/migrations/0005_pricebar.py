@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0004_portfolio_cash_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('open', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('high', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('low', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('close', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('volume', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['symbol', 'date'],
+                'unique_together': {('symbol', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:55
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0005_pricebar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('username', models.CharField(max_length=150)),
+                ('total_value', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=20)),
+                ('total_cost', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=20)),
+                ('total_gain_loss', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=20)),
+                ('percentage_gain', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('portfolio', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to='portfolios.portfolio')),
+            ],
+            options={
+                'ordering': ['-percentage_gain'],
+                'indexes': [models.Index(fields=['-percentage_gain'], name='leaderboard_pct_gain_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0006_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.IntegerField()),
+                ('data', models.JSONField()),
+                ('has_errors', models.BooleanField(default=False)),
+                ('portfolio_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='portfolios.portfolioimport')),
+            ],
+            options={
+                'ordering': ['row_number'],
+                'unique_together': {('portfolio_import', 'row_number')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0008_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='portfolioimport',
+            index=models.Index(fields=['portfolio', '-import_date'], name='import_portfolio_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['portfolio', '-created_at'], name='position_portfolio_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['last_updated'], name='stock_last_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# Stock search filters with istartswith/icontains, which PostgreSQL runs as
+# UPPER(column::text) LIKE UPPER(...); trigram GIN indexes on those
+# expressions serve both. Other databases use the in-memory index in
+# portfolios/stock_search.py and skip this migration.
+TRIGRAM_INDEXES = [
+    ('stock_symbol_trgm_idx', 'symbol'),
+    ('stock_name_trgm_idx', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON portfolios_stock '
+            f'USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0009_add_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
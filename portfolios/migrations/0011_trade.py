@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    # Cash held before the ledger existed becomes each portfolio's first entry
+    Portfolio = apps.get_model('portfolios', 'Portfolio')
+    Trade = apps.get_model('portfolios', 'Trade')
+    Trade.objects.bulk_create([
+        Trade(portfolio_id=portfolio_id, side='adjustment', cash_amount=balance, cash_balance_after=balance)
+        for portfolio_id, balance in Portfolio.objects.exclude(cash_balance=0).values_list('id', 'cash_balance')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0010_stock_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(blank=True, max_length=10)),
+                ('side', models.CharField(choices=[('buy', 'Buy'), ('sell', 'Sell'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=12)),
+                ('price', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=12)),
+                ('cash_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('cash_balance_after', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trades', to='portfolios.portfolio')),
+                ('stock', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='portfolios.stock')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['portfolio', 'created_at'], name='trade_portfolio_created_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
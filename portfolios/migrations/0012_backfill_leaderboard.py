@@ -0,0 +1,58 @@
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_leaderboard(apps, schema_editor):
+    # Same snapshot as leaderboard.refresh_portfolios, so /api/top-portfolios/
+    # isn't empty until someone runs rebuild_leaderboard
+    Portfolio = apps.get_model('portfolios', 'Portfolio')
+    LeaderboardEntry = apps.get_model('portfolios', 'LeaderboardEntry')
+
+    amount = models.DecimalField(max_digits=20, decimal_places=4)
+    portfolios = Portfolio.objects.annotate(
+        value=Coalesce(
+            Sum(F('positions__quantity') * F('positions__stock__current_price'), output_field=amount),
+            Value(Decimal('0')),
+            output_field=amount,
+        ),
+        cost=Coalesce(
+            Sum(F('positions__quantity') * F('positions__purchase_price'), output_field=amount),
+            Value(Decimal('0')),
+            output_field=amount,
+        ),
+    ).values_list('id', 'name', 'user__username', 'value', 'cost')
+
+    entries = []
+    for portfolio_id, name, username, value, cost in portfolios.iterator(chunk_size=500):
+        gain_loss = value - cost
+        entries.append(LeaderboardEntry(
+            portfolio_id=portfolio_id,
+            name=name,
+            username=username,
+            total_value=value,
+            total_cost=cost,
+            total_gain_loss=gain_loss,
+            percentage_gain=(float(gain_loss) / float(cost)) * 100 if cost > 0 else None,
+        ))
+    LeaderboardEntry.objects.bulk_create(
+        entries,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['portfolio'],
+        update_fields=[
+            'name', 'username', 'total_value', 'total_cost', 'total_gain_loss', 'percentage_gain', 'updated_at',
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0011_trade'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
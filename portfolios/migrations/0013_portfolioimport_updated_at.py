@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0012_backfill_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolioimport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,8 +1,33 @@
 from django.db import models
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from decimal import Decimal
 
 
+class PortfolioQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate value, cost and position count computed in SQL, so the
+        Portfolio totals don't need a positions query per portfolio.
+        Aggregation drops Meta.ordering, so the ordering is kept explicitly.
+        """
+        amount = models.DecimalField(max_digits=20, decimal_places=4)
+        return self.annotate(
+            annotated_total_value=Coalesce(
+                Sum(F('positions__quantity') * F('positions__stock__current_price'), output_field=amount),
+                Value(Decimal('0')),
+                output_field=amount,
+            ),
+            annotated_total_cost=Coalesce(
+                Sum(F('positions__quantity') * F('positions__purchase_price'), output_field=amount),
+                Value(Decimal('0')),
+                output_field=amount,
+            ),
+            annotated_position_count=Count('positions'),
+        ).order_by(*(self.query.order_by or self.model._meta.ordering))
+
+
 class Portfolio(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -11,6 +36,8 @@ class Portfolio(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = PortfolioQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
     
@@ -19,12 +46,23 @@ class Portfolio(models.Model):
     
     @property
     def total_value(self):
+        # Prefer the SQL aggregate from Portfolio.objects.with_totals()
+        if hasattr(self, 'annotated_total_value'):
+            return self.annotated_total_value
         return sum(position.current_value for position in self.positions.all())
     
     @property
     def total_cost(self):
+        if hasattr(self, 'annotated_total_cost'):
+            return self.annotated_total_cost
         return sum(position.total_cost for position in self.positions.all())
     
+    @property
+    def position_count(self):
+        if hasattr(self, 'annotated_position_count'):
+            return self.annotated_position_count
+        return self.positions.count()
+    
     @property
     def total_gain_loss(self):
         return self.total_value - self.total_cost
@@ -48,6 +86,10 @@ class Stock(models.Model):
     
     class Meta:
         ordering = ['symbol']
+        indexes = [
+            # Finding stale quotes to refresh
+            models.Index(fields=['last_updated'], name='stock_last_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.symbol} - {self.name}"
@@ -65,6 +107,10 @@ class Position(models.Model):
     class Meta:
         unique_together = ['portfolio', 'stock']
         ordering = ['-created_at']
+        indexes = [
+            # A portfolio's positions in their default order
+            models.Index(fields=['portfolio', '-created_at'], name='position_portfolio_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.portfolio.name} - {self.stock.symbol} ({self.quantity} shares)"
@@ -104,11 +150,146 @@ class PortfolioImport(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed')
     ], default='parsing')
+    # Rows parsed (or applied) so far, polled through get_import_status
+    processed_rows = models.IntegerField(default=0)
     error_log = models.JSONField(blank=True, null=True)
     preview_data = models.JSONField(blank=True, null=True)
+    # Bumped with every progress update, see jobs.fail_if_stale
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-import_date']
+        indexes = [
+            # A portfolio's import history, newest first
+            models.Index(fields=['portfolio', '-import_date'], name='import_portfolio_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.portfolio.name} - {self.filename} ({self.status})"
+
+
+class PortfolioImportRow(models.Model):
+    """One parsed CSV row of an import, stored individually instead of in preview_data"""
+    portfolio_import = models.ForeignKey(PortfolioImport, on_delete=models.CASCADE, related_name='rows')
+    row_number = models.IntegerField()
+    data = models.JSONField()
+    has_errors = models.BooleanField(default=False)
+    
+    class Meta:
+        unique_together = ['portfolio_import', 'row_number']
+        ordering = ['row_number']
+    
+    def __str__(self):
+        return f"{self.portfolio_import.filename} row {self.row_number}"
+
+
+class PriceBar(models.Model):
+    """Daily OHLCV bar, stored locally so history is only downloaded once"""
+    symbol = models.CharField(max_length=10)
+    date = models.DateField()
+    open = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    high = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    low = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    close = models.DecimalField(max_digits=12, decimal_places=4)
+    volume = models.BigIntegerField(default=0)
+    
+    class Meta:
+        # Also serves as the (symbol, date) index for range scans
+        unique_together = ['symbol', 'date']
+        ordering = ['symbol', 'date']
+    
+    def __str__(self):
+        return f"{self.symbol} {self.date} ({self.close})"
+
+
+class LeaderboardEntry(models.Model):
+    """Denormalized leaderboard snapshot of a portfolio's totals"""
+    portfolio = models.OneToOneField(Portfolio, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    name = models.CharField(max_length=100)
+    username = models.CharField(max_length=150)
+    total_value = models.DecimalField(max_digits=20, decimal_places=4, default=Decimal('0'))
+    total_cost = models.DecimalField(max_digits=20, decimal_places=4, default=Decimal('0'))
+    total_gain_loss = models.DecimalField(max_digits=20, decimal_places=4, default=Decimal('0'))
+    # Null when the portfolio has no cost basis and can't be ranked
+    percentage_gain = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-percentage_gain']
+        indexes = [
+            models.Index(fields=['-percentage_gain'], name='leaderboard_pct_gain_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.username} - {self.name} ({self.percentage_gain})"
+
+
+class BackgroundJob(models.Model):
+    """Progress and result of work run outside the request, see portfolios.jobs"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='background_jobs')
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=[
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed')
+    ], default='queued')
+    progress_current = models.IntegerField(default=0)
+    progress_total = models.IntegerField(default=0)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class Trade(models.Model):
+    """
+    Append-only ledger of a portfolio: every change to a holding (buys,
+    sells, CSV imports, positions added or edited directly) and to
+    cash_balance is a Trade. cash_balance is the sum of cash_amount, so it
+    can be rebuilt from the ledger; corrections are new entries, never edits.
+    """
+    SIDE_CHOICES = [
+        ('buy', 'Buy'),
+        ('sell', 'Sell'),
+        ('adjustment', 'Adjustment'),
+    ]
+    
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='trades')
+    # Null for cash adjustments, and once the stock itself is deleted
+    stock = models.ForeignKey(Stock, on_delete=models.SET_NULL, null=True, blank=True)
+    symbol = models.CharField(max_length=10, blank=True)
+    side = models.CharField(max_length=10, choices=SIDE_CHOICES)
+    # Shares bought or sold; for adjustments the signed change to the position
+    # (edits through the positions API), zero for cash adjustments
+    quantity = models.DecimalField(max_digits=12, decimal_places=4, default=Decimal('0'))
+    price = models.DecimalField(max_digits=12, decimal_places=4, default=Decimal('0'))
+    # Signed change to the cash balance: the proceeds of sells; zero for buys,
+    # which are paid for outside the portfolio
+    cash_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    cash_balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # A portfolio's ledger in order
+            models.Index(fields=['portfolio', 'created_at'], name='trade_portfolio_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.portfolio.name} - {self.side} {self.quantity} {self.symbol} ({self.cash_amount})"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Trades are append-only and cannot be changed')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('Trades are append-only and cannot be deleted')
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from . import price_history
+from .caching import CacheNamespace, coordination
+from .quotes import MarketDataQuoteProvider
+
+
+SNAPSHOT_KEY = 'snapshot'
+LOCK_KEY = 'market_movers_refresh_lock'
+
+snapshot_cache = CacheNamespace('market_movers')
+
+
+async def aget_snapshot():
+    """
+    Return the market movers snapshot, stale-while-revalidate style.
+
+    A fresh snapshot is returned as is. A stale one is returned immediately
+    while a single background refresh rebuilds it. Only when there is no
+    snapshot at all does the caller wait for a build, sleeping on the event
+    loop instead of holding a thread.
+    """
+    snapshot = await sync_to_async(snapshot_cache.get)(SNAPSHOT_KEY)
+
+    if snapshot:
+        age = time.time() - snapshot['built_at']
+        if age > getattr(settings, 'MARKET_MOVERS_FRESH_SECONDS', 900):
+            await sync_to_async(refresh_in_background)()
+        return snapshot['data']
+
+    if await sync_to_async(_acquire_lock)():
+        try:
+            return await sync_to_async(rebuild)()
+        finally:
+            await sync_to_async(_release_lock)()
+
+    # Another worker is building the first snapshot, wait for it
+    deadline = time.time() + getattr(settings, 'MARKET_MOVERS_LOCK_SECONDS', 120)
+    while time.time() < deadline:
+        await asyncio.sleep(0.5)
+        snapshot = await sync_to_async(snapshot_cache.get)(SNAPSHOT_KEY)
+        if snapshot:
+            return snapshot['data']
+    return await sync_to_async(rebuild)()
+
+
+def refresh_in_background():
+    """Start a background rebuild unless one is already running in any worker"""
+    if not _acquire_lock():
+        return False
+
+    def run():
+        try:
+            rebuild()
+        except Exception as e:
+            print(f"Failed to refresh market movers: {e}")
+        finally:
+            _release_lock()
+            connection.close()
+
+    threading.Thread(target=run, name='market-movers-refresh', daemon=True).start()
+    return True
+
+
+def rebuild(quote_provider=None):
+    """Build the movers snapshot from the configured ticker universe and cache it"""
+    data = build_movers(settings.MARKET_MOVERS_TICKERS, quote_provider=quote_provider)
+    snapshot_cache.set(
+        SNAPSHOT_KEY,
+        {'data': data, 'built_at': time.time()},
+        timeout=getattr(settings, 'MARKET_MOVERS_STALE_SECONDS', 86400)
+    )
+    return data
+
+
+def build_movers(tickers, quote_provider=None):
+    """
+    Compute the top 10 gainers and losers for the given tickers.
+    Daily closes come from the local price store (one batched download for
+    any missing bars); names and market caps are fetched concurrently.
+    """
+    quote_provider = quote_provider or MarketDataQuoteProvider()
+    tickers = list(tickers)
+
+    histories = price_history.get_history(tickers, timezone.now().date() - timedelta(days=7))
+    tickers = [ticker for ticker in tickers if ticker in histories and len(histories[ticker]) >= 2]
+
+    def fetch_info(ticker):
+        try:
+            return quote_provider.fetch_quote(ticker) or {}
+        except Exception:
+            return {}
+
+    workers = min(getattr(settings, 'QUOTE_ENGINE_MAX_WORKERS', 8), len(tickers)) or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        infos = dict(zip(tickers, executor.map(fetch_info, tickers)))
+
+    movers_data = []
+    for ticker in tickers:
+        hist = histories[ticker]
+        info = infos[ticker]
+        current_price = float(hist['Close'].iloc[-1])
+        prev_price = float(hist['Close'].iloc[-2])
+        if not prev_price:
+            continue
+        change = current_price - prev_price
+        change_pct = (change / prev_price) * 100
+
+        movers_data.append({
+            'symbol': ticker,
+            'name': info.get('longName', ticker),
+            'price': current_price,
+            'change': change,
+            'change_percent': change_pct,
+            'volume': int(hist['Volume'].iloc[-1]) if 'Volume' in hist.columns else 0,
+            'market_cap': info.get('marketCap', 0),
+        })
+
+    # Get top 10 gainers - filter positive gains and sort by highest first
+    all_gainers = [stock for stock in movers_data if stock['change_percent'] > 0]
+    all_gainers.sort(key=lambda x: x['change_percent'], reverse=True)
+
+    # Get top 10 losers - filter negative gains and sort by most negative first
+    all_losers = [stock for stock in movers_data if stock['change_percent'] < 0]
+    all_losers.sort(key=lambda x: x['change_percent'])
+
+    return {
+        'gainers': all_gainers[:10],
+        'losers': all_losers[:10],
+        'last_updated': timezone.now().isoformat()
+    }
+
+
+def _acquire_lock():
+    # add is atomic, so only one worker (one process without Redis) wins while the lock is held
+    return coordination.add(LOCK_KEY, True, getattr(settings, 'MARKET_MOVERS_LOCK_SECONDS', 120))
+
+
+def _release_lock():
+    coordination.delete(LOCK_KEY)
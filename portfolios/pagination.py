@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination: each page continues from the last row of the
+    previous one with an indexed range query, so deep pages cost no OFFSET
+    scan and no COUNT(*). Responses carry next/previous links but no count.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class PositionPagination(KeysetPagination):
+    # Positions bulk-created by an import share created_at; id breaks the
+    # ties so the order is total and the cursor neither skips nor repeats
+    # rows. The list spans all of the user's portfolios, so this sort is not
+    # index-backed, but it is bounded by one user's positions
+    ordering = ('-created_at', '-id')
+
+
+class StockPagination(KeysetPagination):
+    # Symbols are unique, so the cursor never has to skip ties
+    ordering = 'symbol'
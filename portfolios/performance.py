@@ -0,0 +1,96 @@
+from .market_data import np, pd
+
+
+class PerformanceEngine:
+    """
+    Compute a portfolio's value over time from per-symbol price history.
+
+    Each symbol's history is fetched exactly once, the close prices are
+    aligned into a single date-indexed matrix (forward filling gaps) and the
+    portfolio value for every date is a matrix-vector product with the
+    position quantities.
+    """
+
+    def __init__(self, fetch_history):
+        # fetch_history(symbol, period) -> DataFrame with a 'Close' column
+        self.fetch_history = fetch_history
+
+    def compute(self, holdings, period, fallback_value=0):
+        """
+        holdings: list of (symbol, quantity) pairs, the first one drives the date range
+        fallback_value: value used for dates before any complete price data exists
+        Returns: dict in the portfolio_performance response shape
+        """
+        if not holdings:
+            return empty_performance()
+
+        histories = {}
+        for symbol, _ in holdings:
+            if symbol in histories:
+                continue
+            try:
+                histories[symbol] = self.fetch_history(symbol, period)
+            except Exception:
+                histories[symbol] = None
+
+        # Use the actual trading dates of the first position
+        sample_hist = histories.get(holdings[0][0])
+        if sample_hist is None or sample_hist.empty:
+            return empty_performance()
+        dates = sample_hist.index
+
+        symbols = [symbol for symbol, _ in holdings]
+        quantities = np.array([float(quantity) for _, quantity in holdings])
+        matrix = build_price_matrix(histories, symbols, dates)
+
+        values = pd.Series(matrix.to_numpy() @ quantities, index=dates)
+
+        # A date is only valid when every position has a price on or before it;
+        # otherwise carry the previous value forward, or the fallback at the start
+        complete = matrix.notna().all(axis=1)
+        values = values.where(complete).ffill().fillna(float(fallback_value))
+
+        return format_performance(dates, values.tolist(), period)
+
+
+def build_price_matrix(histories, symbols, dates):
+    """
+    Align close prices onto the given dates, one column per symbol.
+
+    Prices missing on a date are forward filled from the closest earlier
+    bar; symbols without any history stay NaN.
+    """
+    columns = {}
+    for symbol in symbols:
+        hist = histories.get(symbol)
+        if hist is None or hist.empty:
+            columns[symbol] = pd.Series(np.nan, index=dates)
+            continue
+        closes = hist['Close'].astype(float)
+        closes = closes[~closes.index.duplicated(keep='last')].sort_index()
+        aligned = closes.reindex(closes.index.union(dates)).ffill()
+        columns[symbol] = aligned.reindex(dates)
+
+    return pd.DataFrame(columns, index=dates, columns=symbols)
+
+
+def format_performance(dates, portfolio_values, period):
+    """Build the portfolio_performance response payload"""
+    initial_value = portfolio_values[0] if portfolio_values else 0
+    current_value = portfolio_values[-1] if portfolio_values else 0
+    total_return = current_value - initial_value
+    total_return_pct = (total_return / initial_value * 100) if initial_value > 0 else 0
+
+    return {
+        'dates': [date.strftime('%Y-%m-%d') for date in dates],
+        'values': portfolio_values,
+        'initial_value': initial_value,
+        'current_value': current_value,
+        'total_return': total_return,
+        'total_return_percent': total_return_pct,
+        'period': period
+    }
+
+
+def empty_performance():
+    return {'dates': [], 'values': [], 'initial_value': 0}
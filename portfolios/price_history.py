@@ -0,0 +1,147 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .caching import CacheNamespace
+from .market_data import get_provider, pd
+from .models import PriceBar
+
+
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+# Symbols whose history was brought up to date recently
+checked_cache = CacheNamespace('price_history')
+
+
+def backfill(symbols, fetch_histories=None):
+    """
+    Bring the local PriceBar store up to date for the given symbols.
+
+    Symbols with no stored bars get a full PRICE_HISTORY_BACKFILL_DAYS download;
+    otherwise only bars from the last stored date onwards are requested (the
+    last bar is re-fetched because it may still be an intraday bar). Symbols
+    sharing a start date are downloaded together in one batch.
+    Symbols checked within PRICE_HISTORY_REFRESH_SECONDS are skipped entirely.
+    Returns: list of symbols that failed to download
+    """
+    fetch_histories = fetch_histories or get_provider().get_histories
+    today = timezone.now().date()
+    backfill_days = getattr(settings, 'PRICE_HISTORY_BACKFILL_DAYS', 1825)
+
+    symbols = list(dict.fromkeys(symbols))
+    checked = checked_cache.get_many([_checked_key(s) for s in symbols])
+    symbols = [s for s in symbols if _checked_key(s) not in checked]
+    if not symbols:
+        return []
+
+    last_dates = dict(
+        PriceBar.objects.filter(symbol__in=symbols)
+        .values('symbol')
+        .annotate(last_date=Max('date'))
+        .values_list('symbol', 'last_date')
+    )
+
+    batches = {}
+    for symbol in symbols:
+        start_date = last_dates.get(symbol) or today - timedelta(days=backfill_days)
+        batches.setdefault(start_date, []).append(symbol)
+
+    failed = []
+    for start_date, batch in batches.items():
+        try:
+            histories = fetch_histories(batch, start_date)
+        except Exception as e:
+            print(f"Failed to backfill price history for {', '.join(batch)}: {e}")
+            failed.extend(batch)
+            continue
+
+        for symbol in batch:
+            if symbol not in histories:
+                failed.append(symbol)
+                continue
+            store_bars(symbol, histories[symbol])
+            mark_checked([symbol])
+
+    return failed
+
+
+def store_bars(symbol, hist):
+    """Upsert an OHLCV DataFrame (yfinance column names) into the store"""
+    if hist is None or hist.empty:
+        return 0
+
+    bars = []
+    for index, row in hist.iterrows():
+        close = row.get('Close')
+        if pd.isna(close):
+            continue
+        bars.append(PriceBar(
+            symbol=symbol,
+            date=index.date(),
+            open=_to_decimal(row.get('Open')),
+            high=_to_decimal(row.get('High')),
+            low=_to_decimal(row.get('Low')),
+            close=_to_decimal(close),
+            volume=0 if pd.isna(row.get('Volume')) else int(row.get('Volume') or 0),
+        ))
+
+    PriceBar.objects.bulk_create(
+        bars,
+        update_conflicts=True,
+        unique_fields=['symbol', 'date'],
+        update_fields=BAR_FIELDS,
+    )
+    return len(bars)
+
+
+def load_history(symbols, start_date=None):
+    """
+    Read stored bars for many symbols with one range scan.
+    Returns: dict of symbol -> DataFrame (Open/High/Low/Close/Volume) indexed by date
+    """
+    bars = PriceBar.objects.filter(symbol__in=symbols)
+    if start_date:
+        bars = bars.filter(date__gte=start_date)
+
+    rows = {}
+    for symbol, date, open_, high, low, close, volume in bars.order_by('symbol', 'date').values_list(
+        'symbol', 'date', *BAR_FIELDS
+    ):
+        rows.setdefault(symbol, []).append(
+            (date, _to_float(open_), _to_float(high), _to_float(low), float(close), volume)
+        )
+
+    histories = {}
+    for symbol, symbol_rows in rows.items():
+        frame = pd.DataFrame(symbol_rows, columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume'])
+        histories[symbol] = frame.set_index(pd.DatetimeIndex(frame.pop('Date')))
+    return histories
+
+
+def get_history(symbols, start_date=None, fetch_histories=None):
+    """Backfill any missing bars, then read the history from the local store"""
+    backfill(symbols, fetch_histories=fetch_histories)
+    return load_history(symbols, start_date)
+
+
+def mark_checked(symbols, timeout=None):
+    """Treat the stored history of these symbols as current for a while"""
+    if timeout is None:
+        timeout = getattr(settings, 'PRICE_HISTORY_REFRESH_SECONDS', 900)
+    for symbol in symbols:
+        checked_cache.set(_checked_key(symbol), True, timeout=timeout)
+
+
+def _checked_key(symbol):
+    return f'checked_{symbol}'
+
+
+def _to_decimal(value):
+    if value is None or pd.isna(value):
+        return None
+    return Decimal(str(round(float(value), 4)))
+
+
+def _to_float(value):
+    return None if value is None else float(value)
@@ -0,0 +1,126 @@
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from . import stock_search
+from .async_api import gather_limited
+from .models import Position, Stock
+from .ticker_snapshot import TickerSnapshot
+from .trades import after_bulk_write
+
+
+# Fields written back to the Stock table after a refresh
+QUOTE_UPDATE_FIELDS = [
+    'current_price', 'name', 'exchange', 'last_updated',
+    'analyst_recommendation', 'analyst_target_price', 'analyst_count',
+    'put_call_ratio', 'options_last_updated',
+]
+
+
+class MarketDataQuoteProvider:
+    """
+    Quote provider backed by the configured market data provider, through the
+    shared ticker snapshot so analyst and options enrichment reuse the same fetch
+    """
+
+    def fetch_quote(self, symbol):
+        return TickerSnapshot(symbol).info()
+
+
+class QuoteRefreshResult:
+    """
+    Outcome of a quote refresh: updated symbols, failures and per-symbol latency
+    """
+
+    def __init__(self):
+        self.updated = []
+        self.failed = {}
+        self.latencies = {}
+
+    def as_dict(self):
+        return {
+            'updated_stocks': self.updated,
+            'failed_stocks': self.failed,
+            'latency_ms': self.latencies,
+        }
+
+
+class QuoteEngine:
+    """
+    Refresh quotes for many stocks at once.
+
+    Symbols are fetched concurrently, at most max_workers at a time, and
+    every updated Stock row is written back with a single bulk_update.
+    """
+
+    def __init__(self, provider=None, enrich=None, max_workers=None):
+        self.provider = provider or MarketDataQuoteProvider()
+        self.enrich = enrich
+        self.max_workers = max_workers or getattr(settings, 'QUOTE_ENGINE_MAX_WORKERS', 8)
+
+    async def arefresh(self, stocks):
+        """
+        Fetch quotes for the given stocks and persist the changes.
+        Quotes are fetched with asyncio.gather, at most max_workers at a
+        time, and written back on the request's thread
+        Returns: QuoteRefreshResult
+        """
+        result = QuoteRefreshResult()
+
+        # One fetch per symbol, even if a stock shows up more than once
+        unique_stocks = list({stock.symbol: stock for stock in stocks}.values())
+        if not unique_stocks:
+            return result
+
+        names = {stock.symbol: stock.name for stock in unique_stocks}
+        outcomes = await gather_limited(self._refresh_one, unique_stocks, self.max_workers)
+        await sync_to_async(self._save)(outcomes, names, result)
+        return result
+
+    def _save(self, outcomes, names, result):
+        """Record the outcomes and bulk update the refreshed Stock rows"""
+        updated_stocks = []
+        for stock, error, latency in outcomes:
+            result.latencies[stock.symbol] = latency
+            if error:
+                result.failed[stock.symbol] = error
+            else:
+                updated_stocks.append(stock)
+                result.updated.append(stock.symbol)
+
+        if updated_stocks:
+            Stock.objects.bulk_update(updated_stocks, QUOTE_UPDATE_FIELDS)
+            # Prices don't change holdings, only the leaderboard entries of their holders
+            after_bulk_write(
+                Position.objects.filter(stock__in=updated_stocks).values_list('portfolio_id', flat=True),
+                holdings_changed=False
+            )
+            if any(stock.name != names[stock.symbol] for stock in updated_stocks):
+                stock_search.invalidate()
+
+    def _refresh_one(self, stock):
+        """Fetch and apply a single quote, returning (stock, error, latency_ms)"""
+        started = time.perf_counter()
+        error = None
+
+        try:
+            info = self.provider.fetch_quote(stock.symbol) or {}
+            current_price = info.get('currentPrice') or info.get('regularMarketPrice')
+
+            if current_price:
+                stock.current_price = current_price
+                stock.name = info.get('longName', stock.name)
+                stock.exchange = info.get('exchange', stock.exchange)
+                stock.last_updated = timezone.now()
+
+                # Also update analyst and options data
+                if self.enrich:
+                    self.enrich(stock)
+            else:
+                error = 'No price available'
+
+        except Exception as e:
+            error = str(e)
+
+        latency = round((time.perf_counter() - started) * 1000, 2)
+        return stock, error, latency
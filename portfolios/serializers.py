@@ -1,8 +1,54 @@
+from decimal import Decimal
 from rest_framework import serializers
 from .models import Portfolio, Stock, Position
+from .symbols import get_or_create_stock
 from django.contrib.auth.models import User
 
 
+class SparseFieldsMixin:
+    """
+    Let GET requests pick the fields they need with ?fields=, e.g.
+    ?fields=id,quantity,current_value,stock.symbol (dotted names select
+    fields of nested serializers). Without the parameter every field is returned.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self._requested_fields()
+        if requested is None:
+            return fields
+
+        nested = {}
+        for name in requested:
+            parent, _, child = name.partition('.')
+            if child:
+                nested.setdefault(parent, set()).add(child)
+
+        sparse = {}
+        for name, field in fields.items():
+            if name not in requested and name not in nested:
+                continue
+            if name in nested and name not in requested and isinstance(field, SparseFieldsMixin):
+                field._sparse_fields = nested[name]
+            sparse[name] = field
+        return sparse
+
+    def _requested_fields(self):
+        if hasattr(self, '_sparse_fields'):
+            return self._sparse_fields
+
+        # Only the top-level serializer reads the query parameter
+        root = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        request = self.context.get('request')
+        if root is not None or request is None or request.method != 'GET':
+            return None
+
+        fields = request.query_params.get('fields')
+        if not fields:
+            return None
+        return {name.strip() for name in fields.split(',') if name.strip()}
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -29,7 +75,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class StockSerializer(serializers.ModelSerializer):
+class StockSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Stock
         fields = [
@@ -43,7 +89,7 @@ class StockSerializer(serializers.ModelSerializer):
         ]
 
 
-class PositionSerializer(serializers.ModelSerializer):
+class PositionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     stock = StockSerializer(read_only=True)
     stock_symbol = serializers.CharField(write_only=True)
     total_cost = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
@@ -62,11 +108,7 @@ class PositionSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         stock_symbol = validated_data.pop('stock_symbol')
-        stock, created = Stock.objects.get_or_create(
-            symbol=stock_symbol.upper(),
-            defaults={'name': stock_symbol.upper()}
-        )
-        validated_data['stock'] = stock
+        validated_data['stock'] = get_or_create_stock(stock_symbol.upper())
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
@@ -75,13 +117,29 @@ class PositionSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class OrderSerializer(serializers.Serializer):
+    """One buy or sell instruction of a batch order, see trades.execute_orders"""
+    side = serializers.ChoiceField(choices=['buy', 'sell'])
+    symbol = serializers.CharField(max_length=10)
+    quantity = serializers.DecimalField(max_digits=12, decimal_places=4, min_value=Decimal('0.0001'))
+    # Defaults to the stock's current price
+    price = serializers.DecimalField(
+        max_digits=12, decimal_places=4, min_value=Decimal('0.0001'), required=False, allow_null=True
+    )
+    # Buys only, defaults to today
+    purchase_date = serializers.DateField(required=False, allow_null=True)
+
+    def validate_symbol(self, value):
+        return value.strip().upper()
+
+
 class PortfolioSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     positions = PositionSerializer(many=True, read_only=True)
     total_value = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     total_cost = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     total_gain_loss = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    position_count = serializers.SerializerMethodField()
+    position_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Portfolio
@@ -89,17 +147,15 @@ class PortfolioSerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'user', 'positions', 'total_value', 
             'total_cost', 'total_gain_loss', 'cash_balance', 'position_count', 'created_at', 'updated_at'
         ]
+        # Writes to cash_balance are recorded as ledger adjustments by PortfolioViewSet
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
 
-    def get_position_count(self, obj):
-        return obj.positions.count()
-
 
 class PortfolioSummarySerializer(serializers.ModelSerializer):
     total_value = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     total_cost = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     total_gain_loss = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    position_count = serializers.SerializerMethodField()
+    position_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Portfolio
@@ -107,7 +163,4 @@ class PortfolioSummarySerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'total_value', 'total_cost', 
             'total_gain_loss', 'cash_balance', 'position_count', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
-
-    def get_position_count(self, obj):
-        return obj.positions.count()
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import leaderboard, stock_search, symbols
+from .caching import invalidate_portfolio
+from .models import Portfolio, Position, Stock
+
+
+# Leaderboard refreshes run after commit, so a cascading portfolio delete
+# doesn't recreate the entry it is about to remove
+
+
+@receiver(post_save, sender=Portfolio)
+def refresh_leaderboard_for_portfolio(sender, instance, **kwargs):
+    transaction.on_commit(lambda: leaderboard.refresh_portfolios([instance.id]))
+
+
+@receiver([post_save, post_delete], sender=Position)
+def refresh_leaderboard_for_position(sender, instance, **kwargs):
+    portfolio_id = instance.portfolio_id
+    transaction.on_commit(lambda: leaderboard.refresh_portfolios([portfolio_id]))
+
+
+# Cached news and performance are invalidated after commit too, so a request
+# racing the write can't re-cache the old holdings once they are dropped
+
+
+@receiver([post_save, post_delete], sender=Portfolio)
+def invalidate_portfolio_cache(sender, instance, **kwargs):
+    portfolio_id = instance.id
+    transaction.on_commit(lambda: invalidate_portfolio(portfolio_id))
+
+
+@receiver([post_save, post_delete], sender=Position)
+def invalidate_position_portfolio_cache(sender, instance, **kwargs):
+    portfolio_id = instance.portfolio_id
+    transaction.on_commit(lambda: invalidate_portfolio(portfolio_id))
+
+
+@receiver(post_save, sender=Stock)
+def refresh_leaderboard_for_stock(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return  # No position can hold a stock that was just created
+    if update_fields is not None and 'current_price' not in update_fields:
+        return  # Analysis-only saves don't change any portfolio's value
+    transaction.on_commit(lambda: leaderboard.refresh_for_stocks([instance.id]))
+
+
+@receiver(post_save, sender=Stock)
+def refresh_stock_lookups_on_save(sender, instance, created, update_fields=None, **kwargs):
+    def refresh():
+        stock_search.stock_saved(instance, created, update_fields)
+        symbols.stock_changed(instance, created=created)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_delete, sender=Stock)
+def refresh_stock_lookups_on_delete(sender, instance, **kwargs):
+    def refresh():
+        stock_search.invalidate()
+        symbols.stock_changed(instance, deleted=True)
+
+    transaction.on_commit(refresh)
@@ -0,0 +1,79 @@
+import threading
+import time
+from concurrent.futures import Future
+from django.conf import settings
+from .caching import coordination
+
+
+# How often a worker waiting on another worker's fetch checks for its result
+POLL_SECONDS = 0.05
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical upstream fetches, so only one call per key
+    is in flight and every caller shares its result.
+
+    Within a process, the first caller of a key runs the fetch and later
+    callers wait on its Future. Across workers, the fetching process holds a
+    short-lived lock in the coordination cache; other workers poll the
+    shared cache for the result it publishes instead of calling upstream
+    themselves, and only fetch on their own if the lock is released or
+    expires without one. Without Redis the lock is per process, so each
+    worker makes at most one call per key.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fetch, lookup):
+        """
+        Return fetch() for key, sharing a single call among concurrent callers.
+        fetch must publish its result to the shared cache, where lookup()
+        finds it (returning None until then).
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = self._fetch_once(key, fetch, lookup)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _fetch_once(self, key, fetch, lookup):
+        lock_key = f'single_flight:{self.name}:{key}'
+        lock_seconds = getattr(settings, 'SINGLE_FLIGHT_LOCK_SECONDS', 10)
+        deadline = time.monotonic() + lock_seconds
+
+        while True:
+            # add is atomic, so one worker at a time owns the fetch
+            if coordination.add(lock_key, True, lock_seconds):
+                try:
+                    # Another worker may have published just before we got the lock
+                    value = lookup()
+                    return fetch() if value is None else value
+                finally:
+                    coordination.delete(lock_key)
+
+            if time.monotonic() >= deadline:
+                return fetch()
+
+            time.sleep(POLL_SECONDS)
+            value = lookup()
+            if value is not None:
+                return value
@@ -0,0 +1,193 @@
+import bisect
+import heapq
+import re
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from .models import Stock
+
+
+VERSION_KEY = 'stock_search:version'
+
+# Result tiers, best first
+EXACT_SYMBOL, SYMBOL_PREFIX, NAME_MATCH = range(3)
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def search(query, limit=20):
+    """
+    Stocks matching query, ranked exact symbol > symbol prefix > name match.
+
+    PostgreSQL answers from the trigram GIN indexes on symbol and name (see
+    migration 0010). Other databases use an in-process prefix index, built
+    on the first search and rebuilt in the background whenever a stock is
+    added or renamed in any worker; searches keep using the previous index
+    until the new one is ready.
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    if connection.vendor == 'postgresql':
+        return list(_database_search(query)[:limit])
+
+    ids = _get_index().search(query, limit)
+    stocks = Stock.objects.in_bulk(ids)
+    return [stocks[stock_id] for stock_id in ids if stock_id in stocks]
+
+
+def invalidate():
+    """Mark every process's in-memory index stale, e.g. after bulk writes to Stock"""
+    if not cache.add(VERSION_KEY, 1, None):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, None)
+
+
+def stock_saved(stock, created, update_fields=None):
+    """Invalidate the index when a save may have added or renamed a stock"""
+    if not created and update_fields is not None and not {'symbol', 'name'} & set(update_fields):
+        return
+    if not created and _index is not None and _index.entries.get(stock.id) == (stock.symbol, stock.name):
+        return
+    invalidate()
+
+
+def _database_search(query):
+    return (
+        Stock.objects.filter(Q(symbol__istartswith=query) | Q(name__icontains=query))
+        .annotate(rank=Case(
+            When(symbol__iexact=query, then=Value(EXACT_SYMBOL)),
+            When(symbol__istartswith=query, then=Value(SYMBOL_PREFIX)),
+            default=Value(NAME_MATCH),
+            output_field=IntegerField(),
+        ))
+        .order_by('rank', 'symbol')
+    )
+
+
+class PrefixIndex:
+    """
+    Sorted symbol and name-word arrays searched by binary search, which
+    answers prefix queries like a trie in O(log n + results).
+
+    Stocks are numbered in symbol order and each name word keeps a sorted
+    posting list of those numbers, so name matches come out already in
+    symbol order and the search stops as soon as it has enough.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[1].lower())
+        self.entries = {}
+        self.ids = []
+        self.symbol_keys = []
+        self.symbols = {}
+        self.words_of = []
+        postings = {}
+        for rank, (stock_id, symbol, name) in enumerate(rows):
+            key = symbol.lower()
+            words = tuple(dict.fromkeys(_WORD.findall((name or '').lower())))
+            self.entries[stock_id] = (symbol, name)
+            self.ids.append(stock_id)
+            self.symbol_keys.append(key)
+            self.symbols.setdefault(key, rank)
+            self.words_of.append(words)
+            for word in words:
+                postings.setdefault(word, []).append(rank)
+        self.words = sorted(postings)
+        self.postings = postings
+
+    def search(self, query, limit):
+        query = query.lower()
+        ranks = []
+        seen = set()
+
+        def add(rank):
+            if rank not in seen:
+                seen.add(rank)
+                ranks.append(rank)
+
+        if query in self.symbols:
+            add(self.symbols[query])
+
+        for rank in self._prefixed_range(self.symbol_keys, query):
+            if len(ranks) >= limit:
+                break
+            add(rank)
+
+        # Name matches: every word of the query must start a word of the name
+        words = _WORD.findall(query)
+        if words and len(ranks) < limit:
+            first, rest = words[0], words[1:]
+            streams = [self.postings[word] for word in self._prefixed(self.words, first)]
+            for rank in heapq.merge(*streams):
+                if len(ranks) >= limit:
+                    break
+                if rank in seen:
+                    continue
+                if all(any(word.startswith(part) for word in self.words_of[rank]) for part in rest):
+                    add(rank)
+
+        return [self.ids[rank] for rank in ranks]
+
+    def _prefixed_range(self, keys, prefix):
+        position = bisect.bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            yield position
+            position += 1
+
+    def _prefixed(self, keys, prefix):
+        for position in self._prefixed_range(keys, prefix):
+            yield keys[position]
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+_rebuilding = False
+
+
+def _get_index():
+    version = cache.get(VERSION_KEY, 0)
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _rebuild(version)
+    elif version != _index_version:
+        _rebuild_in_background(version)
+    return _index
+
+
+def _rebuild(version):
+    global _index, _index_version
+    index = PrefixIndex(Stock.objects.values_list('id', 'symbol', 'name').iterator())
+    _index, _index_version = index, version
+
+
+def _rebuild_in_background(version):
+    """Start a rebuild unless this process already runs one; with BACKGROUND_JOBS_EAGER it runs inline"""
+    global _rebuilding
+    if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        _rebuild(version)
+        return
+
+    with _index_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+
+    def run():
+        global _rebuilding
+        try:
+            _rebuild(version)
+        except Exception as e:
+            print(f"Failed to rebuild the stock search index: {e}")
+        finally:
+            _rebuilding = False
+            connection.close()
+
+    threading.Thread(target=run, name='stock-search-rebuild', daemon=True).start()
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .caching import CacheNamespace
+from .models import Stock
+from .ticker_snapshot import TickerSnapshot
+from .upstream import UpstreamUnavailable
+
+
+# Symbols the market data provider doesn't know, shared by all workers
+unknown_symbols = CacheNamespace('unknown_symbols')
+
+
+class SymbolNotFound(LookupError):
+    pass
+
+
+class StockLRU:
+    """
+    Small in-process LRU of Stock rows by symbol. Entries expire after the
+    freshness window, so a row changed or deleted by another worker is
+    never served for longer than that. The size may be given as a setting
+    name, read whenever the LRU checks its capacity.
+    """
+
+    def __init__(self, max_size, max_size_setting=None):
+        self._max_size = max_size
+        self._max_size_setting = max_size_setting
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        if self._max_size_setting is None:
+            return self._max_size
+        return getattr(settings, self._max_size_setting, self._max_size)
+
+    def get(self, symbol, max_age):
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is None:
+                return None
+            stock, stored_at = entry
+            if time.monotonic() - stored_at > max_age:
+                del self._entries[symbol]
+                return None
+            self._entries.move_to_end(symbol)
+        return _copy(stock)
+
+    def put(self, stock):
+        # Entries are private copies, so callers can't modify them afterwards
+        stock = _copy(stock)
+        with self._lock:
+            self._entries[stock.symbol] = (stock, time.monotonic())
+            self._entries.move_to_end(stock.symbol)
+            max_size = self.max_size
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, symbol):
+        with self._lock:
+            self._entries.pop(symbol, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+lru = StockLRU(2048, max_size_setting='SYMBOL_LRU_SIZE')
+
+
+def lookup(symbol):
+    """
+    Return the Stock for symbol with quote data no older than
+    SYMBOL_FRESHNESS_SECONDS: from the in-process LRU, else from the Stock
+    table, else from the market data provider (written through to both).
+    While the provider is unavailable a stale stored row is returned instead.
+    Raises SymbolNotFound for symbols the provider doesn't know; those are
+    remembered for SYMBOL_NEGATIVE_CACHE_SECONDS.
+    """
+    freshness = getattr(settings, 'SYMBOL_FRESHNESS_SECONDS', 300)
+
+    stock = lru.get(symbol, freshness)
+    if stock is not None and _is_fresh(stock, freshness):
+        return stock
+
+    if unknown_symbols.get(symbol):
+        raise SymbolNotFound(symbol)
+
+    stock = Stock.objects.filter(symbol=symbol).first()
+    if stock is not None and _is_fresh(stock, freshness):
+        lru.put(stock)
+        return stock
+
+    try:
+        info = TickerSnapshot(symbol).info()
+    except UpstreamUnavailable:
+        if stock is None:
+            raise
+        # A stale stored quote beats waiting on an upstream that is down
+        return stock
+    if not info.get('symbol'):
+        unknown_symbols.set(
+            symbol, True, timeout=getattr(settings, 'SYMBOL_NEGATIVE_CACHE_SECONDS', 3600)
+        )
+        raise SymbolNotFound(symbol)
+
+    stock_data = {
+        'name': info.get('longName', symbol),
+        'exchange': info.get('exchange', ''),
+        'current_price': info.get('currentPrice') or info.get('regularMarketPrice'),
+        'last_updated': timezone.now(),
+    }
+    stock, created = Stock.objects.get_or_create(symbol=symbol, defaults=stock_data)
+    if not created:
+        for key, value in stock_data.items():
+            if value:
+                setattr(stock, key, value)
+        stock.save(update_fields=list(stock_data))
+
+    # The save signal puts the row in the LRU once it is committed
+    return stock
+
+
+def get_or_create_stock(symbol):
+    """Stock row for symbol, created with the symbol as its name if missing"""
+    freshness = getattr(settings, 'SYMBOL_FRESHNESS_SECONDS', 300)
+    stock = lru.get(symbol, freshness)
+    if stock is None:
+        stock, created = Stock.objects.get_or_create(symbol=symbol, defaults={'name': symbol})
+        if not created:
+            lru.put(stock)
+    return stock
+
+
+def stock_changed(stock, created=False, deleted=False):
+    """Keep this process's LRU in step with a saved or deleted row"""
+    if deleted:
+        lru.discard(stock.symbol)
+        return
+    lru.put(stock)
+    if created:
+        unknown_symbols.delete(stock.symbol)
+
+
+def _copy(stock):
+    fields = [field.attname for field in Stock._meta.concrete_fields]
+    return Stock.from_db(stock._state.db, fields, [getattr(stock, name) for name in fields])
+
+
+def _is_fresh(stock, freshness):
+    return stock.last_updated is not None and timezone.now() - stock.last_updated <= timedelta(seconds=freshness)
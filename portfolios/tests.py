@@ -1,3 +1,1314 @@
-from django.test import TestCase
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import caching, jobs, movers, price_history, stock_search, symbols, ticker_snapshot, trades, upstream
+from .async_api import gather_limited
+from .market_data import FixtureProvider, RecordingProvider
+from .csv_parser import CSVPortfolioParser, ImportNotInPreview, create_positions_from_import
+from .models import BackgroundJob, Portfolio, PortfolioImport, Position, PriceBar, Stock, Trade
+from .performance import PerformanceEngine
+from .quotes import QuoteEngine, MarketDataQuoteProvider
+from .ticker_snapshot import TickerSnapshot
+from .views import fetch_analyst_and_options_data
 
-# Create your tests here.
+
+class FakeQuoteProvider:
+    """Quote provider serving canned info dicts without touching the network"""
+
+    def __init__(self, quotes):
+        self.quotes = quotes
+        self.calls = []
+
+    def fetch_quote(self, symbol):
+        self.calls.append(symbol)
+        if symbol not in self.quotes:
+            raise ValueError(f'Unknown symbol {symbol}')
+        return self.quotes[symbol]
+
+
+class QuoteEngineTests(TestCase):
+    def setUp(self):
+        self.aapl = Stock.objects.create(symbol='AAPL', name='AAPL')
+        self.msft = Stock.objects.create(symbol='MSFT', name='MSFT')
+        self.bad = Stock.objects.create(symbol='BAD', name='BAD')
+
+    def test_refresh_updates_prices_and_reports_failures(self):
+        provider = FakeQuoteProvider({
+            'AAPL': {'currentPrice': 190.5, 'longName': 'Apple Inc.', 'exchange': 'NMS'},
+            'MSFT': {'regularMarketPrice': 410.25, 'longName': 'Microsoft Corporation'},
+        })
+        engine = QuoteEngine(provider=provider, max_workers=2)
+
+        # Stocks are written back with a single bulk UPDATE, plus the
+        # lookup of portfolios whose leaderboard entries need refreshing
+        with self.assertNumQueries(2), self.captureOnCommitCallbacks(execute=True):
+            result = async_to_sync(engine.arefresh)([self.aapl, self.msft, self.bad, self.aapl])
+
+        self.assertEqual(sorted(result.updated), ['AAPL', 'MSFT'])
+        self.assertIn('BAD', result.failed)
+        self.assertEqual(set(result.latencies), {'AAPL', 'MSFT', 'BAD'})
+        self.assertEqual(sorted(provider.calls), ['AAPL', 'BAD', 'MSFT'])
+
+        self.aapl.refresh_from_db()
+        self.assertEqual(self.aapl.current_price, Decimal('190.5000'))
+        self.assertEqual(self.aapl.name, 'Apple Inc.')
+        self.assertIsNotNone(self.aapl.last_updated)
+
+    def test_missing_price_is_reported_as_failure(self):
+        provider = FakeQuoteProvider({'AAPL': {'longName': 'Apple Inc.'}})
+        result = async_to_sync(QuoteEngine(provider=provider).arefresh)([self.aapl])
+
+        self.assertEqual(result.updated, [])
+        self.assertEqual(result.failed, {'AAPL': 'No price available'})
+
+
+class PerformanceEngineTests(SimpleTestCase):
+    def setUp(self):
+        dates = pd.to_datetime(['2025-01-02', '2025-01-03', '2025-01-06', '2025-01-07'])
+        self.histories = {
+            'AAA': pd.DataFrame({'Close': [10.0, 11.0, 12.0, 13.0]}, index=dates),
+            # Starts late and skips a day, so it is forward filled
+            'BBB': pd.DataFrame({'Close': [100.0, 105.0]}, index=dates[[1, 3]]),
+        }
+        self.calls = []
+
+    def fetch(self, symbol, period):
+        self.calls.append(symbol)
+        return self.histories[symbol]
+
+    def test_values_are_aligned_and_forward_filled(self):
+        engine = PerformanceEngine(self.fetch)
+        result = engine.compute([('AAA', 2), ('BBB', Decimal('1'))], '1mo', fallback_value=50)
+
+        self.assertEqual(result['dates'], ['2025-01-02', '2025-01-03', '2025-01-06', '2025-01-07'])
+        self.assertEqual(result['values'], [50.0, 122.0, 124.0, 131.0])
+        self.assertEqual(result['current_value'], 131.0)
+        self.assertEqual(self.calls, ['AAA', 'BBB'])
+
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+
+    def fetch(self, symbols, start_date):
+        self.requests.append((symbols, start_date))
+        dates = pd.to_datetime(['2025-01-02', '2025-01-03'])
+        return {
+            symbol: pd.DataFrame({
+                'Open': [1.0, 2.0], 'High': [1.5, 2.5], 'Low': [0.5, 1.5],
+                'Close': [1.25, 2.25], 'Volume': [100, 200],
+            }, index=dates)
+            for symbol in symbols if symbol != 'MISSING'
+        }
+
+    def test_backfill_only_requests_bars_after_last_stored(self):
+        PriceBar.objects.create(symbol='AAA', date=date(2025, 1, 2), close=Decimal('1.1'))
+
+        failed = price_history.backfill(['AAA', 'BBB', 'MISSING'], fetch_histories=self.fetch)
+
+        # Stored symbols resume from their last bar, new ones share one batch
+        self.assertEqual(self.requests[0], (['AAA'], date(2025, 1, 2)))
+        self.assertEqual(self.requests[1][0], ['BBB', 'MISSING'])
+        self.assertEqual(failed, ['MISSING'])
+        self.assertEqual(PriceBar.objects.get(symbol='AAA', date=date(2025, 1, 2)).close, Decimal('1.2500'))
+
+        # Recently checked symbols are served from the store without going upstream
+        histories = price_history.get_history(['AAA', 'BBB'], fetch_histories=self.fetch)
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(histories['BBB']['Close'].tolist(), [1.25, 2.25])
+
+
+class PortfolioTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_portfolio(self, name, holdings):
+        portfolio = Portfolio.objects.create(name=name, user=self.user)
+        for symbol, quantity, purchase_price, current_price in holdings:
+            stock, _ = Stock.objects.get_or_create(symbol=symbol, defaults={'name': symbol})
+            stock.current_price = current_price
+            stock.save()
+            Position.objects.create(
+                portfolio=portfolio, stock=stock, quantity=quantity,
+                purchase_price=purchase_price, purchase_date=date(2025, 1, 2)
+            )
+        return portfolio
+
+    def test_annotated_totals_match_python_totals(self):
+        portfolio = self.create_portfolio('Growth', [
+            ('AAA', Decimal('10'), Decimal('5'), Decimal('7.5')),
+            ('BBB', Decimal('2.5'), Decimal('100'), None),
+        ])
+        annotated = Portfolio.objects.with_totals().get(pk=portfolio.pk)
+
+        self.assertEqual(annotated.total_value, portfolio.total_value)
+        self.assertEqual(annotated.total_cost, portfolio.total_cost)
+        self.assertEqual(annotated.total_gain_loss, Decimal('-225'))
+        self.assertEqual(annotated.position_count, 2)
+        self.assertEqual(Portfolio.objects.with_totals().get(
+            pk=Portfolio.objects.create(name='Empty', user=self.user).pk
+        ).total_value, Decimal('0'))
+
+    def test_list_query_count_is_constant(self):
+        for i in range(5):
+            self.create_portfolio(f'P{i}', [
+                (f'S{i}{j}', Decimal('1'), Decimal('10'), Decimal('12')) for j in range(4)
+            ])
+
+        # One COUNT for pagination and one annotated SELECT
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/portfolios/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['total_value'], '48.00')
+        self.assertEqual(response.data['results'][0]['position_count'], 4)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='secret-pass-123')
+        self.stock = Stock.objects.create(symbol='AAA', name='AAA', current_price=Decimal('10'))
+
+    def create_portfolio(self, name, purchase_price):
+        portfolio = Portfolio.objects.create(name=name, user=self.user)
+        Position.objects.create(
+            portfolio=portfolio, stock=self.stock, quantity=Decimal('10'),
+            purchase_price=purchase_price, purchase_date=date(2025, 1, 2)
+        )
+        return portfolio
+
+    def test_leaderboard_tracks_positions_and_prices(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_portfolio('Winner', Decimal('5'))
+            self.create_portfolio('Loser', Decimal('20'))
+            Portfolio.objects.create(name='Empty', user=self.user)
+
+        response = APIClient().get('/api/top-portfolios/')
+        self.assertEqual([row['name'] for row in response.data], ['Winner', 'Loser'])
+        self.assertEqual(response.data[0]['percentage_gain'], 100.0)
+
+        # A price change re-ranks the portfolios holding the stock
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.current_price = Decimal('2.5')
+            self.stock.save()
+
+        with self.assertNumQueries(1):
+            response = APIClient().get('/api/top-portfolios/')
+        self.assertEqual(response.data[0]['percentage_gain'], -50.0)
+        self.assertEqual(response.data[1]['total_value'], 25.0)
+
+        # Analysis-only saves leave the leaderboard alone: just the UPDATE
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            self.stock.analyst_count = 7
+            self.stock.save(update_fields=['analyst_count'])
+
+
+@override_settings(MARKET_MOVERS_TICKERS=['UP', 'DOWN', 'FLAT'])
+class MarketMoversTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        today = timezone.now().date()
+        for symbol, closes in {'UP': (10, 11), 'DOWN': (10, 8), 'FLAT': (5, 5)}.items():
+            for offset, close in zip((1, 0), closes):
+                PriceBar.objects.create(symbol=symbol, date=today - timedelta(days=offset), close=close)
+            # Mark as recently backfilled so nothing goes upstream
+            price_history.mark_checked([symbol])
+
+    def test_rebuild_ranks_gainers_and_losers(self):
+        data = movers.rebuild(quote_provider=FakeQuoteProvider({'UP': {'longName': 'Up Corp'}}))
+
+        self.assertEqual([row['symbol'] for row in data['gainers']], ['UP'])
+        self.assertEqual(data['gainers'][0]['name'], 'Up Corp')
+        self.assertAlmostEqual(data['gainers'][0]['change_percent'], 10.0)
+        self.assertEqual([row['symbol'] for row in data['losers']], ['DOWN'])
+        self.assertEqual(data['losers'][0]['name'], 'DOWN')
+
+    def test_stale_snapshot_is_served_while_refreshing(self):
+        stale = {'gainers': [], 'losers': [], 'last_updated': 'earlier'}
+        movers.snapshot_cache.set(movers.SNAPSHOT_KEY, {'data': stale, 'built_at': time.time() - 3600})
+
+        with mock.patch.object(movers, 'refresh_in_background') as refresh:
+            response = APIClient().get('/api/market-movers/')
+
+        self.assertEqual(response.data, stale)
+        refresh.assert_called_once_with()
+
+
+class PortfolioDetailQueryTests(TestCase):
+    def test_detail_runs_in_fixed_query_budget(self):
+        user = User.objects.create_user('carol', password='secret-pass-123')
+        portfolio = Portfolio.objects.create(name='Broad', user=user)
+        stocks = Stock.objects.bulk_create([
+            Stock(symbol=f'S{i:03d}', name=f'Stock {i}', current_price=Decimal('11'))
+            for i in range(200)
+        ])
+        Position.objects.bulk_create([
+            Position(
+                portfolio=portfolio, stock=stock, quantity=Decimal('2'),
+                purchase_price=Decimal('10'), purchase_date=date(2025, 1, 2)
+            )
+            for stock in stocks
+        ])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        # Annotated portfolio with its user, then positions joined to stocks
+        with self.assertNumQueries(2):
+            response = client.get(f'/api/portfolios/{portfolio.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['positions']), 200)
+        self.assertEqual(response.data['position_count'], 200)
+        self.assertEqual(response.data['total_value'], '4400.00')
+        self.assertEqual(response.data['positions'][0]['gain_loss'], '2.00')
+
+
+# Imports validate dozens of symbols at once, faster than the upstream rate limit
+@override_settings(MARKET_DATA_RATE_LIMIT_PER_SECOND=0)
+class CSVImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('dave', password='secret-pass-123')
+        self.portfolio = Portfolio.objects.create(name='Imported', user=user)
+
+    def make_upload(self, rows):
+        lines = ['Symbol,Quantity,Purchase Price,Purchase Date']
+        lines += [f'{symbol},{quantity},{price},2025-01-02' for symbol, quantity, price in rows]
+        return SimpleUploadedFile('holdings.csv', '\n'.join(lines).encode('utf-8'))
+
+    def fake_ticker(self, symbol):
+        info = {} if symbol == 'NOPE' else {'symbol': symbol, 'longName': f'{symbol} Inc.'}
+        return mock.Mock(info=info)
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_rows_are_streamed_into_the_row_table(self, ticker):
+        ticker.side_effect = self.fake_ticker
+        rows = [(f'S{i % 7}', 1, 10) for i in range(25)] + [('NOPE', 1, 1), ('BAD', -3, 1)]
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+
+        with mock.patch.object(CSVPortfolioParser, 'CHUNK_SIZE', 4):
+            result = CSVPortfolioParser(self.make_upload(rows), 'holdings.csv', portfolio_import).parse_and_validate()
+
+        self.assertTrue(result['success'])
+        self.assertEqual((result['total_rows'], result['valid_rows'], result['error_rows']), (27, 25, 2))
+        self.assertEqual(len(result['data']), CSVPortfolioParser.PREVIEW_SAMPLE_SIZE)
+        # Each distinct symbol is looked up once across all chunks
+        self.assertEqual(ticker.call_count, 8)
+        self.assertEqual(portfolio_import.rows.count(), 27)
+        self.assertEqual(portfolio_import.rows.filter(has_errors=True).count(), 2)
+        self.assertNotIn('valid_rows', portfolio_import.preview_data)
+
+        outcome = create_positions_from_import(portfolio_import)
+        self.assertTrue(outcome['success'])
+        self.assertEqual(self.portfolio.positions.count(), 7)
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_confirm_merges_rows_with_existing_positions_in_bulk(self, ticker):
+        ticker.side_effect = self.fake_ticker
+        existing = Stock.objects.create(symbol='AAA', name='AAA')
+        Position.objects.create(
+            portfolio=self.portfolio, stock=existing, quantity=Decimal('10'),
+            purchase_price=Decimal('10'), purchase_date=date(2025, 1, 5)
+        )
+        rows = [('AAA', 10, 20), ('AAA', 20, 2)] + [(f'N{i}', 1, 3) for i in range(50)]
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+        CSVPortfolioParser(self.make_upload(rows), 'holdings.csv', portfolio_import).parse_and_validate()
+
+        # Query count does not depend on the number of rows or symbols
+        with self.assertNumQueries(14):
+            outcome = create_positions_from_import(portfolio_import)
+
+        self.assertEqual(outcome['created_positions'], 52)
+        self.assertEqual(self.portfolio.positions.count(), 51)
+        position = self.portfolio.positions.get(stock__symbol='AAA')
+        self.assertEqual(position.quantity, Decimal('40'))
+        self.assertEqual(position.purchase_price, Decimal('8.5000'))
+        self.assertEqual(position.purchase_date, date(2025, 1, 2))
+        # Every applied row is a buy in the ledger
+        self.assertEqual(self.portfolio.trades.filter(side='buy').count(), 52)
+        self.assertEqual(
+            list(self.portfolio.trades.filter(symbol='AAA').values_list('quantity', flat=True)),
+            [Decimal('10'), Decimal('20')]
+        )
+
+        # A second (double-clicked) confirm of the same import is refused
+        with self.assertRaises(ImportNotInPreview):
+            create_positions_from_import(portfolio_import)
+        self.assertEqual(self.portfolio.positions.get(stock__symbol='AAA').quantity, Decimal('40'))
+        portfolio_import.refresh_from_db()
+        self.assertEqual(portfolio_import.status, 'completed')
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_confirm_refuses_positions_past_the_quantity_limit(self, ticker):
+        ticker.side_effect = self.fake_ticker
+        stock = Stock.objects.create(symbol='AAA', name='AAA')
+        position = Position.objects.create(
+            portfolio=self.portfolio, stock=stock, quantity=trades.MAX_AMOUNT,
+            purchase_price=Decimal('1'), purchase_date=date(2025, 1, 5)
+        )
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+        rows = [('AAA', 1, 1), ('BBB', 1, 1)]
+        CSVPortfolioParser(self.make_upload(rows), 'holdings.csv', portfolio_import).parse_and_validate()
+
+        outcome = create_positions_from_import(portfolio_import)
+
+        self.assertFalse(outcome['success'])
+        self.assertIn('AAA: position quantity must be at most', outcome['error'])
+        position.refresh_from_db()
+        self.assertEqual(position.quantity, trades.MAX_AMOUNT)
+        self.assertEqual(self.portfolio.positions.count(), 1)
+        self.assertFalse(self.portfolio.trades.exists())
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_confirm_clears_negative_lookups_of_new_symbols(self, ticker):
+        ticker.side_effect = self.fake_ticker
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+        CSVPortfolioParser(self.make_upload([('NEW', 1, 10)]), 'holdings.csv', portfolio_import).parse_and_validate()
+        # Another worker failed to find the symbol between preview and confirm
+        symbols.unknown_symbols.set('NEW', True)
+
+        with mock.patch.object(stock_search, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                create_positions_from_import(portfolio_import)
+
+        invalidate.assert_called_once()
+        self.assertIsNone(symbols.unknown_symbols.get('NEW'))
+        self.assertEqual(symbols.lookup('NEW').symbol, 'NEW')
+
+    @override_settings(CSV_VALIDATION_TIME_BUDGET_SECONDS=0.2)
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_symbols_are_resolved_locally_and_slow_lookups_left_unverified(self, ticker):
+        release = threading.Event()
+
+        def slow_ticker(symbol):
+            if symbol == 'SLOW':
+                release.wait(5)
+            return self.fake_ticker(symbol)
+
+        ticker.side_effect = slow_ticker
+        Stock.objects.create(symbol='AAA', name='Triple A')
+        rows = [('AAA', 1, 10), ('FAST', 1, 10), ('SLOW', 1, 10), ('NOPE', 1, 10)]
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+
+        started = time.monotonic()
+        result = CSVPortfolioParser(self.make_upload(rows), 'holdings.csv', portfolio_import).parse_and_validate()
+        release.set()
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertNotIn(mock.call('AAA'), ticker.call_args_list)
+        self.assertEqual((result['valid_rows'], result['error_rows'], result['unverified_rows']), (3, 1, 1))
+        data = {row['symbol']: row for row in portfolio_import.rows.values_list('data', flat=True)}
+        self.assertEqual(data['AAA']['stock_name'], 'Triple A')
+        self.assertEqual(data['FAST']['stock_name'], 'FAST Inc.')
+        self.assertTrue(data['SLOW']['unverified'])
+        self.assertTrue(symbols.unknown_symbols.get('NOPE'))
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_validation_shares_cached_ticker_snapshots(self, ticker):
+        ticker.side_effect = self.fake_ticker
+        TickerSnapshot('AAA').info()
+        ticker.reset_mock()
+
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+        rows = [('AAA', 1, 10), ('BBB', 1, 10)]
+        result = CSVPortfolioParser(self.make_upload(rows), 'holdings.csv', portfolio_import).parse_and_validate()
+
+        self.assertEqual(result['valid_rows'], 2)
+        self.assertEqual(ticker.call_args_list, [mock.call('BBB')])
+        # And the quote it fetched is there for the next reader
+        TickerSnapshot('BBB').info()
+        self.assertEqual(ticker.call_count, 1)
+
+
+@override_settings(BACKGROUND_JOBS_EAGER=True)
+class BackgroundJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('erin', password='secret-pass-123')
+        self.portfolio = Portfolio.objects.create(name='Jobs', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_csv_import_is_parsed_in_the_background(self, ticker):
+        ticker.return_value = mock.Mock(info={'symbol': 'AAA', 'longName': 'AAA Inc.'})
+        upload = SimpleUploadedFile('holdings.csv', b'Symbol,Quantity,Purchase Price\nAAA,5,10\nAAA,-3,1\n')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/portfolios/{self.portfolio.id}/import-csv/', {'csv_file': upload}, format='multipart'
+            )
+
+        self.assertEqual(response.status_code, 202)
+        status_response = self.client.get(f"/api/imports/{response.data['import_id']}/status/")
+        self.assertEqual(status_response.data['status'], 'preview')
+        self.assertEqual(status_response.data['processed_rows'], 2)
+        self.assertEqual(status_response.data['preview']['valid_rows'], 1)
+        self.assertEqual(len(status_response.data['preview']['sample_data']), 2)
+
+    def test_uploads_that_are_never_queued_are_removed(self):
+        upload = SimpleUploadedFile('holdings.csv', b'Symbol,Quantity,Purchase Price\nAAA,5,10\n')
+
+        with mock.patch.object(jobs, 'submit', side_effect=RuntimeError('pool is shut down')) as submit:
+            response = self.client.post(
+                f'/api/portfolios/{self.portfolio.id}/import-csv/', {'csv_file': upload}, format='multipart'
+            )
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(os.path.exists(submit.call_args.args[2]))
+        self.assertFalse(PortfolioImport.objects.exists())
+
+    @mock.patch('portfolios.views.fetch_analyst_and_options_data', return_value=True)
+    def test_stock_analysis_refresh_reports_progress(self, fetch):
+        stock = Stock.objects.create(symbol='AAA', name='AAA')
+        Position.objects.create(
+            portfolio=self.portfolio, stock=stock, quantity=Decimal('1'),
+            purchase_price=Decimal('1'), purchase_date=date(2025, 1, 2)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/refresh-stock-analysis/')
+
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(f"/api/jobs/{response.data['job_id']}/").data
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual((job['progress_current'], job['progress_total']), (1, 1))
+        self.assertEqual(job['result']['updated_stocks'], ['AAA'])
+        self.assertFalse(BackgroundJob.objects.exclude(user=self.user).exists())
+
+    def test_jobs_lost_with_their_worker_are_reported_failed(self):
+        job = BackgroundJob.objects.create(user=self.user, kind='stock_analysis', status='running')
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+
+        self.assertEqual(self.client.get(f'/api/jobs/{job.id}/').data['status'], 'running')
+
+        long_ago = timezone.now() - timedelta(hours=1)
+        BackgroundJob.objects.filter(pk=job.pk).update(updated_at=long_ago)
+        PortfolioImport.objects.filter(pk=portfolio_import.pk).update(updated_at=long_ago)
+
+        job_status = self.client.get(f'/api/jobs/{job.id}/').data
+        self.assertEqual(job_status['status'], 'failed')
+        self.assertEqual(job_status['error'], jobs.STALE_MESSAGE)
+        import_status = self.client.get(f'/api/imports/{portfolio_import.id}/status/').data
+        self.assertEqual(import_status['status'], 'failed')
+
+        # The worker picking it up late leaves it failed
+        jobs.run_stock_analysis_refresh(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_jobs_failed_as_stale_while_running_stay_failed(self):
+        stock = Stock.objects.create(symbol='AAA', name='AAA')
+        Position.objects.create(
+            portfolio=self.portfolio, stock=stock, quantity=Decimal('1'),
+            purchase_price=Decimal('1'), purchase_date=date(2025, 1, 2)
+        )
+        job = BackgroundJob.objects.create(user=self.user, kind='stock_analysis')
+
+        def stall(stock):
+            # A poll gives up on the job while its worker is still busy
+            BackgroundJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+            jobs.fail_if_stale(BackgroundJob.objects.get(pk=job.pk))
+            return True
+
+        with mock.patch('portfolios.views.fetch_analyst_and_options_data', side_effect=stall):
+            jobs.run_stock_analysis_refresh(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', jobs.STALE_MESSAGE))
+        self.assertIsNone(job.result)
+
+
+class TickerSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_each_resource_is_fetched_once_per_refresh(self, ticker_class):
+        ticker = ticker_class.return_value
+        info = mock.PropertyMock(return_value={'currentPrice': 10, 'targetMeanPrice': 12})
+        type(ticker).info = info
+        ticker.recommendations = pd.DataFrame([{'strongBuy': 3, 'buy': 2, 'hold': 1, 'sell': 0, 'strongSell': 0}])
+        ticker.options = ('2025-01-17',)
+        ticker.option_chain.return_value = mock.Mock(
+            calls=pd.DataFrame({'volume': [100, 50]}), puts=pd.DataFrame({'volume': [30, 45]})
+        )
+        stock = Stock.objects.create(symbol='AAA', name='AAA')
+
+        engine = QuoteEngine(provider=MarketDataQuoteProvider(), enrich=fetch_analyst_and_options_data)
+        async_to_sync(engine.arefresh)([stock])
+        async_to_sync(engine.arefresh)([stock])
+
+        # Quote and target price share one info fetch, and the second
+        # refresh is served entirely from the per-resource cache
+        self.assertEqual(info.call_count, 1)
+        self.assertEqual(ticker.option_chain.call_count, 1)
+        stock.refresh_from_db()
+        self.assertEqual(stock.analyst_recommendation, 'Buy')
+        self.assertEqual(stock.analyst_target_price, Decimal('12.0000'))
+        self.assertEqual(stock.put_call_ratio, Decimal('0.5000'))
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_none_results_are_cached(self, ticker_class):
+        recommendations = mock.PropertyMock(return_value=None)
+        type(ticker_class.return_value).recommendations = recommendations
+
+        self.assertIsNone(TickerSnapshot('AAA').recommendations())
+        self.assertIsNone(TickerSnapshot('AAA').recommendations())
+        self.assertEqual(recommendations.call_count, 1)
+
+    def test_concurrent_misses_share_one_upstream_call(self):
+        release = threading.Event()
+        provider = mock.Mock()
+
+        def get_quotes(symbols):
+            release.wait(5)
+            return {symbol: {'symbol': symbol, 'currentPrice': 10} for symbol in symbols}
+
+        provider.get_quotes.side_effect = get_quotes
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(TickerSnapshot('AAA', provider=provider).info()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(provider.get_quotes.call_count, 1)
+        self.assertEqual([info['currentPrice'] for info in results], [10] * 8)
+
+    def test_waits_for_the_fetch_of_another_worker(self):
+        provider = mock.Mock()
+        # Another worker holds the lock and publishes its result a little later
+        cache.add('single_flight:ticker_snapshot:AAA:info', True, 10)
+        publish = threading.Timer(
+            0.1, lambda: ticker_snapshot.snapshot_cache.set('AAA:info', ({'currentPrice': 11},))
+        )
+        publish.start()
+
+        info = TickerSnapshot('AAA', provider=provider).info()
+
+        publish.join()
+        self.assertEqual(info, {'currentPrice': 11})
+        provider.get_quotes.assert_not_called()
+
+
+class CacheNamespaceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_scoped_invalidation_leaves_other_scopes(self):
+        namespace = caching.CacheNamespace('test_family', timeout=60)
+        namespace.set('news', 'one', scope=1)
+        namespace.set('news', 'two', scope=2)
+
+        namespace.invalidate(scope=1)
+
+        self.assertIsNone(namespace.get('news', scope=1))
+        self.assertEqual(namespace.get('news', scope=2), 'two')
+        namespace.invalidate()
+        self.assertIsNone(namespace.get('news', scope=2))
+
+    def test_timeout_setting_is_read_on_use(self):
+        namespace = caching.CacheNamespace('test_family', timeout=60, timeout_setting='TEST_FAMILY_SECONDS')
+        self.assertEqual(namespace.timeout, 60)
+        with override_settings(TEST_FAMILY_SECONDS=5):
+            self.assertEqual(namespace.timeout, 5)
+
+    def test_stats_endpoint_reports_hit_rate_for_admins(self):
+        caching.stats.reset()
+        namespace = caching.CacheNamespace('test_family')
+        namespace.set('key', 'value')
+        namespace.get('key')
+        namespace.get('missing')
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('member', password='x'))
+        self.assertEqual(client.get('/api/admin/cache-stats/').status_code, 403)
+
+        client.force_authenticate(User.objects.create_superuser('admin', password='x'))
+        families = client.get('/api/admin/cache-stats/').json()['families']
+        self.assertEqual(families['test_family']['hits'], 1)
+        self.assertEqual(families['test_family']['misses'], 1)
+        self.assertEqual(families['test_family']['hit_rate'], 0.5)
+
+
+class PortfolioCacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        symbols.lru.clear()
+        self.user = User.objects.create_user('erin', password='secret-pass-123')
+        self.portfolio = Portfolio.objects.create(name='Cached', user=self.user)
+        self.stock = Stock.objects.create(symbol='AAA', name='AAA')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cache_responses(self):
+        caching.news_cache.set('news', ['article'], scope=self.portfolio.id)
+        caching.performance_cache.set('1mo', {'dates': ['2025-01-02']}, scope=self.portfolio.id)
+
+    def assert_invalidated(self):
+        self.assertIsNone(caching.news_cache.get('news', scope=self.portfolio.id))
+        self.assertIsNone(caching.performance_cache.get('1mo', scope=self.portfolio.id))
+
+    def test_position_changes_invalidate_after_commit(self):
+        other = Portfolio.objects.create(name='Other', user=self.user)
+        caching.news_cache.set('news', ['other'], scope=other.id)
+        self.cache_responses()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/portfolios/{self.portfolio.id}/add_position/', {
+                'stock_symbol': 'AAA', 'quantity': '5', 'purchase_price': '10', 'purchase_date': '2025-01-02'
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assert_invalidated()
+        self.assertEqual(caching.news_cache.get('news', scope=other.id), ['other'])
+
+        position_id = response.json()['id']
+        self.cache_responses()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/portfolios/sell_position/', {
+                'position_id': position_id, 'quantity': '2', 'sell_price': '12'
+            })
+        self.assertEqual(response.json()['position_action'], 'updated')
+        self.assert_invalidated()
+
+        self.cache_responses()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/positions/{position_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_invalidated()
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_bulk_import_invalidates(self, ticker):
+        ticker.return_value = mock.Mock(info={'symbol': 'AAA', 'longName': 'AAA Inc.'})
+        portfolio_import = PortfolioImport.objects.create(portfolio=self.portfolio, filename='holdings.csv')
+        upload = SimpleUploadedFile(
+            'holdings.csv', b'Symbol,Quantity,Purchase Price,Purchase Date\nAAA,1,10,2025-01-02'
+        )
+        CSVPortfolioParser(upload, 'holdings.csv', portfolio_import).parse_and_validate()
+        self.cache_responses()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_positions_from_import(portfolio_import)
+        self.assert_invalidated()
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_worker_boot_does_not_import_market_data_libraries(self):
+        probe = (
+            'import os, sys; os.environ.setdefault("DJANGO_SETTINGS_MODULE", "portfolio_api.settings"); '
+            'from portfolio_api.asgi import application; import portfolio_api.urls; '
+            'print(",".join(m for m in ("yfinance", "pandas", "numpy") if m in sys.modules))'
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', probe], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(output.stdout.strip(), '')
+
+
+class RecordedMarketData:
+    """Upstream stand-in for recording, with values no synthetic data would produce"""
+
+    def get_quotes(self, symbols):
+        return {symbol: {'symbol': symbol, 'longName': 'Recorded Corp'} for symbol in symbols}
+
+    def get_histories(self, symbols, start_date):
+        dates = pd.to_datetime(['2025-01-02', '2025-01-03']).tz_localize('America/New_York')
+        return {symbol: pd.DataFrame({'Close': [1.5, 2.5], 'Volume': [10, 20]}, index=dates) for symbol in symbols}
+
+
+class MarketDataProviderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'market_data.json')
+
+    def test_fixture_provider_is_deterministic(self):
+        quotes = FixtureProvider(path=self.path).get_quotes(['AAA', 'BBB'])
+        self.assertEqual(quotes, FixtureProvider(path=self.path).get_quotes(['AAA', 'BBB']))
+        self.assertNotEqual(quotes['AAA']['currentPrice'], quotes['BBB']['currentPrice'])
+
+        history = FixtureProvider(path=self.path).get_histories(['AAA'], date(2024, 1, 2))['AAA']
+        self.assertEqual(history.index[0], pd.Timestamp('2024-01-02'))
+        self.assertAlmostEqual(history['Close'].iloc[-1], quotes['AAA']['currentPrice'], places=2)
+
+    def test_recorded_responses_are_replayed(self):
+        recorder = RecordingProvider(provider=RecordedMarketData(), path=self.path)
+        recorder.get_quotes(['AAA'])
+        recorder.get_histories(['AAA'], date(2025, 1, 2))
+
+        replay = FixtureProvider(path=self.path)
+        self.assertEqual(replay.get_quotes(['AAA'])['AAA']['longName'], 'Recorded Corp')
+        history = replay.get_histories(['AAA'], date(2025, 1, 1))['AAA']
+        self.assertEqual(history['Close'].tolist(), [1.5, 2.5])
+        self.assertEqual([d.date() for d in history.index], [date(2025, 1, 2), date(2025, 1, 3)])
+
+    def test_api_runs_offline_on_the_fixture_provider(self):
+        with open(self.path, 'w') as fixture:
+            fixture.write('{"missing": ["NOPE"]}')
+
+        with override_settings(MARKET_DATA_PROVIDER='fixture', MARKET_DATA_FIXTURE_PATH=self.path):
+            user = User.objects.create_user('frank', password='secret-pass-123')
+            portfolio = Portfolio.objects.create(name='Offline', user=user)
+            portfolio_import = PortfolioImport.objects.create(portfolio=portfolio, filename='holdings.csv')
+            upload = SimpleUploadedFile(
+                'holdings.csv', b'Symbol,Quantity,Purchase Price,Purchase Date\nAAA,1,10,2025-01-02\nNOPE,1,1,2025-01-02'
+            )
+            result = CSVPortfolioParser(upload, 'holdings.csv', portfolio_import).parse_and_validate()
+            self.assertEqual((result['valid_rows'], result['error_rows']), (1, 1))
+            create_positions_from_import(portfolio_import)
+
+            client = APIClient()
+            client.force_authenticate(user)
+            news = client.get(f'/api/portfolios/{portfolio.id}/news/').json()
+            self.assertEqual(news[0]['ticker'], 'AAA')
+            performance = client.get(f'/api/portfolios/{portfolio.id}/performance/?period=3mo').json()
+            self.assertGreater(len(performance['dates']), 50)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('hank', password='secret-pass-123')
+        self.portfolio = Portfolio.objects.create(name='Async', user=self.user)
+        for i in range(8):
+            stock = Stock.objects.create(symbol=f'N{i}', name=f'N{i}', current_price=Decimal('10'))
+            Position.objects.create(
+                portfolio=self.portfolio, stock=stock, quantity=Decimal('1'),
+                purchase_price=Decimal('5'), purchase_date=date(2025, 1, 2)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_gather_limited_bounds_concurrency(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def work(item):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            if item == 5:
+                raise ValueError('boom')
+            return item * 2
+
+        results = asyncio.run(gather_limited(work, range(12), limit=3))
+
+        self.assertEqual(running[1], 3)
+        self.assertIsInstance(results[5], ValueError)
+        self.assertEqual(results[:5], [0, 2, 4, 6, 8])
+
+    def test_gather_limited_is_not_capped_by_the_default_executor(self):
+        # More calls than the loop's default executor has threads, all in flight at once
+        barrier = threading.Barrier(40, timeout=5)
+        results = asyncio.run(gather_limited(lambda item: barrier.wait(), range(40), limit=40))
+        self.assertFalse([result for result in results if isinstance(result, Exception)])
+
+    def test_news_covers_every_holding(self):
+        article = {'content': {'title': 'Headline', 'pubDate': '2025-01-02T00:00:00Z'}}
+        provider = mock.Mock()
+        provider.get_news.side_effect = lambda symbols: {symbol: [article] for symbol in symbols}
+
+        with mock.patch('portfolios.views.get_provider', return_value=provider):
+            news = self.client.get(f'/api/portfolios/{self.portfolio.id}/news/').json()
+
+        fetched = sorted(call.args[0][0] for call in provider.get_news.call_args_list)
+        self.assertEqual(fetched, [f'N{i}' for i in range(8)])
+        self.assertEqual(len(news), 8)
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_refresh_prices_fetches_quotes_concurrently(self, ticker):
+        ticker.side_effect = lambda symbol: mock.Mock(
+            info={'symbol': symbol, 'longName': f'{symbol} Corp', 'currentPrice': 12.5},
+            recommendations=None, options=()
+        )
+
+        response = self.client.get(f'/api/portfolios/{self.portfolio.id}/refresh_prices/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['updated_stocks']), [f'N{i}' for i in range(8)])
+        self.assertEqual(Stock.objects.get(symbol='N3').current_price, Decimal('12.5'))
+
+        other = User.objects.create_user('ivan', password='secret-pass-123')
+        self.client.force_authenticate(other)
+        response = self.client.get(f'/api/portfolios/{self.portfolio.id}/refresh_prices/')
+        self.assertEqual(response.status_code, 404)
+
+
+class TradeLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('jill', password='secret-pass-123')
+        self.portfolio = Portfolio.objects.create(name='Ledger', user=self.user)
+        stock = Stock.objects.create(symbol='AAA', name='AAA', current_price=Decimal('10.1234'))
+        self.position = Position.objects.create(
+            portfolio=self.portfolio, stock=stock, quantity=Decimal('10'),
+            purchase_price=Decimal('5'), purchase_date=date(2025, 1, 2)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sell(self, quantity, sell_price=''):
+        return self.client.post('/api/portfolios/sell_position/', {
+            'position_id': self.position.id, 'quantity': quantity, 'sell_price': sell_price
+        })
+
+    def test_sells_apply_decimal_amounts_and_append_to_the_ledger(self):
+        response = self.sell('0.3333')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['position_action'], 'updated')
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.quantity, Decimal('9.6667'))
+
+        self.assertEqual(self.sell('9.6667', '2.50').data['position_action'], 'deleted')
+        self.assertFalse(Position.objects.filter(pk=self.position.pk).exists())
+
+        self.portfolio.refresh_from_db()
+        ledger = list(self.portfolio.trades.values_list('side', 'cash_amount', 'cash_balance_after'))
+        self.assertEqual(ledger, [
+            ('sell', Decimal('3.37'), Decimal('3.37')),
+            ('sell', Decimal('24.17'), Decimal('27.54')),
+        ])
+        self.assertEqual(self.portfolio.cash_balance, Decimal('27.54'))
+
+        trade = self.portfolio.trades.first()
+        trade.price = Decimal('1')
+        with self.assertRaises(ValueError):
+            trade.save()
+
+        Portfolio.objects.filter(pk=self.portfolio.pk).update(cash_balance=Decimal('0'))
+        self.assertEqual(trades.rebuild_cash([self.portfolio.pk]), 1)
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.cash_balance, Decimal('27.54'))
+
+    def test_fractional_sells_close_the_position_exactly(self):
+        Position.objects.filter(pk=self.position.pk).update(quantity=Decimal('0.3'))
+        self.assertEqual(self.sell('0.1', '10.01').data['position_action'], 'updated')
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.quantity, Decimal('0.2'))
+
+        self.assertEqual(self.sell('0.2', '10.01').data['position_action'], 'deleted')
+        self.assertFalse(Position.objects.filter(pk=self.position.pk).exists())
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.cash_balance, Decimal('3.00'))
+        self.assertEqual(
+            list(self.portfolio.trades.values_list('cash_amount', 'cash_balance_after')),
+            [(Decimal('1.00'), Decimal('1.00')), (Decimal('2.00'), Decimal('3.00'))]
+        )
+
+    def test_cash_balance_writes_are_ledger_adjustments(self):
+        response = self.client.post('/api/portfolios/', {'name': 'Funded', 'cash_balance': '100.10'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['cash_balance']), Decimal('100.10'))
+        funded = Portfolio.objects.get(pk=response.data['id'])
+
+        response = self.client.patch(f'/api/portfolios/{funded.id}/', {'cash_balance': '40.05'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['cash_balance']), Decimal('40.05'))
+        self.client.patch(f'/api/portfolios/{funded.id}/', {'name': 'Renamed', 'cash_balance': '40.05'})
+
+        self.assertEqual(
+            list(funded.trades.values_list('side', 'cash_amount', 'cash_balance_after')),
+            [('adjustment', Decimal('100.10'), Decimal('100.10')), ('adjustment', Decimal('-60.05'), Decimal('40.05'))]
+        )
+        self.assertEqual(trades.rebuild_cash([funded.pk]), 0)
+
+    def test_sells_cannot_overflow_the_cash_balance(self):
+        Portfolio.objects.filter(pk=self.portfolio.pk).update(cash_balance=trades.MAX_CASH - 1)
+        response = self.sell('1', '10')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], f'Cash balance must be at most {trades.MAX_CASH}')
+
+        response = self.client.post(f'/api/portfolios/{self.portfolio.id}/orders/', {'orders': [
+            {'side': 'sell', 'symbol': 'AAA', 'quantity': '1', 'price': '10'},
+            {'side': 'sell', 'symbol': 'AAA', 'quantity': '1', 'price': '0.5'},
+        ]}, format='json')
+        self.assertEqual((response.data['filled'], response.data['rejected']), (1, 1))
+
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.quantity, Decimal('9'))
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.cash_balance, trades.MAX_CASH - Decimal('0.5'))
+        self.assertEqual(Trade.objects.count(), 1)
+
+    def test_stale_sells_cannot_oversell(self):
+        # Both sellers read the position before either writes
+        first = Position.objects.select_related('stock').get(pk=self.position.pk)
+        second = Position.objects.select_related('stock').get(pk=self.position.pk)
+        trades.sell(first, '6', '10')
+        with self.assertRaises(trades.TradeError):
+            trades.sell(second, '6', '10')
+
+        self.assertEqual(self.sell('-1').status_code, 400)
+        self.assertEqual(self.sell('abc').status_code, 400)
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.quantity, Decimal('4'))
+        self.assertEqual(Trade.objects.count(), 1)
+
+    def test_sell_amounts_follow_the_order_field_rules(self):
+        # Would round to a zero decrement in the database yet still pay out
+        for quantity in ['0.00001', '1.00001', '100000000']:
+            with self.assertRaises(trades.TradeError):
+                trades.sell(self.position, quantity, '10')
+        with self.assertRaises(trades.TradeError):
+            trades.to_cash(trades.MAX_AMOUNT, trades.MAX_AMOUNT)
+
+        trade, _ = trades.sell(self.position, '1.50000', '10.1')
+        self.assertEqual((trade.quantity, trade.cash_amount), (Decimal('1.5000'), Decimal('15.15')))
+        self.assertEqual(Trade.objects.count(), 1)
+
+    def test_positions_added_and_edited_directly_are_in_the_ledger(self):
+        response = self.client.post(f'/api/portfolios/{self.portfolio.id}/add_position/', {
+            'stock_symbol': 'BBB', 'quantity': '4', 'purchase_price': '20', 'purchase_date': '2025-01-03'
+        })
+        self.assertEqual(response.status_code, 201)
+        position_id = response.data['id']
+        self.client.patch(f'/api/positions/{position_id}/', {'quantity': '6'})
+        self.client.patch(f'/api/positions/{position_id}/', {'purchase_price': '21'})
+        self.client.delete(f'/api/positions/{position_id}/')
+        self.sell('2', '10')
+
+        self.assertEqual(
+            list(self.portfolio.trades.values_list('side', 'symbol', 'quantity', 'cash_amount')),
+            [
+                ('buy', 'BBB', Decimal('4'), Decimal('0')),
+                ('adjustment', 'BBB', Decimal('2'), Decimal('0')),
+                ('adjustment', 'BBB', Decimal('-6'), Decimal('0')),
+                ('sell', 'AAA', Decimal('2'), Decimal('20')),
+            ]
+        )
+        # Cash still rebuilds to the balance from the ledger alone
+        self.assertEqual(trades.rebuild_cash([self.portfolio.pk]), 0)
+
+
+class OrderBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('kate', password='secret-pass-123')
+        self.portfolio = Portfolio.objects.create(name='Rebalance', user=self.user)
+        for i in range(30):
+            stock = Stock.objects.create(symbol=f'H{i}', name=f'H{i}', current_price=Decimal('20'))
+            Position.objects.create(
+                portfolio=self.portfolio, stock=stock, quantity=Decimal('10'),
+                purchase_price=Decimal('10'), purchase_date=date(2025, 1, 2)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_is_applied_in_one_request_with_per_order_results(self):
+        orders = [{'side': 'sell', 'symbol': f'h{i}', 'quantity': '10'} for i in range(30)]
+        orders += [{'side': 'buy', 'symbol': f'NEW{i}', 'quantity': '2', 'price': '5'} for i in range(30)]
+        orders += [
+            {'side': 'buy', 'symbol': 'H0', 'quantity': '1', 'price': '30', 'purchase_date': '2025-03-01'},
+            {'side': 'sell', 'symbol': 'H1', 'quantity': '1'},
+            {'side': 'hold', 'symbol': 'H2', 'quantity': '1'},
+        ]
+
+        # Query count does not depend on the number of orders
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(14):
+            response = self.client.post(
+                f'/api/portfolios/{self.portfolio.id}/orders/', {'orders': orders}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['filled'], response.data['rejected']), (61, 2))
+        results = response.data['results']
+        self.assertEqual(results[61]['errors'], {'non_field_errors': ['Cannot sell more shares than owned']})
+        self.assertIn('side', results[62]['errors'])
+
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.cash_balance, Decimal('6000.00'))
+        self.assertEqual(self.portfolio.trades.count(), 61)
+        self.assertEqual(self.portfolio.positions.count(), 31)
+        reopened = self.portfolio.positions.get(stock__symbol='H0')
+        self.assertEqual((reopened.quantity, reopened.purchase_price), (Decimal('1'), Decimal('30')))
+        self.assertEqual(reopened.purchase_date, date(2025, 3, 1))
+
+    def test_buys_past_the_quantity_limit_are_rejected(self):
+        orders = [{'side': 'buy', 'symbol': 'BIG', 'quantity': '99999999', 'price': '1'}] * 2
+        response = self.client.post(
+            f'/api/portfolios/{self.portfolio.id}/orders/', {'orders': orders}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['filled'], response.data['rejected']), (1, 1))
+        self.assertEqual(
+            response.data['results'][1]['errors'],
+            {'non_field_errors': [f'Position quantity must be at most {trades.MAX_AMOUNT}']}
+        )
+        self.assertEqual(self.portfolio.positions.get(stock__symbol='BIG').quantity, Decimal('99999999'))
+        self.assertEqual(self.portfolio.trades.count(), 1)
+
+
+@override_settings(MARKET_DATA_BREAKER_FAILURES=3, MARKET_DATA_BREAKER_COOLDOWN_SECONDS=0.2)
+class UpstreamGuardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        symbols.lru.clear()
+        self.guard = upstream.UpstreamGuard('test')
+
+    def fail(self):
+        raise ConnectionError('upstream down')
+
+    def test_circuit_opens_fails_fast_and_closes_after_a_probe(self):
+        with self.assertLogs('portfolios.upstream', 'WARNING') as logs:
+            for _ in range(3):
+                with self.assertRaises(ConnectionError):
+                    self.guard.call(self.fail)
+        self.assertIn('Opening the test circuit for 0.2s', logs.output[0])
+
+        fetch = mock.Mock(return_value='quote')
+        with self.assertRaises(upstream.CircuitOpen):
+            self.guard.call(fetch)
+        fetch.assert_not_called()
+
+        # Half-open: one probe goes through, a failed probe reopens the circuit
+        time.sleep(0.25)
+        with self.assertRaises(ConnectionError), self.assertLogs('portfolios.upstream', 'WARNING'):
+            self.guard.call(self.fail)
+        with self.assertRaises(upstream.CircuitOpen):
+            self.guard.call(fetch)
+
+        time.sleep(0.25)
+        self.assertEqual(self.guard.call(fetch), 'quote')
+        self.assertFalse(self.guard.breaker.is_open())
+        self.assertEqual(self.guard.call(fetch), 'quote')
+
+    def test_only_consecutive_outages_open_the_circuit(self):
+        other_worker = upstream.UpstreamGuard('test')
+
+        def not_found():
+            raise LookupError('no such ticker')
+
+        # Misses for unknown tickers mean the upstream answered
+        for _ in range(5):
+            with self.assertRaises(LookupError):
+                self.guard.call(not_found)
+        self.assertFalse(self.guard.breaker.is_open())
+
+        # A success anywhere resets the streak
+        for _ in range(4):
+            with self.assertRaises(ConnectionError):
+                self.guard.call(self.fail)
+            with self.assertRaises(ConnectionError):
+                self.guard.call(self.fail)
+            other_worker.call(lambda: 'quote')
+        self.assertFalse(self.guard.breaker.is_open())
+
+        http_404 = mock.Mock(response=mock.Mock(status_code=404))
+        http_503 = mock.Mock(response=mock.Mock(status_code=503))
+        self.assertFalse(upstream.is_outage(http_404))
+        self.assertTrue(upstream.is_outage(http_503))
+        self.assertTrue(upstream.is_outage(TimeoutError()))
+
+    @override_settings(MARKET_DATA_RATE_LIMIT_PER_SECOND=3, MARKET_DATA_RATE_LIMIT_MAX_WAIT_SECONDS=0)
+    def test_rate_limit_is_shared_by_all_callers(self):
+        other = upstream.UpstreamGuard('test')
+        with mock.patch('portfolios.upstream.time.time', return_value=1000.5):
+            for guard in (self.guard, other, self.guard):
+                guard.call(lambda: None)
+            with self.assertRaises(upstream.RateLimited):
+                other.call(lambda: None)
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_lookups_fall_back_to_stored_data_while_the_circuit_is_open(self, ticker):
+        ticker.side_effect = ConnectionError('upstream down')
+        Stock.objects.create(
+            symbol='AAA', name='Stored', current_price=Decimal('10'),
+            last_updated=timezone.now() - timedelta(days=1)
+        )
+        user = User.objects.create_user('lena', password='secret-pass-123')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with self.assertLogs('portfolios', 'WARNING'):
+            for symbol in ('BBB', 'CCC', 'DDD', 'EEE', 'FFF'):
+                client.post('/api/stocks/search_yahoo/', {'symbol': symbol})
+        calls = ticker.call_count
+
+        response = client.post('/api/stocks/search_yahoo/', {'symbol': 'AAA'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Stored')
+        response = client.post('/api/stocks/search_yahoo/', {'symbol': 'GGG'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(ticker.call_count, calls)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('gina', password='secret-pass-123')
+        portfolio = Portfolio.objects.create(name='Large', user=self.user)
+        stocks = Stock.objects.bulk_create([
+            Stock(symbol=f'S{i:03d}', name=f'S{i:03d}', current_price=Decimal('10')) for i in range(45)
+        ])
+        for stock in stocks:
+            Position.objects.create(
+                portfolio=portfolio, stock=stock, quantity=Decimal('2'),
+                purchase_price=Decimal('5'), purchase_date=date(2025, 1, 2)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_positions_page_by_cursor_with_sparse_fields(self):
+        url = '/api/positions/?fields=id,quantity,current_value,stock.symbol'
+        seen = []
+        while url:
+            # One query per page whatever its depth: no COUNT(*), no per-row stock lookup
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            seen += page['results']
+            url = page['next']
+
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len({row['id'] for row in seen}), 45)
+        self.assertEqual(set(seen[0]), {'id', 'quantity', 'current_value', 'stock'})
+        self.assertEqual(set(seen[0]['stock']), {'symbol'})
+        self.assertNotIn('count', page)
+
+    def test_positions_sharing_a_timestamp_are_paged_once_each(self):
+        # As when an import bulk-creates them
+        Position.objects.update(created_at=timezone.now())
+        url = '/api/positions/?page_size=7&fields=id'
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+
+        self.assertEqual(seen, sorted(Position.objects.values_list('id', flat=True), reverse=True))
+
+    def test_stocks_keep_every_field_without_the_parameter(self):
+        page = self.client.get('/api/stocks/?page_size=10').json()
+        self.assertEqual([row['symbol'] for row in page['results']], [f'S{i:03d}' for i in range(10)])
+        self.assertIn('analyst_recommendation', page['results'][0])
+
+
+class StockSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        stock_search._index = None
+        for symbol, name in [('APP', 'AppLovin Corp'), ('AAPL', 'Apple Inc.'), ('APPF', 'AppFolio Inc.'),
+                             ('PINE', 'Alpine Income Property Trust'), ('MAPP', 'Mapp Holdings')]:
+            Stock.objects.create(symbol=symbol, name=name)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('hank', password='secret-pass-123'))
+
+    def test_results_are_ranked_exact_then_prefix_then_name(self):
+        results = self.client.get('/api/stocks/?search=app').json()['results']
+        # MAPP only contains "app" mid-word, so it is not a match
+        self.assertEqual([row['symbol'] for row in results], ['APP', 'APPF', 'AAPL'])
+        results = self.client.get('/api/stocks/?search=alpine income').json()['results']
+        self.assertEqual([row['symbol'] for row in results], ['PINE'])
+        # page_size is clamped to 1..50 rather than passed through as a negative LIMIT
+        results = self.client.get('/api/stocks/?search=app&page_size=-5').json()['results']
+        self.assertEqual([row['symbol'] for row in results], ['APP'])
+
+    @override_settings(BACKGROUND_JOBS_EAGER=True)
+    def test_index_picks_up_new_and_renamed_stocks(self):
+        self.assertEqual(stock_search.search('zeta'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock = Stock.objects.create(symbol='ZT', name='ZT')
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.name = 'Zeta Global'
+            stock.save()
+        self.assertEqual([s.symbol for s in stock_search.search('zeta')], ['ZT'])
+
+        # Saves that can't rename a stock leave the index alone
+        version = cache.get(stock_search.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.save(update_fields=['current_price'])
+            stock.save()
+        self.assertEqual(cache.get(stock_search.VERSION_KEY), version)
+
+    @mock.patch('portfolios.stock_search.threading.Thread')
+    def test_searches_keep_the_old_index_while_it_is_rebuilt(self, thread):
+        self.assertEqual(stock_search.search('zeta'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(symbol='ZT', name='Zeta Global')
+
+        # No rebuild in the request, and only one in the background
+        with self.assertNumQueries(0):
+            self.assertEqual(stock_search.search('zeta'), [])
+        stock_search.search('zeta')
+        thread.assert_called_once()
+
+        thread.call_args.kwargs['target']()
+        self.assertEqual([s.symbol for s in stock_search.search('zeta')], ['ZT'])
+        thread.assert_called_once()
+
+
+@override_settings(TICKER_SNAPSHOT_TTLS={**settings.TICKER_SNAPSHOT_TTLS, 'info': 0})
+class SymbolLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        symbols.lru.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ivy', password='secret-pass-123'))
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_fresh_rows_are_served_without_going_upstream(self, ticker_class):
+        info = mock.PropertyMock(return_value={'symbol': 'AAA', 'longName': 'AAA Inc.', 'currentPrice': 12})
+        type(ticker_class.return_value).info = info
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/stocks/search_yahoo/', {'symbol': 'aaa'}).json()
+        with self.assertNumQueries(0):
+            second = self.client.post('/api/stocks/search_yahoo/', {'symbol': 'AAA'}).json()
+        self.assertEqual(first, second)
+        self.assertEqual(info.call_count, 1)
+
+        # Once the stored quote is older than the window it is fetched again
+        Stock.objects.filter(symbol='AAA').update(last_updated=timezone.now() - timedelta(hours=1))
+        symbols.lru.clear()
+        self.client.post('/api/stocks/search_yahoo/', {'symbol': 'AAA'})
+        self.assertEqual(info.call_count, 2)
+
+    @mock.patch('portfolios.market_data.yf.Ticker')
+    def test_unknown_symbols_are_negative_cached(self, ticker_class):
+        info = mock.PropertyMock(return_value={})
+        type(ticker_class.return_value).info = info
+
+        for _ in range(3):
+            response = self.client.post('/api/stocks/search_yahoo/', {'symbol': 'TYPO'})
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(info.call_count, 1)
+
+    @override_settings(SYMBOL_LRU_SIZE=1)
+    def test_lru_size_is_read_from_settings(self):
+        symbols.lru.put(Stock(symbol='AAA', name='AAA'))
+        symbols.lru.put(Stock(symbol='BBB', name='BBB'))
+        self.assertIsNone(symbols.lru.get('AAA', 60))
+        self.assertEqual(symbols.lru.get('BBB', 60).symbol, 'BBB')
+
+    def test_position_create_reuses_known_stocks(self):
+        Stock.objects.create(symbol='BBB', name='BBB')
+        self.assertEqual(symbols.get_or_create_stock('BBB').symbol, 'BBB')
+        with self.assertNumQueries(0):
+            symbols.get_or_create_stock('BBB')
@@ -0,0 +1,77 @@
+from django.conf import settings
+from .caching import CacheNamespace
+from .market_data import get_provider
+from .single_flight import SingleFlight
+
+
+snapshot_cache = CacheNamespace('ticker_snapshot')
+fetches = SingleFlight('ticker_snapshot')
+
+
+class TickerSnapshot:
+    """
+    Upstream data for one symbol, shared by the price, analyst and options code.
+
+    Each resource is fetched at most once per snapshot and memoized in the
+    cache with a per-resource TTL, so a refresh cycle that needs the quote,
+    the recommendations and the option chain of a symbol asks the market
+    data provider once for each, and not at all while the cached copies
+    are still valid.
+    """
+
+    def __init__(self, symbol, provider=None):
+        self.symbol = symbol
+        self.provider = provider or get_provider()
+        self._values = {}
+
+    def info(self):
+        return self._get('info', lambda: self._fetch(self.provider.get_quotes, [self.symbol]))
+
+    def recommendations(self):
+        return self._get(
+            'recommendations', lambda: self._fetch(self.provider.get_recommendations, [self.symbol])
+        )
+
+    def target_price(self):
+        # Cached on its own so it outlives the short-lived quote
+        return self._get('target_price', lambda: self.info().get('targetMeanPrice'))
+
+    def options(self):
+        """Available option expiration dates"""
+        return self._get('options', lambda: self._fetch(self.provider.get_option_expirations, [self.symbol]))
+
+    def option_chain(self, expiration):
+        """Calls and puts for one expiration as {'calls': DataFrame, 'puts': DataFrame}"""
+        return self._get(
+            'option_chain', lambda: self._fetch(self.provider.get_option_chains, {self.symbol: expiration}),
+            expiration
+        )
+
+    def _get(self, resource, fetch, *parts):
+        key = ':'.join([self.symbol, resource, *parts])
+        if key in self._values:
+            return self._values[key]
+
+        # Values are wrapped so a cached None is not mistaken for a miss
+        cached = snapshot_cache.get(key)
+        if cached is None:
+            def fetch_and_publish():
+                cached = (fetch(),)
+                snapshot_cache.set(key, cached, timeout=self._ttl(resource))
+                return cached
+
+            # Concurrent misses of the same key, in any worker, share one upstream call
+            cached = fetches.do(key, fetch_and_publish, lambda: snapshot_cache.get(key))
+
+        self._values[key] = cached[0]
+        return cached[0]
+
+    def _fetch(self, method, symbols):
+        results = method(symbols)
+        if self.symbol not in results:
+            raise LookupError(f'No market data for {self.symbol}')
+        return results[self.symbol]
+
+    def _ttl(self, resource):
+        # Read on use, like the portfolio cache timeouts, so overrides apply
+        return settings.TICKER_SNAPSHOT_TTLS[resource]
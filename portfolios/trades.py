@@ -0,0 +1,351 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from . import leaderboard, stock_search
+from .caching import invalidate_portfolio
+from .models import Portfolio, Position, Stock, Trade
+
+
+CENT = Decimal('0.01')
+# Quantities and prices are DecimalField(max_digits=12, decimal_places=4)
+STEP = Decimal('0.0001')
+MAX_AMOUNT = Decimal('99999999.9999')
+# Cash amounts are DecimalField(max_digits=12, decimal_places=2)
+MAX_CASH = Decimal('9999999999.99')
+
+
+class TradeError(ValueError):
+    """A trade that can't be applied; the message is meant for the client"""
+
+
+def to_decimal(value, name):
+    """Parse a user supplied amount as a finite Decimal"""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError, ValueError):
+        raise TradeError(f'Invalid {name}: {value!r}')
+    if not amount.is_finite():
+        raise TradeError(f'Invalid {name}: {value!r}')
+    return amount
+
+
+def to_amount(value, name):
+    """
+    Parse a user supplied quantity or price with OrderSerializer's rules: at
+    least 0.0001, at most 4 decimal places and within max_digits. Extra
+    places are rejected rather than rounded, so nothing rounds to zero.
+    """
+    amount = to_decimal(value, name)
+    if amount < STEP:
+        raise TradeError(f'{name.capitalize()} must be at least {STEP}')
+    if amount > MAX_AMOUNT:
+        raise TradeError(f'{name.capitalize()} must be at most {MAX_AMOUNT}')
+    if amount != amount.quantize(STEP):
+        raise TradeError(f'{name.capitalize()} can have at most 4 decimal places')
+    return amount.quantize(STEP)
+
+
+def to_cash(quantity, price):
+    """Cash value of quantity shares at price, rounded to the cent"""
+    cash_amount = (quantity * price).quantize(CENT, rounding=ROUND_HALF_UP)
+    if cash_amount > MAX_CASH:
+        raise TradeError(f'Trade value must be at most {MAX_CASH}')
+    return cash_amount
+
+
+def check_balance(balance):
+    """Return balance if cash_balance can hold it, else raise TradeError"""
+    if abs(balance) > MAX_CASH:
+        raise TradeError(f'Cash balance must be at most {MAX_CASH}')
+    return balance
+
+
+def sell(position, quantity, price=None):
+    """
+    Sell quantity shares of position at price, the stock's current price by
+    default, and record the Trade.
+
+    The portfolio and position rows are locked, in the order execute_orders
+    takes them, and the new quantity and cash balance are computed here as
+    Decimals and written back exactly: SQLite would do F() arithmetic on
+    these columns in floating point. Concurrent sells can neither lose an
+    update nor sell more than is held.
+    Returns (trade, position_closed)
+    """
+    quantity = to_amount(quantity, 'quantity')
+
+    if price in (None, ''):
+        price = position.stock.current_price
+        if not price:
+            raise TradeError('No sell price provided and no current price available')
+    price = to_amount(price, 'sell price')
+
+    cash_amount = to_cash(quantity, price)
+    now = timezone.now()
+
+    with transaction.atomic():
+        cash = _lock_cash(position.portfolio_id)
+        held = Position.objects.select_for_update().filter(pk=position.pk).values_list('quantity', flat=True).first()
+        if held is None or held < quantity:
+            raise TradeError('Cannot sell more shares than owned')
+
+        remaining = held - quantity
+        if remaining:
+            Position.objects.filter(pk=position.pk).update(quantity=remaining, updated_at=now)
+        else:
+            Position.objects.filter(pk=position.pk).delete()
+        trade = _record(
+            position.portfolio_id, cash, cash_amount, now,
+            stock=position.stock, symbol=position.stock.symbol, side='sell',
+            quantity=quantity, price=price,
+        )
+
+    return trade, not remaining
+
+
+def set_cash(portfolio_id, balance):
+    """
+    Set a portfolio's cash balance, recording the difference as a cash
+    adjustment in the ledger. Returns the Trade, or None if unchanged
+    """
+    balance = check_balance(to_decimal(balance, 'cash balance').quantize(CENT, rounding=ROUND_HALF_UP))
+
+    with transaction.atomic():
+        cash = _lock_cash(portfolio_id)
+        if balance == cash:
+            return None
+        return _record(portfolio_id, cash, balance - cash, timezone.now(), side='adjustment')
+
+
+def execute_orders(portfolio, orders):
+    """
+    Apply a batch of validated orders (see OrderSerializer) to a portfolio
+    in one transaction and return a result per order, in order.
+
+    Symbols are resolved with one query, stocks first bought here are
+    created in bulk, and the portfolio's affected positions are loaded and
+    locked once. Orders are then applied in memory, in sequence, so a batch
+    may sell what it bought earlier; an order that can't be filled is
+    rejected without affecting the others. Positions, trades and the cash
+    balance are written with bulk queries at the end.
+
+    Buys record holdings paid for outside the portfolio, as add_position
+    does: they are in the ledger with a zero cash amount and leave the cash
+    balance unchanged.
+    """
+    symbols = {order['symbol'] for order in orders}
+    bought = {order['symbol'] for order in orders if order['side'] == 'buy'}
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Holding the portfolio row serializes batches and sells on this portfolio
+        cash = _lock_cash(portfolio.pk)
+
+        stocks = Stock.objects.in_bulk(symbols, field_name='symbol')
+        missing_stocks = [Stock(symbol=symbol, name=symbol) for symbol in bought if symbol not in stocks]
+        if missing_stocks:
+            Stock.objects.bulk_create(missing_stocks, ignore_conflicts=True)
+            stocks = Stock.objects.in_bulk(symbols, field_name='symbol')
+            transaction.on_commit(stock_search.invalidate)
+
+        held = {
+            position.stock_id: position
+            for position in Position.objects.select_for_update().filter(
+                portfolio=portfolio, stock__in=list(stocks.values())
+            )
+        }
+
+        results = []
+        new_trades = []
+        touched = set()
+        for order in orders:
+            stock = stocks.get(order['symbol'])
+            quantity = order['quantity']
+            price = order.get('price') or (stock.current_price if stock else None)
+            position = held.get(stock.id) if stock else None
+
+            if order['side'] == 'sell' and (position is None or position.quantity < quantity):
+                results.append(_rejected('Cannot sell more shares than owned'))
+                continue
+            if not price:
+                results.append(_rejected('No price provided and no current price available'))
+                continue
+            try:
+                value = to_cash(quantity, price)
+                if order['side'] == 'sell':
+                    check_balance(cash + value)
+            except TradeError as e:
+                results.append(_rejected(str(e)))
+                continue
+
+            if order['side'] == 'buy':
+                purchase_date = order.get('purchase_date') or now.date()
+                if position is None or not position.quantity:
+                    # A new position, or one closed earlier in the batch, starts over
+                    lot = {'quantity': Decimal('0'), 'purchase_price': price, 'purchase_date': purchase_date}
+                else:
+                    lot = {
+                        'quantity': position.quantity,
+                        'purchase_price': position.purchase_price,
+                        'purchase_date': position.purchase_date,
+                    }
+                merge_lot(lot, quantity, price, purchase_date)
+                if lot['quantity'] > MAX_AMOUNT:
+                    results.append(_rejected(f'Position quantity must be at most {MAX_AMOUNT}'))
+                    continue
+                if position is None:
+                    position = Position(portfolio=portfolio, stock=stock)
+                    held[stock.id] = position
+                position.quantity = lot['quantity']
+                position.purchase_price = lot['purchase_price']
+                position.purchase_date = lot['purchase_date']
+                cash_amount = Decimal('0.00')
+            else:
+                position.quantity -= quantity
+                cash_amount = value
+                cash += cash_amount
+
+            position.updated_at = now
+            touched.add(stock.id)
+            new_trades.append(Trade(
+                portfolio=portfolio, stock=stock, symbol=stock.symbol, side=order['side'],
+                quantity=quantity, price=price, cash_amount=cash_amount, cash_balance_after=cash,
+            ))
+            results.append({
+                'status': 'filled',
+                'side': order['side'],
+                'symbol': stock.symbol,
+                'quantity': quantity,
+                'price': price,
+                'cash_amount': cash_amount,
+                'position_quantity': position.quantity,
+            })
+
+        changed = [held[stock_id] for stock_id in touched]
+        opened = [position for position in changed if position.pk is None and position.quantity]
+        updated = [position for position in changed if position.pk is not None and position.quantity]
+        closed = [position.pk for position in changed if position.pk is not None and not position.quantity]
+        Position.objects.bulk_create(opened)
+        Position.objects.bulk_update(updated, ['quantity', 'purchase_price', 'purchase_date', 'updated_at'])
+        if closed:
+            Position.objects.filter(pk__in=closed).delete()
+
+        if new_trades:
+            Trade.objects.bulk_create(new_trades)
+            Portfolio.objects.filter(pk=portfolio.pk).update(cash_balance=cash, updated_at=now)
+            after_bulk_write([portfolio.pk])
+
+    return results
+
+
+def after_bulk_write(portfolio_ids, holdings_changed=True):
+    """
+    Refresh what is derived from portfolios changed with bulk queries or
+    update(), which send no signals: their leaderboard entries and, when
+    their holdings changed, their cached news and performance. Runs once
+    the current transaction commits.
+    """
+    def refresh():
+        ids = set(portfolio_ids)
+        leaderboard.refresh_portfolios(ids)
+        if holdings_changed:
+            for portfolio_id in ids:
+                invalidate_portfolio(portfolio_id)
+
+    transaction.on_commit(refresh)
+
+
+def merge_lot(lot, quantity, price, purchase_date):
+    """Add shares to a lot, averaging the price and keeping the earlier date"""
+    total_quantity = lot['quantity'] + quantity
+
+    # Calculate weighted average price
+    if total_quantity > 0:
+        total_cost = (lot['quantity'] * lot['purchase_price']) + (quantity * price)
+        lot['purchase_price'] = total_cost / total_quantity
+    else:
+        lot['purchase_price'] = Decimal('0')
+
+    lot['quantity'] = total_quantity
+    if purchase_date < lot['purchase_date']:
+        lot['purchase_date'] = purchase_date
+
+
+def record_holdings(portfolio_id, changes):
+    """
+    Append zero-cash Trades for holdings that changed without moving cash:
+    buys paid for outside the portfolio and manual position edits. changes
+    are (stock, side, quantity, price) tuples. Must run inside the caller's
+    transaction, after the position changes.
+    """
+    if not changes:
+        return []
+
+    # Locked like execute_orders does, so the recorded balance is current
+    balance = _lock_cash(portfolio_id)
+    return Trade.objects.bulk_create([
+        Trade(
+            portfolio_id=portfolio_id, stock=stock, symbol=stock.symbol, side=side,
+            quantity=quantity, price=price, cash_amount=Decimal('0.00'), cash_balance_after=balance,
+        )
+        for stock, side, quantity, price in changes
+    ], batch_size=1000)
+
+
+def record_position_change(position, side, quantity):
+    """
+    Record a holding added or edited directly (add_position, the positions
+    API): a zero-cash buy, or an adjustment by the signed quantity change
+    """
+    return record_holdings(position.portfolio_id, [(position.stock, side, quantity, position.purchase_price)])
+
+
+def rebuild_cash(portfolio_ids=None):
+    """
+    Recompute cash_balance from the ledger, for the given portfolios or all.
+    Returns the number of portfolios updated
+    """
+    portfolios = Portfolio.objects.all()
+    if portfolio_ids is not None:
+        portfolios = portfolios.filter(pk__in=portfolio_ids)
+
+    totals = dict(
+        Trade.objects.filter(portfolio__in=portfolios)
+        .order_by()
+        .values_list('portfolio_id')
+        .annotate(total=Sum('cash_amount'))
+    )
+    updated = []
+    for portfolio in portfolios.only('id', 'cash_balance'):
+        balance = totals.get(portfolio.id, Decimal('0.00'))
+        if portfolio.cash_balance != balance:
+            portfolio.cash_balance = balance
+            updated.append(portfolio)
+
+    Portfolio.objects.bulk_update(updated, ['cash_balance'])
+    return len(updated)
+
+
+def _rejected(message):
+    return {'status': 'rejected', 'errors': {'non_field_errors': [message]}}
+
+
+def _lock_cash(portfolio_id):
+    """Lock the portfolio row for the caller's transaction and return its cash balance"""
+    return Portfolio.objects.select_for_update().values_list('cash_balance', flat=True).get(pk=portfolio_id)
+
+
+def _record(portfolio_id, cash, cash_amount, now, **trade_fields):
+    """
+    Apply cash_amount to cash, the balance read under _lock_cash, and append
+    the Trade. Must run inside the caller's transaction, after any position
+    changes.
+    """
+    balance = check_balance(cash + cash_amount)
+    Portfolio.objects.filter(pk=portfolio_id).update(cash_balance=balance, updated_at=now)
+    trade = Trade.objects.create(
+        portfolio_id=portfolio_id, cash_amount=cash_amount, cash_balance_after=balance, **trade_fields
+    )
+    after_bulk_write([portfolio_id])
+    return trade
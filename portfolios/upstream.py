@@ -0,0 +1,185 @@
+import logging
+import time
+from django.conf import settings
+from .caching import coordination
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """The market data upstream can't be called right now; serve stored data instead"""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class RateLimited(UpstreamUnavailable):
+    pass
+
+
+def is_outage(exc):
+    """
+    Whether exc means the upstream itself is failing: a transport error or
+    timeout (OSError, which requests' and curl_cffi's errors derive from)
+    or an HTTP 429/5xx. Anything else, such as a 404 for an unknown ticker
+    or a response that didn't parse, is a miss for that call only.
+    """
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, OSError)
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by all workers through the coordination cache: a
+    bucket of MARKET_DATA_RATE_LIMIT_PER_SECOND tokens, refilled every second.
+
+    Tokens are counted with atomic add/incr. Without Redis the bucket is per
+    process, so the limit applies to each worker separately. A caller waits
+    for the next refill at most MARKET_DATA_RATE_LIMIT_MAX_WAIT_SECONDS,
+    then gives up with RateLimited.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def acquire(self):
+        rate = getattr(settings, 'MARKET_DATA_RATE_LIMIT_PER_SECOND', 10)
+        if not rate:
+            return
+        deadline = time.monotonic() + getattr(settings, 'MARKET_DATA_RATE_LIMIT_MAX_WAIT_SECONDS', 2)
+
+        while True:
+            now = time.time()
+            window = int(now)
+            if self._take(window) <= rate:
+                return
+
+            wait = window + 1 - now
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(f'{self.name} rate limit of {rate} calls per second reached')
+            time.sleep(wait)
+
+    def _take(self, window):
+        key = f'upstream:{self.name}:tokens:{window}'
+        if coordination.add(key, 1, 2):
+            return 1
+        try:
+            return coordination.incr(key)
+        except ValueError:
+            # The window expired between add and incr
+            coordination.add(key, 1, 2)
+            return 1
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by all workers through the coordination cache
+    (per process without Redis).
+
+    After MARKET_DATA_BREAKER_FAILURES consecutive failures, across all
+    workers, the circuit opens and every call fails fast with CircuitOpen;
+    any successful call resets the streak. Once
+    MARKET_DATA_BREAKER_COOLDOWN_SECONDS have passed it is half-open: a
+    single probe call, in any worker, is let through. The circuit closes
+    if the probe succeeds and opens for another cooldown if it fails.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.open_key = f'upstream:{name}:open_until'
+        self.failures_key = f'upstream:{name}:failures'
+        self.probe_key = f'upstream:{name}:probe'
+
+    def before_call(self):
+        """
+        Raise CircuitOpen unless a call may go upstream now.
+        Returns True when the call is the half-open probe
+        """
+        open_until = coordination.get(self.open_key)
+        if open_until is None:
+            return False
+        if time.time() < open_until:
+            raise CircuitOpen(f'{self.name} circuit open, upstream calls paused')
+        if coordination.add(self.probe_key, True, self._cooldown()):
+            return True
+        raise CircuitOpen(f'{self.name} circuit half-open, waiting on a probe call')
+
+    def is_open(self):
+        """Whether calls are currently failing fast, including while a probe is out"""
+        open_until = coordination.get(self.open_key)
+        return open_until is not None and (time.time() < open_until or coordination.get(self.probe_key) is not None)
+
+    def record_success(self, probe=False):
+        if probe:
+            coordination.delete_many([self.open_key, self.failures_key, self.probe_key])
+        else:
+            # Whichever worker succeeded, the streak of failures is over
+            coordination.delete(self.failures_key)
+
+    def record_failure(self, probe=False):
+        if probe:
+            self._open()
+            return
+
+        if coordination.add(self.failures_key, 1, self._cooldown()):
+            failures = 1
+        else:
+            try:
+                failures = coordination.incr(self.failures_key)
+            except ValueError:
+                failures = 1
+        if failures >= getattr(settings, 'MARKET_DATA_BREAKER_FAILURES', 5):
+            self._open()
+
+    def release_probe(self):
+        """Let another call probe, when the probe never reached the upstream"""
+        coordination.delete(self.probe_key)
+
+    def _open(self):
+        logger.warning('Opening the %s circuit for %ss', self.name, self._cooldown())
+        coordination.set(self.open_key, time.time() + self._cooldown(), None)
+        coordination.delete_many([self.failures_key, self.probe_key])
+
+    def _cooldown(self):
+        return getattr(settings, 'MARKET_DATA_BREAKER_COOLDOWN_SECONDS', 30)
+
+
+class UpstreamGuard:
+    """Rate limiter and circuit breaker in front of one upstream"""
+
+    def __init__(self, name):
+        self.limiter = TokenBucket(name)
+        self.breaker = CircuitBreaker(name)
+
+    def call(self, fetch, is_failure=is_outage):
+        """
+        Return fetch(), or raise UpstreamUnavailable straight away while the
+        circuit is open or once the rate limit wait runs out.
+        Only exceptions is_failure accepts count toward the breaker; other
+        errors are re-raised but show the upstream answered
+        """
+        probe = self.breaker.before_call()
+        try:
+            self.limiter.acquire()
+        except RateLimited:
+            if probe:
+                self.breaker.release_probe()
+            raise
+
+        try:
+            value = fetch()
+        except Exception as e:
+            if is_failure(e):
+                self.breaker.record_failure(probe)
+            else:
+                self.breaker.record_success(probe)
+            raise
+        self.breaker.record_success(probe)
+        return value
+
+
+yahoo = UpstreamGuard('yahoo')
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PortfolioViewSet, StockViewSet, PositionViewSet, register_user, top_portfolios, portfolio_news, market_movers, portfolio_performance, refresh_stock_analysis, test_stock_options, import_portfolio_csv, confirm_csv_import, get_import_status
+from .views import PortfolioViewSet, StockViewSet, PositionViewSet, register_user, top_portfolios, portfolio_news, market_movers, portfolio_performance, refresh_stock_analysis, test_stock_options, import_portfolio_csv, confirm_csv_import, get_import_status, get_job_status, cache_statistics, refresh_prices, search_yahoo
 
 router = DefaultRouter()
 router.register(r'portfolios', PortfolioViewSet, basename='portfolio')
@@ -8,6 +8,9 @@ router.register(r'stocks', StockViewSet)
 router.register(r'positions', PositionViewSet, basename='position')
 
 urlpatterns = [
+    # Async views, ahead of the router so they take these viewset URLs
+    path('api/portfolios/<int:pk>/refresh_prices/', refresh_prices, name='portfolio-refresh-prices'),
+    path('api/stocks/search_yahoo/', search_yahoo, name='stock-search-yahoo'),
     path('api/', include(router.urls)),
     path('api/register/', register_user, name='register'),
     path('api/top-portfolios/', top_portfolios, name='top_portfolios'),
@@ -19,4 +22,6 @@ urlpatterns = [
     path('api/portfolios/<int:portfolio_id>/import-csv/', import_portfolio_csv, name='import_portfolio_csv'),
     path('api/imports/<int:import_id>/confirm/', confirm_csv_import, name='confirm_csv_import'),
     path('api/imports/<int:import_id>/status/', get_import_status, name='get_import_status'),
+    path('api/jobs/<int:job_id>/', get_job_status, name='get_job_status'),
+    path('api/admin/cache-stats/', cache_statistics, name='cache_statistics'),
 ]
\ No newline at end of file
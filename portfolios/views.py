@@ -1,21 +1,32 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.authtoken.models import Token
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Prefetch
+from django.shortcuts import aget_object_or_404
 from django.contrib.auth.models import User
-from .models import Portfolio, Stock, Position, PortfolioImport
+from .models import Portfolio, Stock, Position, PortfolioImport, BackgroundJob
 from .serializers import (
     PortfolioSerializer, PortfolioSummarySerializer,
-    StockSerializer, PositionSerializer, UserRegistrationSerializer
+    StockSerializer, PositionSerializer, UserRegistrationSerializer, OrderSerializer
 )
-import yfinance as yf
+from .pagination import PositionPagination, StockPagination
+from .quotes import QuoteEngine
+from .performance import PerformanceEngine
+from .ticker_snapshot import TickerSnapshot
+from .market_data import get_provider
+from .async_api import async_api_view, fetch_each
+from .upstream import UpstreamUnavailable
+from .caching import news_cache, performance_cache, stats as cache_stats
+from . import jobs, leaderboard, movers, price_history, stock_search, symbols, trades
 from datetime import datetime, timedelta
 from django.utils import timezone
-import requests
-from django.core.cache import cache
-import pandas as pd
+from django.conf import settings
+import os
+import tempfile
 
 
 class PortfolioViewSet(viewsets.ModelViewSet):
@@ -23,7 +34,13 @@ class PortfolioViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Portfolio.objects.filter(user=self.request.user)
+        queryset = Portfolio.objects.filter(user=self.request.user).with_totals()
+        if self.action == 'retrieve':
+            # Nested positions and their stocks come from one prefetch query
+            queryset = queryset.select_related('user').prefetch_related(
+                Prefetch('positions', queryset=Position.objects.select_related('stock'))
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -31,7 +48,24 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         return PortfolioSerializer
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        cash_balance = serializer.validated_data.pop('cash_balance', None)
+        with transaction.atomic():
+            portfolio = serializer.save(user=self.request.user)
+            self._set_cash(portfolio, cash_balance)
+
+    def perform_update(self, serializer):
+        cash_balance = serializer.validated_data.pop('cash_balance', None)
+        with transaction.atomic():
+            portfolio = serializer.save()
+            self._set_cash(portfolio, cash_balance)
+
+    def _set_cash(self, portfolio, cash_balance):
+        # Cash changes go through the ledger as adjustments, see portfolios.trades
+        if cash_balance is None:
+            return
+        trade = trades.set_cash(portfolio.pk, cash_balance)
+        if trade is not None:
+            portfolio.cash_balance = trade.cash_balance_after
 
     @action(detail=True, methods=['post'])
     def add_position(self, request, pk=None):
@@ -39,97 +73,72 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         serializer = PositionSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(portfolio=portfolio)
+            with transaction.atomic():
+                position = serializer.save(portfolio=portfolio)
+                trades.record_position_change(position, 'buy', position.quantity)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=True, methods=['get'])
-    def refresh_prices(self, request, pk=None):
+    @action(detail=True, methods=['post'])
+    def orders(self, request, pk=None):
+        """
+        Apply a batch of buy/sell orders in one transaction, with a result per order
+        """
         portfolio = self.get_object()
-        updated_stocks = []
-        
-        for position in portfolio.positions.all():
-            stock = position.stock
-            try:
-                ticker = yf.Ticker(stock.symbol)
-                info = ticker.info
-                current_price = info.get('currentPrice') or info.get('regularMarketPrice')
-                
-                if current_price:
-                    stock.current_price = current_price
-                    stock.name = info.get('longName', stock.name)
-                    stock.exchange = info.get('exchange', stock.exchange)
-                    stock.last_updated = timezone.now()
-                    
-                    # Also update analyst and options data
-                    fetch_analyst_and_options_data(stock)
-                    
-                    stock.save()
-                    updated_stocks.append(stock.symbol)
-                    
-            except Exception as e:
-                continue
+        orders = request.data.get('orders') if isinstance(request.data, dict) else request.data
         
+        if not isinstance(orders, list) or not orders:
+            return Response(
+                {'error': 'orders must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_orders = getattr(settings, 'ORDER_BATCH_MAX_SIZE', 1000)
+        if len(orders) > max_orders:
+            return Response(
+                {'error': f'At most {max_orders} orders per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Validate every order first; invalid ones are rejected individually
+        results = [None] * len(orders)
+        valid = []
+        for index, data in enumerate(orders):
+            serializer = OrderSerializer(data=data)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'status': 'rejected', 'errors': serializer.errors}
+        
+        if valid:
+            executed = trades.execute_orders(portfolio, [order for _, order in valid])
+            for (index, _), result in zip(valid, executed):
+                results[index] = result
+        
+        filled = sum(result['status'] == 'filled' for result in results)
         return Response({
-            'message': f'Updated prices for {len(updated_stocks)} stocks',
-            'updated_stocks': updated_stocks
+            'filled': filled,
+            'rejected': len(results) - filled,
+            'results': [{'index': index, **result} for index, result in enumerate(results)]
         })
 
     @action(detail=False, methods=['post'])
     def sell_position(self, request):
         position_id = request.data.get('position_id')
-        quantity_to_sell = request.data.get('quantity', 0)
-        sell_price = request.data.get('sell_price')
         
         try:
-            position = Position.objects.get(id=position_id, portfolio__user=request.user)
-            
-            if not sell_price:
-                sell_price = position.stock.current_price
-                if not sell_price:
-                    return Response(
-                        {'error': 'No sell price provided and no current price available'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            quantity_to_sell = float(quantity_to_sell)
-            sell_price = float(sell_price)
-            
-            if quantity_to_sell <= 0:
-                return Response(
-                    {'error': 'Quantity to sell must be greater than 0'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            position = Position.objects.select_related('stock').get(id=position_id, portfolio__user=request.user)
             
-            if quantity_to_sell > float(position.quantity):
-                return Response(
-                    {'error': 'Cannot sell more shares than owned'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Calculate cash from sale
-            cash_from_sale = quantity_to_sell * sell_price
-            
-            # Update portfolio cash balance
-            position.portfolio.cash_balance += cash_from_sale
-            position.portfolio.save()
-            
-            # Update or delete position
-            if quantity_to_sell == float(position.quantity):
-                # Selling all shares, delete position
-                position.delete()
-                position_action = 'deleted'
-            else:
-                # Partial sell, update quantity
-                position.quantity = float(position.quantity) - quantity_to_sell
-                position.save()
-                position_action = 'updated'
+            # Applied atomically and recorded in the trade ledger
+            trade, position_closed = trades.sell(
+                position, request.data.get('quantity', 0), request.data.get('sell_price')
+            )
             
             return Response({
-                'message': f'Successfully sold {quantity_to_sell} shares of {position.stock.symbol}',
-                'cash_from_sale': cash_from_sale,
-                'new_cash_balance': float(position.portfolio.cash_balance),
-                'position_action': position_action
+                'message': f'Successfully sold {trade.quantity} shares of {trade.symbol}',
+                'cash_from_sale': float(trade.cash_amount),
+                'new_cash_balance': float(trade.cash_balance_after),
+                'position_action': 'deleted' if position_closed else 'updated',
+                'trade_id': trade.id
             })
             
         except Position.DoesNotExist:
@@ -137,6 +146,11 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                 {'error': 'Position not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except trades.TradeError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'error': f'Failed to sell position: {str(e)}'},
@@ -148,79 +162,63 @@ class StockViewSet(viewsets.ModelViewSet):
     queryset = Stock.objects.all()
     serializer_class = StockSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StockPagination
 
     def get_queryset(self):
         queryset = Stock.objects.all()
         symbol = self.request.query_params.get('symbol', None)
-        search = self.request.query_params.get('search', None)
         
         if symbol:
             queryset = queryset.filter(symbol__iexact=symbol)
-        elif search:
-            queryset = queryset.filter(
-                Q(symbol__icontains=search) | Q(name__icontains=search)
-            )
         
         return queryset
 
-    @action(detail=False, methods=['post'])
-    def search_yahoo(self, request):
-        symbol = request.data.get('symbol', '').upper()
-        if not symbol:
-            return Response(
-                {'error': 'Symbol is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+    def list(self, request, *args, **kwargs):
+        search = request.query_params.get('search', None)
+        if not search or request.query_params.get('symbol'):
+            return super().list(request, *args, **kwargs)
         
+        # Ranked search results come from the search index as a single page
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            
-            if not info.get('symbol'):
-                return Response(
-                    {'error': 'Stock not found'}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            stock_data = {
-                'symbol': symbol,
-                'name': info.get('longName', symbol),
-                'exchange': info.get('exchange', ''),
-                'current_price': info.get('currentPrice') or info.get('regularMarketPrice'),
-            }
-            
-            stock, created = Stock.objects.get_or_create(
-                symbol=symbol,
-                defaults=stock_data
-            )
-            
-            if not created:
-                for key, value in stock_data.items():
-                    if value:
-                        setattr(stock, key, value)
-                stock.last_updated = timezone.now()
-                stock.save()
-            
-            return Response(StockSerializer(stock).data)
-            
-        except Exception as e:
-            return Response(
-                {'error': f'Failed to fetch stock data: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            limit = max(1, min(int(request.query_params.get('page_size', 20)), 50))
+        except ValueError:
+            limit = 20
+        stocks = stock_search.search(search, limit=limit)
+        return Response({
+            'next': None,
+            'previous': None,
+            'results': self.get_serializer(stocks, many=True).data
+        })
 
 
 class PositionViewSet(viewsets.ModelViewSet):
     serializer_class = PositionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PositionPagination
 
     def get_queryset(self):
-        return Position.objects.filter(portfolio__user=self.request.user)
+        return Position.objects.filter(portfolio__user=self.request.user).select_related('stock')
+
+    # Every change to a holding is recorded in the trade ledger
 
     def perform_create(self, serializer):
         portfolio_id = self.request.data.get('portfolio')
         portfolio = Portfolio.objects.get(id=portfolio_id, user=self.request.user)
-        serializer.save(portfolio=portfolio)
+        with transaction.atomic():
+            position = serializer.save(portfolio=portfolio)
+            trades.record_position_change(position, 'buy', position.quantity)
+
+    def perform_update(self, serializer):
+        previous_quantity = serializer.instance.quantity
+        with transaction.atomic():
+            position = serializer.save()
+            if position.quantity != previous_quantity:
+                trades.record_position_change(position, 'adjustment', position.quantity - previous_quantity)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            trades.record_position_change(instance, 'adjustment', -instance.quantity)
+            instance.delete()
 
 
 @api_view(['POST'])
@@ -252,41 +250,83 @@ def top_portfolios(request):
     """
     Get top 10 portfolios by total gain/loss for leaderboard
     """
-    portfolios = Portfolio.objects.select_related('user').all()
+    # Served from the materialized leaderboard, kept current by signals
+    top_10 = [
+        {
+            'id': entry.portfolio_id,
+            'name': entry.name,
+            'username': entry.username,
+            'total_gain_loss': float(entry.total_gain_loss),
+            'total_value': float(entry.total_value),
+            'total_cost': float(entry.total_cost),
+            'percentage_gain': entry.percentage_gain,
+        }
+        for entry in leaderboard.top_entries(10)
+    ]
     
-    # Calculate gains and create leaderboard data
-    leaderboard_data = []
-    for portfolio in portfolios:
-        total_gain_loss = portfolio.total_gain_loss
-        total_cost = portfolio.total_cost
-        if total_gain_loss is not None and total_cost and total_cost > 0:
-            # Calculate percentage gain
-            percentage_gain = (float(total_gain_loss) / float(total_cost)) * 100
-            leaderboard_data.append({
-                'id': portfolio.id,
-                'name': portfolio.name,
-                'username': portfolio.user.username,
-                'total_gain_loss': float(total_gain_loss),
-                'total_value': float(portfolio.total_value or 0),
-                'total_cost': float(portfolio.total_cost or 0),
-                'percentage_gain': percentage_gain,
-            })
+    return Response(top_10)
+
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def refresh_prices(request, pk):
+    """
+    Refresh quotes of every stock held in a portfolio, fetched concurrently
+    """
+    portfolio = await aget_object_or_404(Portfolio, id=pk, user=request.user)
+    stocks = [
+        stock async for stock in Stock.objects.filter(position__portfolio=portfolio).distinct()
+    ]
     
-    # Sort by percentage gain descending and take top 10
-    leaderboard_data.sort(key=lambda x: x['percentage_gain'], reverse=True)
-    top_10 = leaderboard_data[:10]
+    engine = QuoteEngine(enrich=fetch_analyst_and_options_data)
+    result = await engine.arefresh(stocks)
     
-    return Response(top_10)
+    return Response({
+        'message': f'Updated prices for {len(result.updated)} stocks',
+        **result.as_dict()
+    })
 
 
-@api_view(['GET'])
+@async_api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def portfolio_news(request, portfolio_id):
+async def search_yahoo(request):
+    symbol = request.data.get('symbol', '').upper()
+    if not symbol:
+        return Response(
+            {'error': 'Symbol is required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        # Served locally while the stored quote is fresh, unknown symbols are remembered
+        stock = await sync_to_async(symbols.lookup)(symbol)
+        return Response(StockSerializer(stock).data)
+        
+    except symbols.SymbolNotFound:
+        return Response(
+            {'error': 'Stock not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except UpstreamUnavailable:
+        return Response(
+            {'error': 'Market data is temporarily unavailable, try again shortly'}, 
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to fetch stock data: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def portfolio_news(request, portfolio_id):
     """
     Get financial news for tickers in a specific portfolio
     """
     try:
-        portfolio = Portfolio.objects.get(id=portfolio_id, user=request.user)
+        portfolio = await Portfolio.objects.aget(id=portfolio_id, user=request.user)
     except Portfolio.DoesNotExist:
         return Response(
             {'error': 'Portfolio not found'}, 
@@ -294,26 +334,25 @@ def portfolio_news(request, portfolio_id):
         )
     
     # Get unique tickers from portfolio positions
-    tickers = list(portfolio.positions.values_list('stock__symbol', flat=True).distinct())
+    tickers = [
+        ticker async for ticker in portfolio.positions.values_list('stock__symbol', flat=True).distinct()
+    ]
     
     if not tickers:
         return Response([])
     
-    # Cache key for this portfolio's news
-    cache_key = f'portfolio_news_{portfolio_id}'
-    cached_news = cache.get(cache_key)
+    # Cached per portfolio, dropped whenever its positions change
+    cached_news = await sync_to_async(news_cache.get)('news', scope=portfolio_id)
     
     if cached_news:
         return Response(cached_news)
     
     all_news = []
     
-    # Get news for each ticker using yfinance
-    for ticker in tickers[:5]:  # Limit to first 5 tickers to avoid rate limits
+    # Get news for every ticker, fetched concurrently under MARKET_DATA_CONCURRENCY
+    news_by_ticker = await fetch_each(get_provider().get_news, tickers)
+    for ticker, news in news_by_ticker.items():
         try:
-            stock = yf.Ticker(ticker)
-            news = stock.news
-            
             for article in news[:3]:  # Get top 3 articles per ticker
                 content = article.get('content', {})
                 thumbnail = content.get('thumbnail', {})
@@ -325,7 +364,6 @@ def portfolio_news(request, portfolio_id):
                 published_timestamp = 0
                 if pub_date:
                     try:
-                        from datetime import datetime
                         dt = datetime.fromisoformat(pub_date.replace('Z', '+00:00'))
                         published_timestamp = int(dt.timestamp())
                     except:
@@ -349,90 +387,31 @@ def portfolio_news(request, portfolio_id):
     # Take top 10 most recent articles
     recent_news = all_news[:10]
     
-    # Cache for 30 minutes
-    cache.set(cache_key, recent_news, 1800)
+    # An empty result while the upstream is failing isn't worth keeping
+    if news_by_ticker:
+        await sync_to_async(news_cache.set)('news', recent_news, scope=portfolio_id)
     
     return Response(recent_news)
 
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @permission_classes([AllowAny])
-def market_movers(request):
+async def market_movers(request):
     """
     Get top 10 stock gainers and losers from popular stocks
     """
-    # Cache key for market movers
-    cache_key = 'market_movers_data'
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        return Response(cached_data)
-    
-    # Popular stocks to check for movers (mix of large cap stocks)
-    popular_tickers = [
-        'AAPL', 'GOOGL', 'MSFT', 'TSLA', 'AMZN', 'NVDA', 'META', 'JPM', 'JNJ', 'V',
-        'WMT', 'PG', 'UNH', 'DIS', 'HD', 'PYPL', 'ADBE', 'NFLX', 'CRM', 'INTC',
-        'AMD', 'CSCO', 'PFE', 'KO', 'PEP', 'TMO', 'ABBV', 'ACN', 'NKE', 'MRK',
-        'LLY', 'AVGO', 'TXN', 'QCOM', 'COST', 'HON', 'UPS', 'IBM', 'GS', 'BA',
-        'PLTR'
-    ]
-    
-    movers_data = []
-    
-    for ticker in popular_tickers:
-        try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-            hist = stock.history(period='2d')
-            
-            if len(hist) >= 2:
-                current_price = float(hist['Close'].iloc[-1])
-                prev_price = float(hist['Close'].iloc[-2])
-                change = current_price - prev_price
-                change_pct = (change / prev_price) * 100
-                
-                movers_data.append({
-                    'symbol': ticker,
-                    'name': info.get('longName', ticker),
-                    'price': current_price,
-                    'change': change,
-                    'change_percent': change_pct,
-                    'volume': int(hist['Volume'].iloc[-1]) if 'Volume' in hist.columns else 0,
-                    'market_cap': info.get('marketCap', 0),
-                })
-        except Exception as e:
-            continue
-    
-    # Get top 10 gainers - filter positive gains and sort by highest first
-    all_gainers = [stock for stock in movers_data if stock['change_percent'] > 0]
-    all_gainers.sort(key=lambda x: x['change_percent'], reverse=True)  # Sort descending (highest first)
-    gainers = all_gainers[:10]
-    
-    # Get top 10 losers - filter negative gains and sort by most negative first
-    all_losers = [stock for stock in movers_data if stock['change_percent'] < 0]
-    all_losers.sort(key=lambda x: x['change_percent'])  # Sort ascending (most negative first)
-    losers = all_losers[:10]
-    
-    result = {
-        'gainers': gainers,
-        'losers': losers,
-        'last_updated': timezone.now().isoformat()
-    }
-    
-    # Cache for 15 minutes
-    cache.set(cache_key, result, 900)
-    
-    return Response(result)
+    # Stale snapshots are served while a single background refresh runs
+    return Response(await movers.aget_snapshot())
 
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def portfolio_performance(request, portfolio_id):
+async def portfolio_performance(request, portfolio_id):
     """
     Get historical performance data for a portfolio using Yahoo Finance data
     """
     try:
-        portfolio = Portfolio.objects.get(id=portfolio_id, user=request.user)
+        portfolio = await Portfolio.objects.filter(user=request.user).with_totals().aget(id=portfolio_id)
     except Portfolio.DoesNotExist:
         return Response(
             {'error': 'Portfolio not found'}, 
@@ -442,112 +421,38 @@ def portfolio_performance(request, portfolio_id):
     # Get time period from query params (default to 1 month)
     period = request.GET.get('period', '1mo')  # 1mo, 3mo, 6mo, 1y, 2y, 5y
     
-    # Cache key for this portfolio's performance data
-    cache_key = f'portfolio_performance_{portfolio_id}_{period}'
-    cached_data = cache.get(cache_key)
+    # Cached per portfolio, period and day; dropped whenever the positions change
+    cache_key = f'{period}:{timezone.now().date().isoformat()}'
+    cached_data = await sync_to_async(performance_cache.get)(cache_key, scope=portfolio_id)
     
     if cached_data:
         return Response(cached_data)
     
-    # Get unique tickers from portfolio positions
-    positions = portfolio.positions.all()
-    if not positions:
+    holdings = [
+        (symbol, quantity)
+        async for symbol, quantity in portfolio.positions.values_list('stock__symbol', 'quantity')
+    ]
+    if not holdings:
         return Response({'dates': [], 'values': [], 'initial_value': 0})
     
     try:
-        # Calculate portfolio value over time
-        portfolio_history = []
-        
-        # Get the earliest position date or use a default lookback
-        from datetime import datetime, timedelta
-        
         # Map period to days for consistent lookback
         period_days = {
             '1mo': 30, '3mo': 90, '6mo': 180, 
             '1y': 365, '2y': 730, '5y': 1825
         }
-        days_back = period_days.get(period, 30)
-        
-        # Get historical data for all stocks in portfolio
-        tickers = [pos.stock.symbol for pos in positions]
-        
-        # Create a master date range
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_back)
-        
-        # Get historical data for the longest-held position to establish date range
-        sample_ticker = tickers[0]
-        sample_stock = yf.Ticker(sample_ticker)
-        sample_hist = sample_stock.history(period=period)
+        start_date = timezone.now().date() - timedelta(days=period_days.get(period, 30))
         
-        if sample_hist.empty:
-            return Response({'dates': [], 'values': [], 'initial_value': 0})
-        
-        # Use the actual dates from Yahoo Finance
-        dates = sample_hist.index.tolist()
-        
-        # Calculate portfolio value for each date
-        portfolio_values = []
-        
-        for date in dates:
-            total_value = 0
-            valid_data = True
-            
-            for position in positions:
-                ticker = position.stock.symbol
-                quantity = float(position.quantity)
-                
-                try:
-                    stock = yf.Ticker(ticker)
-                    hist = stock.history(period=period)
-                    
-                    if date in hist.index:
-                        price_on_date = float(hist.loc[date]['Close'])
-                        total_value += price_on_date * quantity
-                    else:
-                        # If no data for this date, use the closest available price
-                        available_dates = hist.index[hist.index <= date]
-                        if len(available_dates) > 0:
-                            closest_date = available_dates[-1]
-                            price_on_date = float(hist.loc[closest_date]['Close'])
-                            total_value += price_on_date * quantity
-                        else:
-                            valid_data = False
-                            break
-                except Exception as e:
-                    valid_data = False
-                    break
-            
-            if valid_data:
-                portfolio_values.append(total_value)
-            else:
-                # Use previous value or current portfolio value as fallback
-                if portfolio_values:
-                    portfolio_values.append(portfolio_values[-1])
-                else:
-                    portfolio_values.append(float(portfolio.total_value or 0))
-        
-        # Format dates for frontend
-        formatted_dates = [date.strftime('%Y-%m-%d') for date in dates]
-        
-        # Calculate initial value and performance metrics
-        initial_value = portfolio_values[0] if portfolio_values else 0
-        current_value = portfolio_values[-1] if portfolio_values else 0
-        total_return = current_value - initial_value
-        total_return_pct = (total_return / initial_value * 100) if initial_value > 0 else 0
-        
-        result = {
-            'dates': formatted_dates,
-            'values': portfolio_values,
-            'initial_value': initial_value,
-            'current_value': current_value,
-            'total_return': total_return,
-            'total_return_percent': total_return_pct,
-            'period': period
-        }
+        # History is read from the local price store (missing bars come in one
+        # batched download) and valued as a price matrix
+        histories = await sync_to_async(price_history.get_history)(
+            [symbol for symbol, _ in holdings], start_date
+        )
+        engine = PerformanceEngine(lambda symbol, period: histories[symbol])
+        result = engine.compute(holdings, period, fallback_value=portfolio.total_value or 0)
         
-        # Cache for 1 hour
-        cache.set(cache_key, result, 3600)
+        if result['dates']:
+            await sync_to_async(performance_cache.set)(cache_key, result, scope=portfolio_id)
         
         return Response(result)
         
@@ -558,16 +463,24 @@ def portfolio_performance(request, portfolio_id):
         )
 
 
-def fetch_analyst_and_options_data(stock):
+# Stock fields set by fetch_analyst_and_options_data
+ANALYSIS_UPDATE_FIELDS = [
+    'analyst_recommendation', 'analyst_target_price', 'analyst_count',
+    'put_call_ratio', 'options_last_updated',
+]
+
+
+def fetch_analyst_and_options_data(stock, snapshot=None):
     """
-    Fetch analyst consensus and options data for a stock using yfinance
+    Fetch analyst consensus and options data for a stock using yfinance.
+    Upstream resources come from a TickerSnapshot, shared with the quote refresh
     """
     try:
-        ticker = yf.Ticker(stock.symbol)
+        snapshot = snapshot or TickerSnapshot(stock.symbol)
         
         # Get analyst recommendations
         try:
-            recommendations = ticker.recommendations
+            recommendations = snapshot.recommendations()
             if recommendations is not None and not recommendations.empty:
                 # Get the most recent recommendation
                 latest_rec = recommendations.iloc[-1]
@@ -597,8 +510,7 @@ def fetch_analyst_and_options_data(stock):
         
         # Get analyst target price
         try:
-            info = ticker.info
-            target_price = info.get('targetMeanPrice')
+            target_price = snapshot.target_price()
             if target_price:
                 stock.analyst_target_price = float(target_price)
         except Exception as e:
@@ -607,16 +519,16 @@ def fetch_analyst_and_options_data(stock):
         # Get options data for put/call ratio
         try:
             # Get options chain
-            options_dates = ticker.options
+            options_dates = snapshot.options()
             
             if options_dates and len(options_dates) > 0:
                 # Use the nearest expiration date
                 nearest_date = options_dates[0]
-                options_chain = ticker.option_chain(nearest_date)
+                options_chain = snapshot.option_chain(nearest_date)
                 
-                if options_chain.calls is not None and options_chain.puts is not None:
-                    calls_df = options_chain.calls
-                    puts_df = options_chain.puts
+                if options_chain['calls'] is not None and options_chain['puts'] is not None:
+                    calls_df = options_chain['calls']
+                    puts_df = options_chain['puts']
                     
                     # Calculate volume-based put/call ratio
                     calls_volume = 0
@@ -653,33 +565,16 @@ def fetch_analyst_and_options_data(stock):
 @permission_classes([IsAuthenticated])
 def refresh_stock_analysis(request):
     """
-    Refresh analyst consensus and options data for stocks in user's portfolios
+    Refresh analyst consensus and options data for stocks in user's portfolios.
+    Runs as a background job, poll get_job_status for progress and results.
     """
     try:
-        # Get all unique stocks from user's portfolios
-        user_portfolios = Portfolio.objects.filter(user=request.user)
-        stock_ids = set()
-        
-        for portfolio in user_portfolios:
-            for position in portfolio.positions.all():
-                stock_ids.add(position.stock.id)
-        
-        stocks = Stock.objects.filter(id__in=stock_ids)
-        updated_stocks = []
-        failed_stocks = []
-        
-        for stock in stocks:
-            if fetch_analyst_and_options_data(stock):
-                stock.save()
-                updated_stocks.append(stock.symbol)
-            else:
-                failed_stocks.append(stock.symbol)
+        job = jobs.start_stock_analysis_refresh(request.user)
         
         return Response({
-            'message': f'Updated analysis data for {len(updated_stocks)} stocks',
-            'updated_stocks': updated_stocks,
-            'failed_stocks': failed_stocks
-        })
+            'job_id': job.id,
+            'status': job.status
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         return Response(
@@ -688,6 +583,36 @@ def refresh_stock_analysis(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_job_status(request, job_id):
+    """
+    Get background job progress and, once finished, its result
+    """
+    try:
+        job = BackgroundJob.objects.get(id=job_id, user=request.user)
+    except BackgroundJob.DoesNotExist:
+        return Response(
+            {'error': 'Job not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    # A job whose worker went away is reported failed instead of running forever
+    jobs.fail_if_stale(job)
+    
+    return Response({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at,
+        'updated_at': job.updated_at
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def test_stock_options(request):
@@ -707,7 +632,7 @@ def test_stock_options(request):
         
         # Fetch options data
         success = fetch_analyst_and_options_data(stock)
-        stock.save()
+        stock.save(update_fields=ANALYSIS_UPDATE_FIELDS)
         
         if success:
             return Response({
@@ -730,7 +655,7 @@ def test_stock_options(request):
 def import_portfolio_csv(request, portfolio_id):
     """
     Import CSV file into existing portfolio
-    Step 1: Parse and validate CSV, return preview
+    Step 1: Queue parsing and validation, poll get_import_status for the preview
     """
     try:
         portfolio = Portfolio.objects.get(id=portfolio_id, user=request.user)
@@ -763,38 +688,28 @@ def import_portfolio_csv(request, portfolio_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Read file content
-        csv_content = csv_file.read().decode('utf-8')
-        
-        # Create import record
-        portfolio_import = PortfolioImport.objects.create(
-            portfolio=portfolio,
-            filename=csv_file.name,
-            status='parsing'
-        )
+        # Keep the upload on disk so parsing can continue after the response
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as upload:
+            for chunk in csv_file.chunks():
+                upload.write(chunk)
         
-        # Parse and validate CSV
-        from .csv_parser import CSVPortfolioParser
-        parser = CSVPortfolioParser(csv_content, csv_file.name, portfolio_import)
-        result = parser.parse_and_validate()
+        # run_csv_import removes the file; until it is queued, it's ours to remove
+        try:
+            with transaction.atomic():
+                portfolio_import = PortfolioImport.objects.create(
+                    portfolio=portfolio,
+                    filename=csv_file.name,
+                    status='parsing'
+                )
+                jobs.submit(jobs.run_csv_import, portfolio_import.id, upload.name, csv_file.name)
+        except Exception:
+            os.remove(upload.name)
+            raise
         
-        if result['success']:
-            return Response({
-                'import_id': portfolio_import.id,
-                'preview': {
-                    'total_rows': result['total_rows'],
-                    'valid_rows': result['valid_rows'],
-                    'error_rows': result['error_rows'],
-                    'sample_data': result['data'][:10],  # First 10 rows for preview
-                    'column_mapping': result['column_mapping'],
-                    'errors': result['errors']
-                }
-            })
-        else:
-            return Response(
-                {'error': result['error']}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        return Response({
+            'import_id': portfolio_import.id,
+            'status': portfolio_import.status
+        }, status=status.HTTP_202_ACCEPTED)
             
     except Exception as e:
         return Response(
@@ -826,8 +741,8 @@ def confirm_csv_import(request, import_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    from .csv_parser import ImportNotInPreview, create_positions_from_import
     try:
-        from .csv_parser import create_positions_from_import
         result = create_positions_from_import(portfolio_import)
         
         return Response({
@@ -837,6 +752,12 @@ def confirm_csv_import(request, import_id):
             'import_id': import_id
         })
         
+    except ImportNotInPreview as e:
+        # A concurrent confirm got there first
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         return Response(
             {'error': f'Failed to create positions: {str(e)}'}, 
@@ -848,27 +769,58 @@ def confirm_csv_import(request, import_id):
 @permission_classes([IsAuthenticated])
 def get_import_status(request, import_id):
     """
-    Get import status and details
+    Get import progress and details, including the preview once parsing is done
     """
     try:
         portfolio_import = PortfolioImport.objects.get(
             id=import_id,
             portfolio__user=request.user
         )
+        jobs.fail_if_stale(portfolio_import)
         
-        return Response({
+        data = {
             'id': portfolio_import.id,
             'filename': portfolio_import.filename,
             'status': portfolio_import.status,
+            'processed_rows': portfolio_import.processed_rows,
             'total_rows': portfolio_import.total_rows,
             'successful_imports': portfolio_import.successful_imports,
             'failed_imports': portfolio_import.failed_imports,
             'import_date': portfolio_import.import_date,
             'errors': portfolio_import.error_log or []
-        })
+        }
+        
+        if portfolio_import.status == 'preview':
+            preview_data = portfolio_import.preview_data or {}
+            data['preview'] = {
+                'total_rows': portfolio_import.total_rows,
+                'valid_rows': portfolio_import.successful_imports,
+                'error_rows': portfolio_import.failed_imports,
+                'sample_data': [row.data for row in portfolio_import.rows.all()[:10]],  # First 10 rows for preview
+                'column_mapping': preview_data.get('column_mapping', {}),
+                'errors': portfolio_import.error_log or []
+            }
+        
+        return Response(data)
         
     except PortfolioImport.DoesNotExist:
         return Response(
             {'error': 'Import not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def cache_statistics(request):
+    """
+    Cache hit/miss/latency counters per key family, DELETE resets them
+    """
+    if request.method == 'DELETE':
+        cache_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    return Response({
+        'backend': settings.CACHES['default']['BACKEND'],
+        'families': cache_stats.snapshot()
+    })